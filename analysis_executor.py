@@ -0,0 +1,288 @@
+"""Process-pool execution of per-chain structure analyses with progress tracking."""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from structure import Structure
+from structure_analysis import (PROBE_RADIUS, RESIDUE_COLUMNS, WATER_NAMES, residue_layout,
+                                residue_table, vdw_radii)
+from shared_structures import StructureHandle, StructureLease, get_store
+from structure_cache import get_cache
+
+MAX_WORKERS_ENV = 'ANALYSIS_MAX_WORKERS'
+
+# Structures up to this many atoms are analyzed inline: shipping them to a
+# worker process costs more than the analysis itself
+INLINE_MAX_ATOMS = 20000
+
+# Seconds a job that failed in its own right is kept, so reruns show its
+# error instead of resubmitting; broken pools and cancellations are not kept
+FAILURE_TTL = 300.0
+
+# Artifact under which the finished table is cached (shared with residue_table)
+TABLE_ARTIFACT = ('analysis', 'residue_table')
+
+def _chain_sizes(structure: Structure) -> List[Tuple[bytes, int]]:
+    """Polymer chains and their residue counts, in residue table order."""
+    layout = residue_layout(structure)
+    counts = np.bincount(layout.chain_id.codes, minlength=len(layout.chain_id.categories))
+    return [(bytes(layout.chain_id.categories[code]), int(counts[code]))
+            for code in pd.unique(layout.chain_id.codes)]
+
+def _chain_input(structure: Structure, chain_id: bytes) -> Tuple[Structure, Tuple[np.ndarray, np.ndarray]]:
+    """One chain of a structure and its SASA environment.
+
+    Only atoms within two expanded radii of the chain's bounding box can
+    occlude its surface, so the environment is limited to those.
+    """
+    solute = ~structure.res_name.isin(WATER_NAMES)
+    radii = vdw_radii(structure.element)
+    margin = 2 * (radii.max(initial=0.0) + PROBE_RADIUS)
+    in_chain = structure.chain_mask(chain_id)
+    chain = structure.chain(chain_id)
+    # Worker results are cached as a whole table, not per chain
+    chain.content_hash = None
+    low = chain.coords.min(axis=0) - margin
+    high = chain.coords.max(axis=0) + margin
+    nearby = (~in_chain & solute
+              & np.all((structure.coords >= low) & (structure.coords <= high), axis=1))
+    return chain, (structure.coords[nearby], radii[nearby])
+
+def _analyze_chain(handle: StructureHandle, chain_id: bytes) -> pd.DataFrame:
+    """Worker entry point: map the shared structure and analyze one chain."""
+    chain, environment = _chain_input(handle.open(), chain_id)
+    return residue_table(chain, environment)
+
+class AnalysisJob:
+    """Per-chain analysis of one structure, shared by every session viewing it.
+
+    Until all chains are done, :meth:`table` returns the basic residue table
+    with the rows of finished chains filled in, so results stream into the
+    session as they arrive.
+    """
+
+    def __init__(self, structure: Structure, table: Optional[pd.DataFrame] = None):
+        self.key = structure.content_hash
+        self.structure: Optional[Structure] = structure
+        self.chain_ids: List[bytes] = []
+        self.chain_sizes: Dict[bytes, int] = {}
+        self.futures: Dict[bytes, Future] = {}
+        self.lease: Optional[StructureLease] = None
+        self.error: Optional[BaseException] = None
+        self.failed_at: Optional[float] = None
+        self._tables: Dict[bytes, pd.DataFrame] = {}
+        self._table = table
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self._table is not None or self.error is not None
+
+    @property
+    def progress(self) -> float:
+        """Fraction of residues analyzed so far."""
+        if self._table is not None:
+            return 1.0
+        total = sum(self.chain_sizes.values())
+        with self._lock:
+            finished = sum(self.chain_sizes[chain_id] for chain_id in self._tables)
+        return finished / total if total else 0.0
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return f'Analysis failed: {self.error}'
+        if self._table is not None:
+            return 'Analysis complete'
+        return f'Analyzing structure: {len(self._tables)} of {len(self.chain_ids)} chains'
+
+    def table(self) -> pd.DataFrame:
+        """The full residue table, or the partial one while chains are running."""
+        # Read before the error: a failing job drops its structure
+        structure = self.structure
+        if self.error is not None:
+            raise self.error
+        if self._table is not None:
+            return self._table
+        basic = structure.residue_table().reindex(columns=list(RESIDUE_COLUMNS))
+        with self._lock:
+            tables = dict(self._tables)
+        if not tables:
+            return basic
+        parts = []
+        offset = 0
+        for chain_id in self.chain_ids:
+            size = self.chain_sizes[chain_id]
+            parts.append(tables.get(chain_id, basic.iloc[offset:offset + size]))
+            offset += size
+        return pd.concat(parts, ignore_index=True)
+
+    def _chain_done(self, chain_id: bytes, future: Future) -> None:
+        # A chain cancelled by a pool shutdown fails the job too
+        error = CancelledError() if future.cancelled() else future.exception()
+        with self._lock:
+            if self.error is not None:
+                # Already failed and cleaned up
+                return
+            if error is not None:
+                self.error = error
+                self.failed_at = time.monotonic()
+                # A failed job may be kept a while; its structure need not be
+                self.structure = None
+                table = None
+            else:
+                self._tables[chain_id] = future.result()
+                if len(self._tables) < len(self.chain_ids):
+                    return
+                table = pd.concat([self._tables[c] for c in self.chain_ids], ignore_index=True)
+        if error is not None and not isinstance(error, BrokenProcessPool):
+            # The job has failed; don't keep workers busy with its other chains.
+            # (A broken pool fails them itself, and cancelling them meanwhile
+            # would race with it.)
+            for other in self.futures.values():
+                other.cancel()
+        if self.lease is not None:
+            self.lease.release()
+        if table is not None:
+            get_cache().put(self.key, TABLE_ARTIFACT, table)
+            self._table = table
+
+class AnalysisExecutor:
+    """Bounded process pool running per-chain analysis jobs.
+
+    Jobs are keyed by structure content, so sessions opening the same upload
+    attach to the running job instead of starting another one.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned workers avoid forking the server's threads
+            self._pool = ProcessPoolExecutor(self.max_workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Drop a pool whose worker died, so the next submit starts a new one.
+
+        Call with the lock held.
+        """
+        if self._pool is pool:
+            # Its pending futures fail with BrokenProcessPool on their own
+            pool.shutdown(wait=False)
+            self._pool = None
+
+    def _submit(self, fn: Callable[..., Any], *args: Any) -> Tuple[ProcessPoolExecutor, Future]:
+        """Submit to the pool, replacing it once if it is broken. Call with the lock held."""
+        pool = self._get_pool()
+        try:
+            with self._worker_main():
+                return pool, pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            pool = self._get_pool()
+            with self._worker_main():
+                return pool, pool.submit(fn, *args)
+
+    @contextmanager
+    def _worker_main(self) -> Iterator[None]:
+        """Point ``__main__`` at this module while worker processes start.
+
+        Spawned workers re-import the parent's ``__main__``, which under
+        Streamlit is the app script; importing this module instead is cheap
+        and has no side effects.
+        """
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = sys.modules[__name__]
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+    def submit_task(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Run a module-level function in the pool (used by batch jobs)."""
+        with self._lock:
+            pool, future = self._submit(fn, *args)
+        future.add_done_callback(lambda f: self._task_done(pool, f))
+        return future
+
+    def _task_done(self, pool: ProcessPoolExecutor, future: Future) -> None:
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            with self._lock:
+                self._reset_pool(pool)
+
+    def submit(self, structure: Structure) -> AnalysisJob:
+        """Return the analysis job for a structure, starting it if needed."""
+        cached = get_cache().get(structure.content_hash, TABLE_ARTIFACT)
+        if cached is not None:
+            return AnalysisJob(structure, cached)
+        if structure.n_atoms <= INLINE_MAX_ATOMS:
+            return AnalysisJob(structure, residue_table(structure))
+
+        with self._lock:
+            job = self._jobs.get(structure.content_hash)
+            if job is not None and (job.error is None
+                                    or time.monotonic() - job.failed_at < FAILURE_TTL):
+                return job
+            job = AnalysisJob(structure)
+            sizes = _chain_sizes(structure)
+            job.chain_ids = [chain_id for chain_id, _ in sizes]
+            job.chain_sizes = dict(sizes)
+            # Workers map the shared copy instead of receiving pickled chains
+            job.lease = get_store().acquire(structure)
+            self._jobs[structure.content_hash] = job
+            # Workers are started on demand by submit
+            pools = {}
+            for chain_id in job.chain_ids:
+                pools[chain_id], job.futures[chain_id] = self._submit(
+                    _analyze_chain, job.lease.handle, chain_id)
+        for chain_id, future in job.futures.items():
+            future.add_done_callback(lambda f, chain_id=chain_id: self._chain_done(
+                job, chain_id, pools[chain_id], f))
+        return job
+
+    def _chain_done(self, job: AnalysisJob, chain_id: bytes, pool: ProcessPoolExecutor,
+                    future: Future) -> None:
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            # A worker died (e.g. out of memory); later jobs get a fresh pool
+            with self._lock:
+                self._reset_pool(pool)
+        job._chain_done(chain_id, future)
+        # Finished tables are served from the cache from now on, and a job
+        # failed by a dead worker or a shutdown is retried on the next submit
+        if job._table is not None or isinstance(job.error, (BrokenProcessPool, CancelledError)):
+            with self._lock:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            self._jobs.clear()
+
+_executor: Optional[AnalysisExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> AnalysisExecutor:
+    """Return the process-wide analysis executor shared by all sessions."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = int(os.environ.get(MAX_WORKERS_ENV, 0)) or None
+                _executor = AnalysisExecutor(max_workers)
+    return _executor
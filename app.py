@@ -1,5 +1,14 @@
+import os
+from typing import TYPE_CHECKING, Callable
 import streamlit as st
 from ui_loader import UILoader
+from structure_cache import METRICS_PATH_ENV, get_cache
+
+# The structure pipeline (numpy, pandas and the analysis modules) is
+# imported by the handlers below on the first upload, batch or query, so
+# a page without any starts without it
+if TYPE_CHECKING:
+    from structure import Structure
 
 # Must be the first Streamlit command
 st.set_page_config(layout="wide")
@@ -14,36 +23,177 @@ def init_session_state():
     if 'current_filters' not in st.session_state:
         st.session_state.current_filters = {}
 
+# Session entries derived from the uploaded structure
+STRUCTURE_KEYS = ('structure', 'structure_hash', 'protein_data',
+                  'filter_engine', 'analysis_job',
+                  'trajectory', 'trajectory_analysis', 'trajectory_job')
+
+def clear_structure():
+    for key in STRUCTURE_KEYS:
+        st.session_state.pop(key, None)
+
+def on_file_upload():
+    """Start processing a new upload in the background"""
+    upload = st.session_state.get('file_uploader')
+    job = st.session_state.get('upload')
+    if upload is None or (job is not None and job.key == upload.file_id):
+        return
+    from upload_pipeline import start_upload
+    st.session_state.upload = start_upload(upload)
+
+def load_uploaded_structure():
+    """Attach the parsed upload and its derived tables to the session"""
+    upload = st.session_state.get('file_uploader')
+    if upload is None:
+        st.session_state.pop('upload', None)
+        st.session_state.pop('upload_job', None)
+        clear_structure()
+        return
+    
+    # The upload is hashed and parsed in a background thread; until it is
+    # done the progress bar polls it and the placeholders show its stages.
+    # Tables attach as soon as the coordinates are parsed
+    if st.session_state.get('upload') is None or st.session_state.upload.key != upload.file_id:
+        on_file_upload()
+    job = st.session_state.upload
+    if job.done:
+        st.session_state.pop('upload_job', None)
+    else:
+        st.session_state.upload_job = job
+    if job.error is not None:
+        st.sidebar.error(job.status)
+    if job.structure is None:
+        # The previous upload's data is not shown in the meantime
+        clear_structure()
+        return
+    attach_structure(job.digest, lambda: job.structure)
+    attach_trajectory(job.digest, job.multiple_models, job.key)
+
+def attach_structure(digest: str, parse: Callable[[], 'Structure']):
+    """Attach a structure and its derived tables to the session"""
+    from analysis_executor import get_executor
+    from filter_engine import FilterEngine
+    from structure_analysis import RESIDUE_COLUMNS
+    from upload_pipeline import load_structure
+    # The cache holds one copy; large ones are memory-mapped from the
+    # shared store, so analysis workers map the same pages
+    cache = get_cache()
+    st.session_state.structure_hash = digest
+    structure = load_structure(digest, parse)
+    st.session_state.structure = structure
+    
+    # Large structures are analyzed in worker processes; until the job is
+    # done the session shows the partial table and the progress bar polls it
+    job = get_executor().submit(structure)
+    try:
+        protein_data = job.table()
+    except Exception as e:
+        # Show the basic table (no SASA) rather than failing the page
+        st.error(f"Structure analysis failed: {e}")
+        protein_data = structure.residue_table().reindex(columns=list(RESIDUE_COLUMNS))
+        st.session_state.protein_data = protein_data
+        st.session_state.pop('analysis_job', None)
+        st.session_state.filter_engine = FilterEngine(protein_data, structure=structure)
+        return
+    st.session_state.protein_data = protein_data
+    if job.done:
+        st.session_state.pop('analysis_job', None)
+        st.session_state.filter_engine = cache.get_or_compute(
+            digest, 'filter_engine', lambda: FilterEngine(protein_data, structure=structure))
+    else:
+        st.session_state.analysis_job = job
+        st.session_state.filter_engine = FilterEngine(protein_data, structure=structure)
+
+def attach_trajectory(digest: str, multiple_models: bool, upload_id: str):
+    """Attach the frames of a multi-model upload; they stay on disk"""
+    from trajectory import TRAJECTORY_ARTIFACT, get_trajectory_store
+    from trajectory_analysis import analyze_trajectory
+    # The first model is the session's structure and the topology; frames
+    # are read on demand from the file the upload job spooled, and analyzed
+    # in one background pass, which also writes the memory-mapped copy
+    store = get_trajectory_store()
+    structure = st.session_state.structure
+    trajectory = get_cache().get_or_compute(
+        digest, TRAJECTORY_ARTIFACT,
+        lambda: store.open(digest, structure) if multiple_models else None)
+    if trajectory is None:
+        for key in ('trajectory', 'trajectory_analysis', 'trajectory_job'):
+            st.session_state.pop(key, None)
+        return
+    st.session_state.trajectory = trajectory
+    job = analyze_trajectory(digest, trajectory, store, upload_id)
+    st.session_state.trajectory_analysis = job
+    if job.error is not None:
+        st.sidebar.error(job.status)
+    if job.done:
+        st.session_state.pop('trajectory_job', None)
+    else:
+        st.session_state.trajectory_job = job
+
+def load_batch_uploads():
+    """Keep the batch comparison of the uploaded models in sync with the uploader"""
+    uploads = st.session_state.get('batch_uploader') or []
+    file_ids = tuple(upload.file_id for upload in uploads)
+    batch = st.session_state.get('batch')
+    if batch is not None and batch.key != file_ids:
+        batch.cancel()
+        batch = None
+    if not file_ids:
+        for key in ('batch', 'batch_job', 'batch_table'):
+            st.session_state.pop(key, None)
+        return
+    
+    # Models stream through the analysis pool; the progress bar polls the
+    # job and the stacked table grows on every rerun until it is done
+    if batch is None:
+        from batch_analysis import start_batch
+        batch = start_batch(uploads, key=file_ids)
+        st.session_state.batch = batch
+        st.session_state.batch_job = batch
+    st.session_state.batch_table = batch.table()
+
 def on_filter_apply():
     """Handle filter application"""
-    # Get current display options
-    display_options = {
-        "show_bfactor": st.session_state.show_bfactor,
-        "show_sasa": st.session_state.show_sasa,
-        "show_position": st.session_state.show_position,
-        "show_chain": st.session_state.show_chain
-    }
-    
-    # Update current filters in session state
+    # Only data-level filters select rows; display options are read live by
+    # the tables, so toggling them never invalidates the filtered result
     current_filters = {
         "residue_search": st.session_state.residue_search,
         "chain_filter": st.session_state.chain_filter,
         "b_factor_range": st.session_state.b_factor_range,
         "sec_structure": st.session_state.sec_structure,
         "sasa_threshold": st.session_state.sasa_threshold,
-        "display_options": display_options
+        "near_residues": st.session_state.near_residues,
+        "interface_chains": st.session_state.interface_chains,
+        "spatial_cutoff": st.session_state.spatial_cutoff
     }
     
+    dialog = ui_loader.component_registry['dialog']
+    query = current_filters["residue_search"]
+    profile = []
+    if query and query.strip():
+        from selection_query import QueryError, compile_query
+        # Reject a search that doesn't parse before it reaches the tables
+        try:
+            compile_query(query)
+        except QueryError as e:
+            dialog.show('filter_dialog', {'title': 'Invalid Residue Search', 'content': str(e)})
+            return
+        engine = st.session_state.get('filter_engine')
+        if engine is not None:
+            profile = engine.explain(query)
+    
     st.session_state.current_filters = current_filters
+    st.session_state.selection_profile = profile
     st.session_state.filters_active = True
     st.session_state.filters_applied = True
     
     # Show dialog with current filters
-    dialog = ui_loader.component_registry['dialog']
     dialog.show('filter_dialog', {'title': 'Current Filters', 'content': current_filters})
 
 def main():
     init_session_state()
+    load_uploaded_structure()
+    load_batch_uploads()
     
     # Add an anchor at the top
     st.markdown('<div id="top"></div>', unsafe_allow_html=True)
@@ -54,9 +204,15 @@ def main():
     
     # Register action handlers
     ui_loader.register_action('on_filter_apply', on_filter_apply)
+    ui_loader.register_action('on_file_upload', on_file_upload)
     
     # Render UI
     ui_loader.render()
+    
+    # Export cache counters for a Prometheus textfile collector
+    metrics_path = os.environ.get(METRICS_PATH_ENV)
+    if metrics_path:
+        get_cache().write_metrics(metrics_path)
 
 if __name__ == "__main__":
     main()
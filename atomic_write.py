@@ -0,0 +1,23 @@
+"""Atomic file replacement for files other processes read while we write."""
+import os
+import threading
+
+def temp_path(path: str) -> str:
+    """Return a temporary path next to ``path``, unique to this process and thread."""
+    return f'{path}.tmp{os.getpid()}-{threading.get_ident()}'
+
+def write_text_atomic(path: str, text: str) -> None:
+    """Write ``text`` to ``path`` so readers only ever see a complete file.
+
+    The text goes to a writer-unique temporary file that is then renamed
+    over ``path``, so concurrent writers never replace each other's file.
+    """
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,182 @@
+"""Batch comparison of many models, streamed through the analysis process pool.
+
+Uploads are listed up front (zip archives by their member names) but read
+one model at a time: at most a few models per worker are in flight, so
+memory is bounded by the pool size rather than by the number of models.
+Each worker parses and analyzes a whole model; the results are stacked
+into one residue table with a categorical ``Model`` column.
+"""
+import gzip
+import threading
+import zipfile
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from analysis_executor import TABLE_ARTIFACT, AnalysisExecutor, get_executor
+from pdb_parser import content_hash, parse_buffer
+from structure_analysis import residue_table
+from structure_cache import get_cache
+
+MODEL_EXTENSIONS = ('.pdb', '.ent', '.cif', '.mmcif')
+
+# Models read ahead per worker; bounds the model bytes held at once
+IN_FLIGHT_PER_WORKER = 2
+
+# Residue table columns kept per model in the stacked table
+BATCH_COLUMNS = ('Chain', 'Residue', 'Position', 'B-Factor', 'SASA',
+                 'Secondary Structure', 'Hydropathy')
+
+ModelSource = Tuple[str, Callable[[], bytes]]
+
+def is_model_file(name: str) -> bool:
+    lowered = name.lower()
+    if lowered.endswith('.gz'):
+        lowered = lowered[:-3]
+    return lowered.endswith(MODEL_EXTENSIONS)
+
+def list_models(uploads: Sequence[Any]) -> List[ModelSource]:
+    """Name and reader of every model in the uploads, without reading them."""
+    models: List[ModelSource] = []
+    for upload in uploads:
+        if upload.name.lower().endswith('.zip'):
+            archive = zipfile.ZipFile(upload)
+            models += [(info.filename, partial(archive.read, info))
+                       for info in archive.infolist()
+                       if not info.is_dir() and is_model_file(info.filename)]
+        elif is_model_file(upload.name):
+            models.append((upload.name, upload.getvalue))
+    # Models are keyed by name in the stacked table
+    seen: Dict[str, int] = {}
+    for i, (name, read) in enumerate(models):
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            models[i] = (f'{name} ({seen[name]})', read)
+    return models
+
+def analyze_model(name: str, data: bytes) -> pd.DataFrame:
+    """Worker entry point: parse one model and build its residue table."""
+    if name.lower().endswith('.gz'):
+        data, name = gzip.decompress(data), name[:-3]
+    # Without a content hash nothing is kept in the worker's cache
+    return residue_table(parse_buffer(data, name=name))
+
+class BatchJob:
+    """Analysis of a list of models, compatible with the progress component.
+
+    Models are submitted by a feeder thread as worker slots free up;
+    :meth:`table` stacks the models finished so far in upload order.
+    Models that fail to parse are reported in :attr:`errors` and skipped.
+    """
+
+    def __init__(self, models: List[ModelSource], executor: AnalysisExecutor,
+                 key: Hashable = None, max_in_flight: Optional[int] = None):
+        self.key = key
+        self.names = [name for name, _ in models]
+        self.errors: Dict[str, str] = {}
+        self._models = models
+        self._executor = executor
+        self._slots = threading.BoundedSemaphore(
+            max_in_flight or IN_FLIGHT_PER_WORKER * executor.max_workers)
+        self._tables: Dict[int, pd.DataFrame] = {}
+        self._table: Optional[pd.DataFrame] = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> int:
+        with self._lock:
+            return len(self._tables) + len(self.errors)
+
+    @property
+    def done(self) -> bool:
+        return self._cancelled or self.finished == len(self.names)
+
+    @property
+    def progress(self) -> float:
+        return self.finished / len(self.names) if self.names else 1.0
+
+    @property
+    def status(self) -> str:
+        failed = f', {len(self.errors)} failed' if self.errors else ''
+        if self.done:
+            return f'Batch complete: {len(self._tables)} models{failed}'
+        return f'Comparing models: {self.finished} of {len(self.names)} analyzed{failed}'
+
+    def start(self) -> 'BatchJob':
+        threading.Thread(target=self._feed, name='batch-feeder', daemon=True).start()
+        return self
+
+    def cancel(self) -> None:
+        """Stop submitting models; those already running finish unused."""
+        self._cancelled = True
+
+    def table(self) -> pd.DataFrame:
+        """Residue tables of the finished models, stacked in upload order."""
+        if self._table is not None:
+            return self._table
+        with self._lock:
+            finished = sorted(self._tables.items())
+            complete = len(finished) + len(self.errors) == len(self.names)
+        tables = [table for _, table in finished]
+        codes = np.repeat(np.array([index for index, _ in finished], dtype=np.int32),
+                          [len(table) for table in tables])
+        model = pd.Categorical.from_codes(codes, categories=pd.Index(self.names))
+        if tables:
+            stacked = pd.concat(tables, ignore_index=True)
+        else:
+            # With the residue table's dtypes, so filters see no object columns
+            stacked = residue_table(parse_buffer(b'')).loc[:, list(BATCH_COLUMNS)]
+        stacked.insert(0, 'Model', model)
+        if complete:
+            self._table = stacked
+        return stacked
+
+    def _feed(self) -> None:
+        try:
+            for index, (name, read) in enumerate(self._models):
+                self._slots.acquire()
+                if self._cancelled:
+                    return
+                try:
+                    data = read()
+                    digest = content_hash(data)
+                    cached = get_cache().get(digest, TABLE_ARTIFACT)
+                    if cached is not None:
+                        self._model_done(index, cached)
+                        continue
+                    future = self._executor.submit_task(analyze_model, name, data)
+                except Exception as e:
+                    self._model_failed(index, e)
+                    continue
+                del data
+                future.add_done_callback(partial(self._future_done, index, digest))
+        finally:
+            # The archive readers and upload buffers are no longer needed,
+            # also when the job was cancelled
+            self._models = []
+
+    def _future_done(self, index: int, digest: str, future: Future) -> None:
+        error = future.exception()
+        if error is not None:
+            self._model_failed(index, error)
+            return
+        table = future.result()
+        # Shared with the single-upload path, keyed by the same content hash
+        get_cache().put(digest, TABLE_ARTIFACT, table)
+        self._model_done(index, table)
+
+    def _model_done(self, index: int, table: pd.DataFrame) -> None:
+        with self._lock:
+            self._tables[index] = table.loc[:, list(BATCH_COLUMNS)]
+        self._slots.release()
+
+    def _model_failed(self, index: int, error: BaseException) -> None:
+        with self._lock:
+            self.errors[self.names[index]] = str(error) or type(error).__name__
+        self._slots.release()
+
+def start_batch(uploads: Sequence[Any], key: Hashable = None) -> BatchJob:
+    """Start analyzing every model in the uploads on the shared pool."""
+    return BatchJob(list_models(uploads), get_executor(), key).start()
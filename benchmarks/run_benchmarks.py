@@ -0,0 +1,292 @@
+"""Headless rerun benchmarks for the UI loader, components and structure pipeline.
+
+Each scenario runs in its own Python process (for a meaningful peak RSS) and
+drives the app with ``streamlit.testing.v1.AppTest``:
+
+* ``components-N``: a synthetic configuration of N components, no structure
+* ``residues-N``: the shipped ``ui_config.json`` with a synthetic N-residue
+  structure attached, as after an upload
+
+Cold-start import times of the UI modules are measured separately, with
+``python -X importtime`` in fresh interpreters.
+
+Usage, from the repository root::
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --components 10 100 --residues 1000 1000000
+    python -m benchmarks.run_benchmarks --components --residues --imports ui_loader app
+    python -m benchmarks.run_benchmarks --save-baseline
+    python -m benchmarks.run_benchmarks --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'streamlit_test_app_bench')
+
+DEFAULT_COMPONENTS = (10, 100, 1000)
+DEFAULT_RESIDUES = (1000, 10000, 100000)
+DEFAULT_IMPORTS = ('ui_loader', 'app')
+
+# Imports are timed this many times, keeping the fastest
+IMPORT_REPEATS = 3
+
+# Reruns under the render profiler, after the timed ones, for the
+# per-component costs; the first is discarded like a cold run
+PROFILED_RERUNS = 3
+
+# A scenario regresses when its p50 rerun latency grows by more than this
+REGRESSION_TOLERANCE = 0.2
+
+COMPONENTS_SCRIPT = """
+from ui_loader import UILoader
+UILoader({config_path!r}).render()
+"""
+
+RESIDUES_SCRIPT = """
+from functools import partial
+import app
+from pdb_parser import parse_file
+from ui_loader import UILoader
+app.init_session_state()
+app.attach_structure({digest!r}, partial(parse_file, {structure_path!r}))
+app.ui_loader = UILoader('ui_config.json')
+app.ui_loader.register_action('on_filter_apply', app.on_filter_apply)
+app.ui_loader.render()
+"""
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99),
+            'mean': sum(ordered) / len(ordered), 'max': ordered[-1]}
+
+def _with_self_time(records: List[Dict[str, Any]]) -> None:
+    """Add ``self_wall_ms``: inclusive wall time minus that of direct children."""
+    stack: List[Dict[str, Any]] = []
+    for record in records:
+        while stack and stack[-1]['depth'] >= record['depth']:
+            stack.pop()
+        record['self_wall_ms'] = record['wall_ms']
+        if stack:
+            stack[-1]['self_wall_ms'] -= record['wall_ms']
+        stack.append(record)
+
+def component_costs(log_path: str, top: int = 10) -> List[Dict[str, Any]]:
+    """Mean per-component cost over the warm runs in a profiler log, by self time."""
+    runs: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    with open(log_path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['run'] > 1:
+                runs[record['run']].append(record)
+    totals: Dict[tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for records in runs.values():
+        _with_self_time(records)
+        for record in records:
+            entry = totals[(record['key'], record['type'])]
+            entry['count'] += 1
+            for field in ('self_wall_ms', 'wall_ms', 'cpu_ms', 'alloc_bytes', 'payload_bytes'):
+                entry[field] += record[field]
+    costs = []
+    for (key, component_type), entry in totals.items():
+        count = entry.pop('count')
+        costs.append({'key': key, 'type': component_type,
+                      **{field: value / count for field, value in entry.items()}})
+    costs.sort(key=lambda cost: cost['self_wall_ms'], reverse=True)
+    return costs[:top]
+
+def run_scenario(kind: str, size: int, reruns: int, cache_dir: str) -> Dict[str, Any]:
+    """Run one scenario in this process and return its measurements."""
+    from streamlit.testing.v1 import AppTest
+    from benchmarks.synthetic import structure_path, synthetic_config
+
+    os.chdir(ROOT)
+    log_path = os.path.join(cache_dir, f"profile_{kind}_{size}_{os.getpid()}.jsonl")
+    os.environ['UI_PROFILE_LOG_PATH'] = log_path
+    result: Dict[str, Any] = {'kind': kind, 'size': size}
+
+    if kind == 'components':
+        config_path = os.path.join(cache_dir, f"config_{size}.json")
+        with open(config_path, 'w') as f:
+            json.dump(synthetic_config(size), f)
+        script = COMPONENTS_SCRIPT.format(config_path=config_path)
+    else:
+        from analysis_executor import get_executor
+        from pdb_parser import content_hash
+        path = structure_path(cache_dir, size)
+        with open(path, 'rb') as f:
+            digest = content_hash(f.read())
+        script = RESIDUES_SCRIPT.format(digest=digest, structure_path=path)
+
+    # All timed runs are made without the render profiler, whose
+    # tracemalloc tracing would inflate them
+    os.environ.pop('UI_PROFILE', None)
+    at = AppTest.from_string(script, default_timeout=600)
+    start = time.perf_counter()
+    at.run()
+    result['first_run_s'] = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"{kind}-{size}: {at.exception[0].value}")
+
+    if kind == 'residues':
+        # Wait for background analysis so warm reruns see the full table
+        start = time.perf_counter()
+        job = at.session_state['analysis_job'] if 'analysis_job' in at.session_state else None
+        while job is not None and not job.done:
+            time.sleep(0.05)
+        result['analysis_wait_s'] = time.perf_counter() - start
+        at.run()
+        get_executor().shutdown()
+
+    samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - start)
+    result['rerun_s'] = percentiles(samples)
+    result['reruns'] = reruns
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+    # Per-component costs come from a separate, untimed profiled pass
+    os.environ['UI_PROFILE'] = '1'
+    for _ in range(PROFILED_RERUNS + 1):
+        at.run()
+    del os.environ['UI_PROFILE']
+    result['components'] = component_costs(log_path)
+    os.remove(log_path)
+    return result
+
+def import_time(module: str, repeats: int = IMPORT_REPEATS, top: int = 5) -> Dict[str, Any]:
+    """Cold import time of a module and of the heaviest top-level packages it loads."""
+    best: Optional[Dict[str, Any]] = None
+    for _ in range(repeats):
+        command = [sys.executable, '-X', 'importtime', '-c', f'import {module}']
+        stderr = subprocess.run(command, cwd=ROOT, check=True, capture_output=True, text=True).stderr
+        # Lines read "import time: self [us] | cumulative | name", with a
+        # module's imports listed (further indented) before it
+        entries = []
+        for line in stderr.splitlines():
+            if line.startswith('import time:') and not line.rstrip().endswith('imported package'):
+                _, total, name = line.split('|')
+                entries.append((len(name) - len(name.lstrip()), name.strip(), int(total) / 1000))
+        end = next(i for i, (_, name, _) in enumerate(entries) if name == module)
+        depth, _, total_ms = entries[end]
+        start = end
+        while start > 0 and entries[start - 1][0] > depth:
+            start -= 1
+        if best is None or total_ms < best['import_ms']:
+            packages = sorted((entry for entry in entries[start:end] if '.' not in entry[1]),
+                              key=lambda entry: -entry[2])
+            best = {'import_ms': total_ms,
+                    'packages': {name: ms for _, name, ms in packages[:top]}}
+    return best
+
+def run_isolated(kind: str, size: int, reruns: int, cache_dir: str) -> Dict[str, Any]:
+    """Run a scenario in a fresh interpreter and parse its JSON result."""
+    command = [sys.executable, '-m', 'benchmarks.run_benchmarks', '--worker', kind, str(size),
+               '--reruns', str(reruns), '--cache-dir', cache_dir]
+    output = subprocess.run(command, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Describe scenarios whose p50 rerun latency regressed against a baseline."""
+    regressions = []
+    for name, result in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        before, after = previous['rerun_s']['p50'], result['rerun_s']['p50']
+        if after > before * (1 + tolerance):
+            regressions.append(f"{name}: p50 rerun {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+    for module, result in results.get('imports', {}).items():
+        previous = baseline.get('imports', {}).get(module)
+        if previous is None:
+            continue
+        before, after = previous['import_ms'], result['import_ms']
+        if after > before * (1 + tolerance):
+            regressions.append(f"import {module}: {before:.0f} ms -> {after:.0f} ms")
+    return regressions
+
+def print_report(results: Dict[str, Any]) -> None:
+    print(f"{'scenario':<18}{'first run':>11}{'p50':>10}{'p90':>10}{'p99':>10}{'peak RSS':>11}  slowest component")
+    for name, result in results['scenarios'].items():
+        rerun = result['rerun_s']
+        slowest = result['components'][0] if result['components'] else None
+        slowest_text = f"{slowest['type']}:{slowest['key']} {slowest['self_wall_ms']:.1f} ms" if slowest else ''
+        print(f"{name:<18}{result['first_run_s'] * 1000:>9.0f}ms{rerun['p50'] * 1000:>8.1f}ms"
+              f"{rerun['p90'] * 1000:>8.1f}ms{rerun['p99'] * 1000:>8.1f}ms"
+              f"{result['peak_rss_mb']:>9.0f}MB  {slowest_text}")
+    if results.get('imports'):
+        print(f"\n{'import':<18}{'cold':>11}  heaviest packages")
+        for module, result in results['imports'].items():
+            packages = ', '.join(f"{name} {ms:.0f} ms" for name, ms in result['packages'].items())
+            print(f"{module:<18}{result['import_ms']:>9.0f}ms  {packages}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--components', type=int, nargs='*', default=list(DEFAULT_COMPONENTS))
+    parser.add_argument('--residues', type=int, nargs='*', default=list(DEFAULT_RESIDUES))
+    parser.add_argument('--imports', nargs='*', default=list(DEFAULT_IMPORTS),
+                        help="modules whose cold import time is measured")
+    parser.add_argument('--reruns', type=int, default=10)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="where synthetic structures and configs are written")
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help=f"also write the results to {os.path.relpath(DEFAULT_BASELINE, ROOT)}")
+    parser.add_argument('--compare', metavar='BASELINE', help="fail on regressions against this file")
+    parser.add_argument('--worker', nargs=2, metavar=('KIND', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    os.makedirs(args.cache_dir, exist_ok=True)
+
+    if args.worker:
+        kind, size = args.worker
+        print(json.dumps(run_scenario(kind, int(size), args.reruns, args.cache_dir)))
+        return 0
+
+    results = {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'machine': platform.machine(), 'cpus': os.cpu_count(),
+                 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'reruns': args.reruns},
+        'scenarios': {},
+        'imports': {},
+    }
+    for kind, sizes in (('components', args.components), ('residues', args.residues)):
+        for size in sizes:
+            print(f"running {kind}-{size}...", file=sys.stderr)
+            results['scenarios'][f"{kind}-{size}"] = run_isolated(kind, size, args.reruns, args.cache_dir)
+    for module in args.imports:
+        print(f"importing {module}...", file=sys.stderr)
+        results['imports'][module] = import_time(module)
+    print_report(results)
+
+    for path in filter(None, (args.output, DEFAULT_BASELINE if args.save_baseline else None)):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Synthetic UI configurations and structures of configurable size."""
+import os
+from typing import Any, Dict, List
+import numpy as np
+import pandas as pd
+
+AMINO_ACIDS = ('ALA', 'ARG', 'ASN', 'ASP', 'CYS', 'GLN', 'GLU', 'GLY', 'HIS', 'ILE',
+               'LEU', 'LYS', 'MET', 'PHE', 'PRO', 'SER', 'THR', 'TRP', 'TYR', 'VAL')
+
+# Backbone atoms per residue: name, element, cylindrical (radius Å, phase °, rise Å)
+# around the axis of an idealized helix with 100° and 1.5 Å per residue
+BACKBONE = (('N', 'N', 1.55, -28.0, -0.9), ('CA', 'C', 2.30, 0.0, 0.0),
+            ('C', 'C', 1.60, 28.0, 0.9), ('O', 'O', 2.20, 35.0, 2.1))
+CHAIN_LENGTH = 250
+CHAIN_SPACING = 14.0
+
+def _component(kind: str, i: int) -> Dict[str, Any]:
+    key = f"bench_{kind}_{i}"
+    if kind == 'text_input':
+        return {'type': 'text_input', 'label': f"Text {i}", 'key': key, 'default': ''}
+    if kind == 'slider':
+        return {'type': 'slider', 'label': f"Slider {i}", 'key': key, 'min': 0, 'max': 100, 'value': 50}
+    if kind == 'select':
+        return {'type': 'select', 'label': f"Select {i}", 'key': key, 'options': ['A', 'B', 'C']}
+    if kind == 'checkbox':
+        return {'type': 'checkbox', 'label': f"Checkbox {i}", 'key': key}
+    if kind == 'number_input':
+        return {'type': 'number_input', 'label': f"Number {i}", 'key': key, 'min': 0, 'max': 10, 'value': 5}
+    if kind == 'text':
+        return {'type': 'text', 'content': f"Static text {i}"}
+    if kind == 'data_table':
+        return {'type': 'data_table', 'key': key, 'data': {'sample_data': True}}
+    if kind == 'plot':
+        return {'type': 'plot', 'key': key, 'plot_type': 'scatter', 'data': {'type': 'ramachandran'}}
+    raise ValueError(f"unknown synthetic component kind: {kind}")
+
+# One in ten components is a table or a plot, as in the shipped configuration
+COMPONENT_MIX = ('text_input', 'slider', 'select', 'checkbox', 'number_input',
+                 'text', 'text_input', 'data_table', 'checkbox', 'plot')
+
+def synthetic_config(n_components: int, group_size: int = 10) -> Dict[str, Any]:
+    """A layout of ``n_components`` leaf components in expanders of ``group_size``."""
+    components = [_component(COMPONENT_MIX[i % len(COMPONENT_MIX)], i) for i in range(n_components)]
+    groups: List[Dict[str, Any]] = []
+    for start in range(0, n_components, group_size):
+        groups.append({'type': 'expander', 'label': f"Group {start // group_size}",
+                       'key': f"bench_group_{start // group_size}", 'expanded': True,
+                       'components': components[start:start + group_size]})
+    return {'title': f"Benchmark ({n_components} components)",
+            'layout': {'sidebar': {'components': []}, 'main': {'components': groups}}}
+
+def _chain_name(index: int) -> str:
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+    name = letters[index % len(letters)]
+    index //= len(letters)
+    while index:
+        index -= 1
+        name = letters[index % len(letters)] + name
+        index //= len(letters)
+    return name
+
+def write_structure(path: str, n_residues: int, seed: int = 0) -> str:
+    """Write an mmCIF file of ``n_residues`` backbone residues in helical chains.
+
+    Chains of ``CHAIN_LENGTH`` residues stand side by side on a square grid,
+    so the assembly stays compact however large it gets. mmCIF has no column
+    limits, so any size can be written.
+    """
+    rng = np.random.default_rng(seed)
+    n_atoms_per_residue = len(BACKBONE)
+    residue = np.arange(n_residues)
+    chain = residue // CHAIN_LENGTH
+    position = residue % CHAIN_LENGTH
+    n_chains = int(chain[-1]) + 1 if n_residues else 0
+    grid = int(np.ceil(np.sqrt(max(n_chains, 1))))
+
+    theta = np.radians(position * 100.0)
+    rise = position * 1.5
+    coords = np.empty((n_residues, n_atoms_per_residue, 3))
+    for j, (_, _, radius, phase, offset) in enumerate(BACKBONE):
+        angle = theta + np.radians(phase)
+        coords[:, j, 0] = (chain % grid) * CHAIN_SPACING + radius * np.cos(angle)
+        coords[:, j, 1] = (chain // grid) * CHAIN_SPACING + radius * np.sin(angle)
+        coords[:, j, 2] = rise + offset
+    coords = coords.reshape(-1, 3)
+
+    res_names = np.asarray(AMINO_ACIDS)[rng.integers(0, len(AMINO_ACIDS), n_residues)]
+    chain_names = np.asarray([_chain_name(i) for i in range(n_chains)])
+    atoms = pd.DataFrame({
+        'group': 'ATOM',
+        'id': np.arange(1, n_residues * n_atoms_per_residue + 1),
+        'element': np.tile([atom[1] for atom in BACKBONE], n_residues),
+        'atom': np.tile([atom[0] for atom in BACKBONE], n_residues),
+        'comp': np.repeat(res_names, n_atoms_per_residue),
+        'asym': np.repeat(chain_names[chain], n_atoms_per_residue),
+        'seq': np.repeat(position + 1, n_atoms_per_residue),
+        'x': coords[:, 0], 'y': coords[:, 1], 'z': coords[:, 2],
+        'occupancy': 1.0,
+        'b_factor': rng.uniform(10, 90, n_residues * n_atoms_per_residue),
+        'model': 1,
+    })
+    header = ['data_synthetic', 'loop_'] + [f'_atom_site.{item}' for item in (
+        'group_PDB', 'id', 'type_symbol', 'label_atom_id', 'label_comp_id', 'auth_asym_id',
+        'auth_seq_id', 'Cartn_x', 'Cartn_y', 'Cartn_z', 'occupancy', 'B_iso_or_equiv',
+        'pdbx_PDB_model_num')]
+    with open(path, 'w') as f:
+        f.write('\n'.join(header) + '\n')
+        atoms.to_csv(f, sep=' ', header=False, index=False, float_format='%.3f')
+        f.write('#\n')
+    return path
+
+def structure_path(cache_dir: str, n_residues: int) -> str:
+    """Path of the synthetic structure of ``n_residues``, written on first use."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"synthetic_{n_residues}.cif")
+    if not os.path.exists(path):
+        write_structure(path, n_residues)
+    return path
@@ -0,0 +1,236 @@
+"""BinaryCIF encoding of parsed structures for the Molstar viewer.
+
+BinaryCIF is MessagePack-packed mmCIF with per-column compression
+(fixed point, delta, run length and integer packing). Molstar reads it
+natively, and it is about a tenth of the size of the PDB text.
+"""
+import struct
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from structure import CodedColumn, Structure
+
+VERSION = '0.3.0'
+ENCODER = 'streamlit-structure-app'
+
+# ByteArray type codes
+INT8, INT16, INT32, UINT8, UINT16, UINT32, FLOAT32, FLOAT64 = 1, 2, 3, 4, 5, 6, 32, 33
+BYTE_ARRAY_TYPES = {INT8: '<i1', INT16: '<i2', INT32: '<i4', UINT8: '<u1', UINT16: '<u2', UINT32: '<u4'}
+
+COORDINATE_FACTOR = 1000
+B_FACTOR_FACTOR = 100
+OCCUPANCY_FACTOR = 100
+
+WATER_NAMES = (b'HOH', b'WAT', b'DOD')
+
+def _packb(value: Any, out: List[bytes]) -> None:
+    """Append the MessagePack encoding of a value (the subset BinaryCIF uses)."""
+    if value is None:
+        out.append(b'\xc0')
+    elif value is True or value is False:
+        out.append(b'\xc3' if value else b'\xc2')
+    elif isinstance(value, int):
+        if 0 <= value < 128:
+            out.append(struct.pack('B', value))
+        elif -32 <= value < 0:
+            out.append(struct.pack('b', value))
+        elif -2 ** 31 <= value < 2 ** 31:
+            out.append(b'\xd2' + struct.pack('>i', value))
+        else:
+            out.append(b'\xd3' + struct.pack('>q', value))
+    elif isinstance(value, float):
+        out.append(b'\xcb' + struct.pack('>d', value))
+    elif isinstance(value, str):
+        data = value.encode()
+        n = len(data)
+        if n < 32:
+            out.append(struct.pack('B', 0xa0 | n))
+        elif n < 2 ** 8:
+            out.append(b'\xd9' + struct.pack('B', n))
+        elif n < 2 ** 16:
+            out.append(b'\xda' + struct.pack('>H', n))
+        else:
+            out.append(b'\xdb' + struct.pack('>I', n))
+        out.append(data)
+    elif isinstance(value, (bytes, bytearray)):
+        n = len(value)
+        if n < 2 ** 8:
+            out.append(b'\xc4' + struct.pack('B', n))
+        elif n < 2 ** 16:
+            out.append(b'\xc5' + struct.pack('>H', n))
+        else:
+            out.append(b'\xc6' + struct.pack('>I', n))
+        out.append(bytes(value))
+    elif isinstance(value, (list, tuple)):
+        n = len(value)
+        out.append(struct.pack('B', 0x90 | n) if n < 16 else b'\xdc' + struct.pack('>H', n)
+                   if n < 2 ** 16 else b'\xdd' + struct.pack('>I', n))
+        for item in value:
+            _packb(item, out)
+    elif isinstance(value, dict):
+        n = len(value)
+        out.append(struct.pack('B', 0x80 | n) if n < 16 else b'\xde' + struct.pack('>H', n))
+        for key, item in value.items():
+            _packb(key, out)
+            _packb(item, out)
+    else:
+        raise TypeError(f"cannot pack {type(value).__name__}")
+
+def packb(value: Any) -> bytes:
+    out: List[bytes] = []
+    _packb(value, out)
+    return b''.join(out)
+
+def _byte_array(values: np.ndarray, encodings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    for code, dtype in BYTE_ARRAY_TYPES.items():
+        if values.dtype == np.dtype(dtype):
+            encodings.append({'kind': 'ByteArray', 'type': code})
+            return {'encoding': encodings, 'data': values.astype(dtype).tobytes()}
+    raise TypeError(f"no ByteArray type for {values.dtype}")
+
+def _integer_packing(values: np.ndarray, encodings: List[Dict[str, Any]]) -> np.ndarray:
+    """Pack int32 values into 8 or 16 bits, when that is smaller.
+
+    Values beyond the packed range are written as a run of limit values
+    followed by the remainder, which the decoder sums up.
+    """
+    n = values.size
+    wide = values.astype(np.int64)
+    unsigned = n == 0 or bool(wide.min() >= 0)
+    best = None
+    for byte_count in (1, 2):
+        bits = 8 * byte_count if unsigned else 8 * byte_count - 1
+        upper, lower = (1 << bits) - 1, (0 if unsigned else -(1 << bits))
+        fill = np.where(wide < 0, lower, upper)
+        extra = wide // fill
+        size = (int(extra.sum()) + n) * byte_count
+        if best is None or size < best[0]:
+            best = (size, byte_count, fill, extra)
+    size, byte_count, fill, extra = best
+    if size >= 4 * n:
+        return values
+    packed = np.repeat(fill, extra + 1)
+    packed[np.cumsum(extra + 1) - 1] = wide - extra * fill
+    encodings.append({'kind': 'IntegerPacking', 'byteCount': byte_count,
+                      'isUnsigned': unsigned, 'srcSize': int(n)})
+    dtype = {(1, True): np.uint8, (1, False): np.int8, (2, True): np.uint16, (2, False): np.int16}
+    return packed.astype(dtype[(byte_count, unsigned)])
+
+def _delta(values: np.ndarray, encodings: List[Dict[str, Any]]) -> np.ndarray:
+    origin = int(values[0]) if values.size else 0
+    encodings.append({'kind': 'Delta', 'origin': origin, 'srcType': INT32})
+    return np.diff(values.astype(np.int32), prepend=np.int32(origin)).astype(np.int32)
+
+def _run_length(values: np.ndarray, encodings: List[Dict[str, Any]]) -> np.ndarray:
+    encodings.append({'kind': 'RunLength', 'srcType': INT32, 'srcSize': int(values.size)})
+    if not values.size:
+        return values.astype(np.int32)
+    starts = np.flatnonzero(np.diff(values, prepend=values[0] - 1))
+    counts = np.diff(np.append(starts, values.size))
+    return np.column_stack((values[starts], counts)).ravel().astype(np.int32)
+
+def _encode_ints(values: np.ndarray, pipeline: Sequence[str] = ('delta', 'run_length')) -> Dict[str, Any]:
+    encodings: List[Dict[str, Any]] = []
+    data = values.astype(np.int32)
+    for step in pipeline:
+        data = _delta(data, encodings) if step == 'delta' else _run_length(data, encodings)
+    return _byte_array(_integer_packing(data, encodings), encodings)
+
+def _encode_fixed(values: np.ndarray, factor: int, pipeline: Sequence[str] = ('delta',)) -> Dict[str, Any]:
+    encodings: List[Dict[str, Any]] = [{'kind': 'FixedPoint', 'factor': factor, 'srcType': FLOAT32}]
+    data = np.round(values.astype(np.float64) * factor).astype(np.int32)
+    for step in pipeline:
+        data = _delta(data, encodings) if step == 'delta' else _run_length(data, encodings)
+    return _byte_array(_integer_packing(data, encodings), encodings)
+
+def _encode_strings(strings: Sequence[str], indices: np.ndarray) -> Dict[str, Any]:
+    """StringArray of distinct strings, referenced by per-row indices."""
+    lengths = np.array([len(s.encode()) for s in strings], dtype=np.int32)
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int32)
+    encoding = {
+        'kind': 'StringArray',
+        'dataEncoding': None, 'offsetEncoding': None,
+        'stringData': ''.join(strings),
+        'offsets': None,
+    }
+    data = _encode_ints(indices, ('run_length',))
+    offset_data = _encode_ints(offsets, ('delta',))
+    encoding['dataEncoding'] = data['encoding']
+    encoding['offsetEncoding'] = offset_data['encoding']
+    encoding['offsets'] = offset_data['data']
+    return {'encoding': [encoding], 'data': data['data']}
+
+def _column(name: str, data: Dict[str, Any], mask: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    return {'name': name, 'data': data,
+            'mask': None if mask is None else _encode_ints(mask, ('run_length',))}
+
+def _text(values: np.ndarray) -> Dict[str, Any]:
+    """StringArray of a bytes array or CodedColumn."""
+    if isinstance(values, CodedColumn):
+        categories, codes = values.categories, values.codes
+    else:
+        categories, codes = np.unique(values, return_inverse=True)
+    return _encode_strings([c.decode() for c in categories], codes)
+
+def _entities(structure: Structure) -> Dict[str, Any]:
+    """Entity id per atom: one per polymer chain, ligand type, and water."""
+    water = structure.res_name.isin(WATER_NAMES)
+    key = np.where(structure.record,
+                   np.where(water, 0, 1 + structure.res_name.codes.astype(np.int64)),
+                   (2 + len(structure.res_name.categories)) + structure.chain_id.codes.astype(np.int64))
+    # Entities numbered in order of first appearance
+    uniques, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    rank = np.empty(uniques.size, dtype=np.int32)
+    rank[np.argsort(first, kind='stable')] = np.arange(uniques.size, dtype=np.int32)
+    types = np.where(uniques >= 2 + len(structure.res_name.categories), 'polymer',
+                     np.where(uniques == 0, 'water', 'non-polymer'))
+    entity_types = [str(t) for t in types[np.argsort(first, kind='stable')]]
+    return {'atom_entity': rank[inverse.ravel()], 'types': entity_types}
+
+def encode_structure(structure: Structure) -> bytes:
+    """BinaryCIF (first model) of a structure, with the usual _atom_site items."""
+    n = structure.n_atoms
+    entities = _entities(structure)
+    entity_ids = [str(i + 1) for i in range(len(entities['types']))]
+    chain = _text(structure.chain_id)
+    residue = _text(structure.res_name)
+    atom = _text(structure.atom_name)
+    seq = _encode_ints(structure.res_seq)
+    i_code = np.char.strip(structure.i_code)
+    blank_i_code = (i_code == b'') | (i_code == b'?') | (i_code == b'.')
+    atom_site = [
+        _column('group_PDB', _encode_strings(['ATOM', 'HETATM'], structure.record.astype(np.int32))),
+        _column('id', _encode_ints(structure.serial)),
+        _column('type_symbol', _text(structure.element)),
+        _column('label_atom_id', atom),
+        _column('label_comp_id', residue),
+        _column('label_asym_id', chain),
+        _column('label_entity_id', _encode_strings(entity_ids, entities['atom_entity'])),
+        _column('label_seq_id', seq),
+        _column('pdbx_PDB_ins_code', _text(i_code), blank_i_code.astype(np.int32)),
+        _column('Cartn_x', _encode_fixed(structure.coords[:, 0], COORDINATE_FACTOR)),
+        _column('Cartn_y', _encode_fixed(structure.coords[:, 1], COORDINATE_FACTOR)),
+        _column('Cartn_z', _encode_fixed(structure.coords[:, 2], COORDINATE_FACTOR)),
+        _column('occupancy', _encode_fixed(structure.occupancy, OCCUPANCY_FACTOR, ('run_length',))),
+        _column('B_iso_or_equiv', _encode_fixed(structure.b_factor, B_FACTOR_FACTOR)),
+        _column('auth_atom_id', atom),
+        _column('auth_comp_id', residue),
+        _column('auth_asym_id', chain),
+        _column('auth_seq_id', seq),
+        _column('pdbx_PDB_model_num', _encode_ints(np.ones(n, dtype=np.int32), ('run_length',))),
+    ]
+    entity = [
+        _column('id', _encode_strings(entity_ids, np.arange(len(entity_ids), dtype=np.int32))),
+        _column('type', _text(np.asarray(entities['types'], dtype='S'))),
+    ]
+    header = (structure.name or 'structure').rsplit('.', 1)[0].replace(' ', '_') or 'structure'
+    return packb({
+        'version': VERSION,
+        'encoder': ENCODER,
+        'dataBlocks': [{
+            'header': header,
+            'categories': [
+                {'name': '_entity', 'columns': entity, 'rowCount': len(entity_ids)},
+                {'name': '_atom_site', 'columns': atom_site, 'rowCount': n},
+            ],
+        }],
+    })
@@ -0,0 +1,181 @@
+"""Vectorized evaluation of the sidebar filters over a residue table."""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from selection_query import compile_query
+from spatial_index import get_spatial_index
+from structure import Structure
+
+# Filter settings that affect which residues are selected, in key order.
+# Presentation settings (column visibility, view mode) are not filters and
+# are applied by the tables to the filtered result.
+DATA_FILTER_KEYS = ('residue_search', 'chain_filter', 'b_factor_range',
+                    'sec_structure', 'sasa_threshold', 'near_residues',
+                    'interface_chains', 'spatial_cutoff')
+
+# Distance (Å) used by the spatial filters when none is set
+DEFAULT_SPATIAL_CUTOFF = 5.0
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+def filter_key(filters: Dict[str, Any]) -> Tuple:
+    """Hashable key of the data-level part of a filter dict."""
+    return tuple(_freeze(filters.get(name)) for name in DATA_FILTER_KEYS)
+
+def parse_residue_search(text: Optional[str]) -> Tuple[str, ...]:
+    """Split a free-text list of residue names (``"HEM, NAG"``)."""
+    if not text:
+        return ()
+    return tuple(name.upper() for name in re.split(r'[\s,;]+', text) if name)
+
+def _group_index(values: pd.Series) -> Dict[str, np.ndarray]:
+    """Map each distinct value to the sorted row indices holding it.
+
+    Categorical columns are factorized from their codes.
+    """
+    codes, uniques = pd.factorize(values)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return {str(name): order[bounds[i]:bounds[i + 1]] for i, name in enumerate(uniques)}
+
+class FilterEngine:
+    """Compiles filter settings into boolean masks over one residue table.
+
+    Per-chain and per-residue-name row indexes are built once, so categorical
+    filters cost a scatter into a boolean array rather than a string compare
+    per row. Masks are cached per filter tuple with LRU eviction; engines are
+    shared between sessions, so the mask cache is guarded by a lock.
+
+    Spatial filters need the ``structure`` the table was built from; its
+    spatial index is only built once such a filter is used.
+
+    The residue search is a selection query (see :mod:`selection_query`);
+    the engine is the source its compiled plans are evaluated against.
+    """
+
+    def __init__(self, residues: pd.DataFrame, cache_size: int = 64,
+                 structure: Optional[Structure] = None):
+        self.n_rows = len(residues)
+        self.structure = structure
+        self.chain_index = _group_index(residues['Chain'])
+        self.residue_index = _group_index(residues['Residue'])
+        self.b_factor = residues['B-Factor'].to_numpy(dtype=np.float64)
+        self.sasa = residues['SASA'].to_numpy(dtype=np.float64)
+        self.position = residues['Position'].to_numpy(dtype=np.int64)
+        if 'Secondary Structure' in residues:
+            self.sec_structure_index = _group_index(residues['Secondary Structure'])
+        else:
+            self.sec_structure_index = None
+        self.cache_size = cache_size
+        self._masks: 'OrderedDict[Tuple, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate size of the indexes and cached masks in bytes."""
+        indexes = [self.chain_index, self.residue_index, self.sec_structure_index or {}]
+        return (sum(rows.nbytes for index in indexes for rows in index.values())
+                + self.b_factor.nbytes + self.sasa.nbytes + self.position.nbytes
+                + self.n_rows * self.cache_size)
+
+    def _index_mask(self, index: Dict[str, np.ndarray], names: Iterable[str]) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for name in names:
+            rows = index.get(name)
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+    def name_mask(self, column: str, names: Iterable[str]) -> np.ndarray:
+        """Rows whose ``Chain`` or ``Residue`` is one of the names."""
+        index = self.chain_index if column == 'Chain' else self.residue_index
+        return self._index_mask(index, names)
+
+    def column(self, column: str) -> np.ndarray:
+        """Values of a numeric column, one per row."""
+        return {'B-Factor': self.b_factor, 'SASA': self.sasa, 'Position': self.position}[column]
+
+    def explain(self, query: str) -> List[Dict[str, Any]]:
+        """Time every clause of a residue search, for debugging slow selections."""
+        _, timings = compile_query(query).profile(self)
+        return [{'clause': clause, 'ms': round(seconds * 1e3, 3), 'rows': rows}
+                for clause, seconds, rows in timings]
+
+    def _compile(self, filters: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(self.n_rows, dtype=bool)
+
+        chains = filters.get('chain_filter')
+        if chains:
+            mask &= self._index_mask(self.chain_index, chains)
+
+        query = filters.get('residue_search')
+        if query and query.strip():
+            mask &= compile_query(query).evaluate(self)
+
+        sec_structure = filters.get('sec_structure')
+        if sec_structure and self.sec_structure_index is not None:
+            mask &= self._index_mask(self.sec_structure_index, sec_structure)
+
+        b_range = filters.get('b_factor_range')
+        if b_range is not None:
+            low, high = b_range
+            mask &= (self.b_factor >= low) & (self.b_factor <= high)
+
+        # SASA is only filtered once it has been computed
+        threshold = filters.get('sasa_threshold')
+        if threshold is not None and not np.isnan(self.sasa).all():
+            mask &= self.sasa >= threshold
+
+        near = parse_residue_search(filters.get('near_residues'))
+        interface = filters.get('interface_chains') or ()
+        if near or len(interface) >= 2:
+            mask &= self._spatial_mask(near, interface,
+                                       filters.get('spatial_cutoff') or DEFAULT_SPATIAL_CUTOFF)
+
+        return mask
+
+    def _spatial_mask(self, near: Tuple[str, ...], interface: Sequence[str],
+                      cutoff: float) -> np.ndarray:
+        mask = np.ones(self.n_rows, dtype=bool)
+        if self.structure is None:
+            return mask
+        spatial = get_spatial_index(self.structure)
+        # A partial table (analysis still running) has no row per residue yet
+        if spatial.n_residues != self.n_rows:
+            return mask
+        if near:
+            mask &= spatial.residues_near(near, cutoff)
+        if len(interface) >= 2:
+            mask &= spatial.interface_residues(interface, cutoff)
+        return mask
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Return the (read-only, cached) row mask for a filter dict."""
+        key = filter_key(filters)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+
+        mask = self._compile(filters)
+        mask.setflags(write=False)
+        with self._lock:
+            self._masks[key] = mask
+            if len(self._masks) > self.cache_size:
+                self._masks.popitem(last=False)
+        return mask
+
+    def apply(self, residues: pd.DataFrame, filters: Dict[str, Any]) -> pd.DataFrame:
+        """Filter the residue table this engine was built from."""
+        if not filters:
+            return residues
+        return residues[self.mask(filters)]
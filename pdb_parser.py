@@ -0,0 +1,348 @@
+"""Streaming PDB/mmCIF coordinate parser producing columnar Structure tables."""
+import hashlib
+import io
+import mmap
+import os
+import shlex
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from structure import CodedColumn, Structure
+
+# Size of the text blocks converted to arrays at once. Bounds the temporary
+# buffers independently of the file size.
+BLOCK_BYTES = 8 << 20
+# Number of mmCIF rows tokenized at once.
+CHUNK_LINES = 1 << 16
+
+PDB_LINE_WIDTH = 80
+ATOM_RECORDS = (b'ATOM  ', b'HETATM')
+NEWLINE, CARRIAGE_RETURN, SPACE = ord('\n'), ord('\r'), ord(' ')
+
+# Fixed-column layout of PDB ATOM/HETATM records (0-based, end exclusive).
+PDB_COLUMNS = {
+    'record': (0, 6),
+    'serial': (6, 11),
+    'atom_name': (12, 16),
+    'alt_loc': (16, 17),
+    'res_name': (17, 20),
+    'chain_id': (21, 22),
+    'res_seq': (22, 26),
+    'i_code': (26, 27),
+    'x': (30, 38),
+    'y': (38, 46),
+    'z': (46, 54),
+    'occupancy': (54, 60),
+    'b_factor': (60, 66),
+    'element': (76, 78),
+}
+
+# mmCIF _atom_site items for each column, in order of preference.
+CIF_ITEMS = {
+    'record': ('group_PDB',),
+    'serial': ('id',),
+    'atom_name': ('auth_atom_id', 'label_atom_id'),
+    'alt_loc': ('label_alt_id',),
+    'res_name': ('auth_comp_id', 'label_comp_id'),
+    'chain_id': ('auth_asym_id', 'label_asym_id'),
+    'res_seq': ('auth_seq_id', 'label_seq_id'),
+    'i_code': ('pdbx_PDB_ins_code',),
+    'x': ('Cartn_x',),
+    'y': ('Cartn_y',),
+    'z': ('Cartn_z',),
+    'occupancy': ('occupancy',),
+    'b_factor': ('B_iso_or_equiv',),
+    'element': ('type_symbol',),
+    'model': ('pdbx_PDB_model_num',),
+}
+
+def content_hash(data: Any) -> str:
+    """Hash a bytes-like object (bytes, memoryview, mmap) without copying it."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _to_float(col: np.ndarray, default: float = 0.0) -> np.ndarray:
+    try:
+        return col.astype(np.float32)
+    except ValueError:
+        blank = np.char.strip(col) == b''
+        return np.where(blank, str(default).encode(), col).astype(np.float32)
+
+def _to_int(col: np.ndarray, default: int = 0) -> np.ndarray:
+    try:
+        return col.astype(np.int32)
+    except ValueError:
+        stripped = np.char.strip(col)
+        numeric = np.char.isdigit(np.char.lstrip(stripped, b'-'))
+        return np.where(numeric, stripped, str(default).encode()).astype(np.int32)
+
+class _ColumnBuilder:
+    """Accumulates per-chunk column arrays and concatenates them once."""
+
+    def __init__(self, on_chunk: Optional[Callable[[Dict[str, np.ndarray]], None]] = None):
+        self.chunks: Dict[str, List[np.ndarray]] = {}
+        self.on_chunk = on_chunk
+
+    def add(self, columns: Dict[str, np.ndarray]) -> None:
+        for name, values in columns.items():
+            self.chunks.setdefault(name, []).append(values)
+        if self.on_chunk is not None:
+            self.on_chunk(columns)
+
+    def build(self, name: Optional[str], digest: Optional[str]) -> Structure:
+        def cat(col: str, dtype: Any) -> np.ndarray:
+            # Chunks are released column by column to keep the peak low
+            parts = self.chunks.pop(col, None)
+            if not parts:
+                return np.zeros(0, dtype=dtype)
+            return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+        coords = cat('coords', np.float32)
+        return Structure(
+            record=cat('record', bool),
+            serial=cat('serial', np.int32),
+            atom_name=CodedColumn.encode(cat('atom_name', 'S4')),
+            res_name=CodedColumn.encode(cat('res_name', 'S3')),
+            chain_id=CodedColumn.encode(cat('chain_id', 'S1')),
+            res_seq=cat('res_seq', np.int32),
+            i_code=cat('i_code', 'S1'),
+            coords=coords.reshape(-1, 3),
+            occupancy=cat('occupancy', np.float32),
+            b_factor=cat('b_factor', np.float32),
+            element=CodedColumn.encode(cat('element', 'S2')),
+            name=name,
+            content_hash=digest,
+        )
+
+def _first_alt_loc(alt_loc: np.ndarray) -> np.ndarray:
+    """Mask keeping atoms without alternate locations or with the first one."""
+    return (alt_loc == b'') | (alt_loc == b' ') | (alt_loc == b'.') | (alt_loc == b'A') | (alt_loc == b'1')
+
+def _pdb_block(block: bytes, fields: Optional[Sequence[str]] = None) -> Tuple[Dict[str, np.ndarray], bool]:
+    """Convert a newline-terminated block of PDB text into column arrays.
+
+    Returns the columns (all, or only ``fields``) of the ATOM/HETATM records
+    in the block and whether an ENDMDL record was seen (only the first
+    model is kept).
+    """
+    raw = np.frombuffer(block, dtype=np.uint8)
+    newlines = np.flatnonzero(raw == NEWLINE)
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.append(newlines, raw.size)
+    if starts[-1] >= raw.size:
+        starts, ends = starts[:-1], ends[:-1]
+    # Pad so every fixed-width field can be gathered without bounds checks
+    padded = np.concatenate((raw, np.full(PDB_LINE_WIDTH, SPACE, dtype=np.uint8)))
+
+    # Drop carriage returns of CRLF files by shortening the line
+    ends = ends - (padded[np.maximum(ends - 1, 0)] == CARRIAGE_RETURN)
+
+    def gather(line_starts: np.ndarray, line_ends: np.ndarray, start: int, end: int) -> np.ndarray:
+        offsets = np.arange(start, end, dtype=np.intp)
+        chars = padded[line_starts[:, None] + offsets]
+        short = np.flatnonzero(line_ends - line_starts < end)
+        if short.size:
+            lengths = line_ends[short] - line_starts[short]
+            rows = chars[short]
+            rows[offsets >= lengths[:, None]] = SPACE
+            chars[short] = rows
+        return chars.view(f'S{end - start}').ravel()
+
+    record = gather(starts, ends, *PDB_COLUMNS['record'])
+    end_model = np.flatnonzero(record == b'ENDMDL')
+    if end_model.size:
+        cut = end_model[0]
+        starts, ends, record = starts[:cut], ends[:cut], record[:cut]
+    is_atom = (record == ATOM_RECORDS[0]) | (record == ATOM_RECORDS[1])
+    starts, ends = starts[is_atom], ends[is_atom]
+
+    def field(name: str) -> np.ndarray:
+        return gather(starts, ends, *PDB_COLUMNS[name])
+
+    def coordinates() -> np.ndarray:
+        coords = np.empty((starts.size, 3), dtype=np.float32)
+        coords[:, 0] = _to_float(field('x'))
+        coords[:, 1] = _to_float(field('y'))
+        coords[:, 2] = _to_float(field('z'))
+        return coords
+
+    keep = _first_alt_loc(field('alt_loc'))
+    converters: Dict[str, Callable[[], np.ndarray]] = {
+        'record': lambda: field('record') == b'HETATM',
+        'serial': lambda: _to_int(field('serial')),
+        'atom_name': lambda: np.char.strip(field('atom_name')),
+        'res_name': lambda: np.char.strip(field('res_name')),
+        'chain_id': lambda: field('chain_id'),
+        'res_seq': lambda: _to_int(field('res_seq')),
+        'i_code': lambda: field('i_code'),
+        'coords': coordinates,
+        'occupancy': lambda: _to_float(field('occupancy'), 1.0),
+        'b_factor': lambda: _to_float(field('b_factor')),
+        'element': lambda: np.char.strip(field('element')),
+    }
+    columns = {name: convert() for name, convert in converters.items()
+               if fields is None or name in fields}
+    if not keep.all():
+        columns = {k: v[keep] for k, v in columns.items()}
+    return columns, bool(end_model.size)
+
+def _parse_pdb_blocks(blocks: Iterable[bytes], builder: _ColumnBuilder) -> None:
+    for block in blocks:
+        columns, last_model_done = _pdb_block(block)
+        if columns['coords'].size:
+            builder.add(columns)
+        if last_model_done:
+            break
+
+def parse_pdb_coords(block: bytes) -> np.ndarray:
+    """Coordinates of the ATOM/HETATM records of one PDB model's text.
+
+    Used for trajectory frames, whose other columns repeat the topology.
+    """
+    return _pdb_block(block, ('coords',))[0]['coords']
+
+def _cif_tokens(line: bytes) -> List[bytes]:
+    if b'"' in line or b"'" in line:
+        return [tok.encode() for tok in shlex.split(line.decode(), posix=True)]
+    return line.split()
+
+def _cif_chunk(rows: List[List[bytes]], index: Dict[str, int]) -> Dict[str, np.ndarray]:
+    table = np.array(rows, dtype=bytes)
+
+    def field(name: str, default: bytes = b'') -> np.ndarray:
+        if name not in index:
+            return np.full(len(rows), default, dtype=bytes)
+        col = table[:, index[name]]
+        return np.where((col == b'?') | (col == b'.'), default, col)
+
+    keep = _first_alt_loc(field('alt_loc'))
+    coords = np.empty((len(rows), 3), dtype=np.float32)
+    coords[:, 0] = _to_float(field('x'))
+    coords[:, 1] = _to_float(field('y'))
+    coords[:, 2] = _to_float(field('z'))
+    columns = {
+        'record': field('record', b'ATOM') == b'HETATM',
+        'serial': _to_int(field('serial', b'0')),
+        'atom_name': field('atom_name'),
+        'res_name': field('res_name'),
+        'chain_id': field('chain_id'),
+        'res_seq': _to_int(field('res_seq', b'0')),
+        'i_code': field('i_code', b' '),
+        'coords': coords,
+        'occupancy': _to_float(field('occupancy', b'1'), 1.0),
+        'b_factor': _to_float(field('b_factor', b'0')),
+        'element': field('element'),
+    }
+    if not keep.all():
+        columns = {k: v[keep] for k, v in columns.items()}
+    return columns
+
+def _cif_index(items: List[str]) -> Dict[str, int]:
+    index = {}
+    for col, candidates in CIF_ITEMS.items():
+        for item in candidates:
+            if item in items:
+                index[col] = items.index(item)
+                break
+    return index
+
+def _parse_cif_lines(lines: Iterable[bytes], builder: _ColumnBuilder) -> None:
+    items: List[str] = []
+    index: Optional[Dict[str, int]] = None
+    in_loop = False
+    first_model = None
+    rows: List[List[bytes]] = []
+    for raw in lines:
+        line = raw.strip()
+        if index is not None:
+            if line.startswith((b'#', b'_', b'loop_', b'data_')):
+                break
+            tokens = _cif_tokens(line)
+            if len(tokens) != len(items):
+                continue
+            if 'model' in index:
+                # Only the first model is kept
+                model = tokens[index['model']]
+                if first_model is None:
+                    first_model = model
+                elif model != first_model:
+                    break
+            rows.append(tokens)
+            if len(rows) >= CHUNK_LINES:
+                builder.add(_cif_chunk(rows, index))
+                rows = []
+        elif line == b'loop_':
+            in_loop, items = True, []
+        elif in_loop and line.startswith(b'_atom_site.'):
+            items.append(line[len(b'_atom_site.'):].decode())
+        elif in_loop and items and line and not line.startswith(b'#'):
+            index = _cif_index(items)
+            tokens = _cif_tokens(line)
+            if len(tokens) == len(items):
+                if 'model' in index:
+                    first_model = tokens[index['model']]
+                rows.append(tokens)
+        else:
+            in_loop = False
+    if rows:
+        builder.add(_cif_chunk(rows, index))
+
+def _looks_like_cif(name: Optional[str], head: bytes) -> bool:
+    if name:
+        lowered = name.lower()
+        if lowered.endswith(('.cif', '.mmcif')):
+            return True
+        if lowered.endswith(('.pdb', '.ent')):
+            return False
+    return head.lstrip().startswith(b'data_')
+
+def _iter_lines(buffer: Any) -> Iterator[bytes]:
+    """Yield lines from a readable binary stream or mmap."""
+    return iter(buffer.readline, b'')
+
+def _iter_blocks(buffer: Any, size: int = BLOCK_BYTES) -> Iterator[bytes]:
+    """Yield roughly ``size``-byte blocks that always end on a line boundary."""
+    while True:
+        block = buffer.read(size)
+        if not block:
+            return
+        if not block.endswith(b'\n'):
+            block += buffer.readline()
+        yield block
+
+def parse_buffer(buffer: Any, name: Optional[str] = None, digest: Optional[str] = None,
+                 on_chunk: Optional[Callable[[Dict[str, np.ndarray]], None]] = None) -> Structure:
+    """Parse a PDB or mmCIF file held in bytes, a binary stream or an mmap.
+
+    The text is consumed in bounded blocks (PDB) or line by line (mmCIF) and
+    converted to column arrays chunk by chunk, so peak memory tracks the
+    coordinate arrays rather than the text size. ``on_chunk`` is called
+    with the columns of every chunk as it is converted.
+    """
+    if isinstance(buffer, (bytes, bytearray, memoryview)):
+        buffer = io.BytesIO(buffer)
+    head = buffer.read(256)
+    buffer.seek(0)
+    builder = _ColumnBuilder(on_chunk)
+    if _looks_like_cif(name, head):
+        _parse_cif_lines(_iter_lines(buffer), builder)
+    else:
+        _parse_pdb_blocks(_iter_blocks(buffer), builder)
+    return builder.build(name, digest)
+
+def parse_file(path: str) -> Structure:
+    """Parse a structure file from disk through a read-only memory map."""
+    name = os.path.basename(path)
+    if os.path.getsize(path) == 0:
+        return _ColumnBuilder().build(name, content_hash(b''))
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        digest = content_hash(mm)
+        return parse_buffer(mm, name=name, digest=digest)
+
+def parse_upload(upload: Any, digest: Optional[str] = None) -> Structure:
+    """Parse a Streamlit ``UploadedFile`` (or any BytesIO-like object)."""
+    upload.seek(0)
+    if digest is None:
+        digest = content_hash(upload.getbuffer())
+    try:
+        return parse_buffer(upload, name=getattr(upload, 'name', None), digest=digest)
+    finally:
+        upload.seek(0)
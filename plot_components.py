@@ -0,0 +1,247 @@
+"""Plotly chart component, imported on first use of a plot."""
+from typing import Any, Dict, Optional
+import streamlit as st
+import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+from filter_engine import filter_key
+from plot_decimation import density_grid, minmax_indices, sample_indices
+from spatial_index import CONTACT_CUTOFF, get_spatial_index
+from structure_cache import get_cache
+from ui_components import OVERLAY_PLOTS, UIComponent
+
+class Plot(UIComponent):
+    # Above ``threshold`` points a plot switches to its large-data path and
+    # sends at most ``max_points`` points (or a ``bins`` x ``bins`` density
+    # grid) to the browser. Override per plot with "large_data" in the config.
+    LARGE_DATA_DEFAULTS = {
+        'threshold': 20000,
+        'max_points': 5000,
+        'mode': 'webgl',
+        'bins': 72,
+    }
+    # Residue-table labels and their display names in the distribution plot
+    SECONDARY_STRUCTURE_LABELS = {'Helix': 'α-Helix', 'Sheet': 'β-Sheet', 'Loop': 'Loops'}
+    # Plot types computed over all frames when a trajectory is loaded
+    TRAJECTORY_PLOTS = ('ramachandran', 'rmsf')
+    OVERLAY_PLOTS = OVERLAY_PLOTS
+
+    def _ramachandran_heatmap(self, phi_centers: np.ndarray, psi_centers: np.ndarray,
+                              counts: np.ndarray, title: str = 'Ramachandran Plot') -> go.Figure:
+        fig = go.Figure(go.Heatmap(x=phi_centers, y=psi_centers,
+                                   z=np.where(counts > 0, counts, np.nan),
+                                   colorscale='Viridis', colorbar={'title': 'Residues'}))
+        fig.update_layout(title=title, xaxis_title='Phi (°)', yaxis_title='Psi (°)')
+        return fig
+
+    def _ramachandran_density(self, df: pd.DataFrame, bins: int) -> go.Figure:
+        """Ramachandran plot as a server-side 2D histogram."""
+        return self._ramachandran_heatmap(*density_grid(df['phi'].to_numpy(), df['psi'].to_numpy(), bins))
+
+    def _render_trajectory(self, data_type: str, job: Any) -> Any:
+        """Plots aggregated over the frames of the loaded trajectory."""
+        if data_type == 'ramachandran':
+            # Dihedral histogram accumulated window by window
+            fig = self._ramachandran_heatmap(*job.ramachandran(),
+                                             title=f'Ramachandran Plot ({job.n_frames:,} frames)')
+            fig.add_hline(y=0, line_dash="dash", line_color="gray")
+            fig.add_vline(x=0, line_dash="dash", line_color="gray")
+        else:
+            table = job.residue_table()
+            fig = px.line(pd.DataFrame({'Residue': table['Position'].to_numpy(),
+                                        'RMSF (Å)': table['RMSF'].to_numpy(),
+                                        'Chain': table['Chain'].astype(str).to_numpy()}),
+                          x='Residue', y='RMSF (Å)', color='Chain',
+                          title=f'RMSF over {job.n_frames:,} frames')
+        return st.plotly_chart(fig, use_container_width=True)
+
+    def _render_contact_map(self, config: Dict[str, Any]) -> Any:
+        """CA-CA contacts among the filtered residues, found with the spatial index."""
+        structure = st.session_state.get('structure')
+        residues = self._get_protein_data()
+        if structure is None or residues is None or 'analysis_job' in st.session_state:
+            return None
+        cutoff = float(config['data'].get('cutoff', CONTACT_CUTOFF))
+        # Pairs of the whole structure are shared; filters only pick rows
+        first, second = get_cache().get_or_compute(
+            st.session_state.structure_hash, ('contact_pairs', cutoff),
+            lambda: get_spatial_index(structure).contact_pairs(cutoff))
+        selected = np.zeros(len(st.session_state.protein_data), dtype=bool)
+        selected[residues.index.to_numpy()] = True
+        keep = selected[first] & selected[second]
+        # Both halves of the symmetric map
+        x = np.concatenate([first[keep], second[keep]])
+        y = np.concatenate([second[keep], first[keep]])
+        title = f'Contact Map (CA-CA < {cutoff:g} Å, {int(keep.sum()):,} contacts)'
+        large_data = {**self.LARGE_DATA_DEFAULTS, **config.get('large_data', {})}
+        if len(x) > large_data['threshold']:
+            x_centers, y_centers, counts = density_grid(x, y, large_data['bins'],
+                                                        (0, len(selected)))
+            fig = go.Figure(go.Heatmap(x=x_centers, y=y_centers,
+                                       z=np.where(counts > 0, counts, np.nan),
+                                       colorscale='Viridis', colorbar={'title': 'Contacts'}))
+        else:
+            fig = go.Figure(go.Scattergl(x=x, y=y, mode='markers', marker={'size': 3}))
+        fig.update_layout(title=title, xaxis_title='Residue index', yaxis_title='Residue index')
+        fig.update_yaxes(autorange='reversed')
+        return st.plotly_chart(fig, use_container_width=True)
+
+    def _generate_plot_data(self, plot_type: str) -> pd.DataFrame:
+        """Generate sample data for different plot types."""
+        if plot_type == 'ramachandran':
+            n_points = 1000
+            phi = np.random.normal(-60, 30, n_points)
+            psi = np.random.normal(-45, 30, n_points)
+            return pd.DataFrame({'phi': phi, 'psi': psi})
+            
+        elif plot_type == 'secondary_structure':
+            structures = ['α-Helix', 'β-Sheet', 'Loops', '310-Helix', 'β-Turn']
+            percentages = [45, 32, 23, 5, 4]
+            return pd.DataFrame({'Structure': structures, 'Percentage': percentages})
+            
+        elif plot_type == 'bfactor_distribution':
+            residues = range(1, 201)
+            bfactors = np.random.normal(50, 15, 200)
+            bfactors = np.convolve(bfactors, np.ones(5)/5, mode='same')
+            return pd.DataFrame({'Residue': residues, 'B-factor': bfactors})
+            
+        elif plot_type == 'hydropathy':
+            residues = range(1, 201)
+            hydropathy = np.sin(np.array(residues)/10) * 2 + np.random.normal(0, 0.5, 200)
+            return pd.DataFrame({'Residue': residues, 'Hydropathy': hydropathy})
+            
+        elif plot_type == 'aa_composition':
+            aa_list = ['ALA', 'CYS', 'ASP', 'GLU', 'PHE', 'GLY', 'HIS', 'ILE', 'LYS', 'LEU']
+            counts = np.random.randint(5, 25, len(aa_list))
+            return pd.DataFrame({'Amino Acid': aa_list, 'Count': counts})
+            
+        return pd.DataFrame()
+
+    def _protein_plot_data(self, plot_type: str, residues: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """Derive plot data from the filtered residue table, if supported."""
+        if plot_type == 'ramachandran':
+            angles = residues[['phi', 'psi']].dropna()
+            return pd.DataFrame({'phi': angles['phi'].to_numpy(), 'psi': angles['psi'].to_numpy()})
+            
+        elif plot_type == 'secondary_structure':
+            counts = residues['Secondary Structure'].value_counts()
+            percentages = counts.reindex(list(self.SECONDARY_STRUCTURE_LABELS), fill_value=0)
+            if len(residues):
+                percentages = (percentages * 100 / len(residues)).round(1)
+            return pd.DataFrame({'Structure': list(self.SECONDARY_STRUCTURE_LABELS.values()),
+                                 'Percentage': percentages.to_numpy()})
+            
+        elif plot_type == 'bfactor_distribution':
+            return pd.DataFrame({'Residue': residues['Position'].to_numpy(),
+                                 'B-factor': residues['B-Factor'].to_numpy()})
+            
+        elif plot_type == 'hydropathy':
+            return pd.DataFrame({'Residue': residues['Position'].to_numpy(),
+                                 'Hydropathy': residues['Hydropathy'].to_numpy()})
+            
+        elif plot_type == 'aa_composition':
+            counts = residues['Residue'].value_counts().sort_index()
+            counts = counts[counts > 0]
+            return pd.DataFrame({'Amino Acid': counts.index.astype(str), 'Count': counts.to_numpy()})
+            
+        return None
+
+    def _render_overlay(self, config: Dict[str, Any], data_type: str) -> Any:
+        """One profile line per model of the batch comparison."""
+        table = st.session_state.get('batch_table')
+        if table is None or not len(table):
+            return None
+        column, label, title = self.OVERLAY_PLOTS[data_type]
+        large_data = {**self.LARGE_DATA_DEFAULTS, **config.get('large_data', {})}
+        is_large = len(table) > large_data['threshold']
+        models = table['Model']
+        rows = np.arange(len(table))
+        if is_large:
+            # Models are stacked contiguously; decimate each one separately
+            # so every profile keeps its share of the point budget
+            codes = models.cat.codes.to_numpy()
+            starts = np.flatnonzero(np.diff(codes, prepend=-1))
+            stops = np.append(starts[1:], len(codes))
+            budget = max(4, large_data['max_points'] // len(starts))
+            values = table[column].to_numpy()
+            rows = np.concatenate([start + minmax_indices(values[start:stop], budget)
+                                   for start, stop in zip(starts, stops)])
+        df = pd.DataFrame({'Model': models.to_numpy()[rows],
+                           'Residue': table['Position'].to_numpy()[rows],
+                           label: table[column].to_numpy()[rows]})
+        fig = px.line(df, x='Residue', y=label, color='Model', title=title,
+                      render_mode='webgl' if is_large else 'auto')
+        if data_type == 'hydropathy':
+            fig.add_hline(y=0, line_dash="dash", line_color="gray")
+        return st.plotly_chart(fig, use_container_width=True)
+
+    def render(self, config: Dict[str, Any]) -> Any:
+        plot_type = config['plot_type']
+        data_type = config['data']['type']
+        if config['data'].get('source') == 'batch':
+            return self._render_overlay(config, data_type)
+        job = st.session_state.get('trajectory_analysis')
+        if data_type in self.TRAJECTORY_PLOTS and job is not None and job.error is None:
+            return self._render_trajectory(data_type, job)
+        if data_type == 'rmsf':
+            # Only defined for trajectories
+            return None
+        if data_type == 'contact_map':
+            return self._render_contact_map(config)
+        
+        df = None
+        residues = self._get_protein_data()
+        if residues is not None and 'analysis_job' in st.session_state:
+            # Partial results while the analysis runs are not worth caching
+            df = self._protein_plot_data(data_type, residues)
+        elif residues is not None:
+            # Plot data is shared across sessions per structure and filter set
+            artifact = ('plot', data_type, filter_key(st.session_state.get('current_filters', {})))
+            df = get_cache().get_or_compute(st.session_state.structure_hash, artifact,
+                                            lambda: self._protein_plot_data(data_type, residues))
+        if df is None:
+            df = self._generate_plot_data(data_type)
+        
+        large_data = {**self.LARGE_DATA_DEFAULTS, **config.get('large_data', {})}
+        is_large = len(df) > large_data['threshold']
+        
+        if data_type == 'ramachandran':
+            if is_large and large_data['mode'] == 'density':
+                fig = self._ramachandran_density(df, large_data['bins'])
+            else:
+                if is_large:
+                    df = df.iloc[sample_indices(len(df), large_data['max_points'])]
+                fig = px.scatter(df, x='phi', y='psi', 
+                               title='Ramachandran Plot',
+                               labels={'phi': 'Phi (°)', 'psi': 'Psi (°)'},
+                               render_mode='webgl' if is_large else 'auto')
+            fig.add_hline(y=0, line_dash="dash", line_color="gray")
+            fig.add_vline(x=0, line_dash="dash", line_color="gray")
+            
+        elif data_type == 'secondary_structure':
+            fig = px.bar(df, x='Structure', y='Percentage',
+                        title='Secondary Structure Distribution')
+            
+        elif data_type == 'bfactor_distribution':
+            if is_large:
+                df = df.iloc[minmax_indices(df['B-factor'].to_numpy(), large_data['max_points'])]
+            fig = px.line(df, x='Residue', y='B-factor',
+                         title='B-factor Distribution',
+                         render_mode='webgl' if is_large else 'auto')
+            
+        elif data_type == 'hydropathy':
+            if is_large:
+                df = df.iloc[minmax_indices(df['Hydropathy'].to_numpy(), large_data['max_points'])]
+            fig = px.line(df, x='Residue', y='Hydropathy',
+                         title='Hydropathy Plot',
+                         render_mode='webgl' if is_large else 'auto')
+            fig.add_hline(y=0, line_dash="dash", line_color="gray")
+            
+        elif data_type == 'aa_composition':
+            fig = px.bar(df, x='Amino Acid', y='Count',
+                        title='Amino Acid Composition')
+        else:
+            return None
+            
+        return st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,44 @@
+"""Point-count reduction for plots of large residue and angle datasets."""
+from typing import Tuple
+import numpy as np
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of a min/max-preserving subsample of a series.
+
+    The series is split into equal buckets and the minimum and maximum of
+    every bucket are kept, so peaks and troughs survive even when most points
+    are dropped. First and last points are always kept and the result never
+    exceeds ``max_points``.
+    """
+    n = len(y)
+    if n <= max_points or max_points < 4:
+        return np.arange(n)
+    bucket = int(np.ceil(n / ((max_points - 2) // 2)))
+    n_buckets = int(np.ceil(n / bucket))
+    values = np.asarray(y, dtype=np.float64)
+    low = np.full(n_buckets * bucket, np.inf)
+    high = np.full(n_buckets * bucket, -np.inf)
+    finite = np.isfinite(values)
+    low[:n] = np.where(finite, values, np.inf)
+    high[:n] = np.where(finite, values, -np.inf)
+    offsets = np.arange(n_buckets) * bucket
+    min_idx = offsets + low.reshape(n_buckets, bucket).argmin(axis=1)
+    max_idx = offsets + high.reshape(n_buckets, bucket).argmax(axis=1)
+    keep = np.concatenate(([0, n - 1], min_idx, max_idx))
+    return np.unique(keep[keep < n])
+
+def sample_indices(n: int, max_points: int, seed: int = 0) -> np.ndarray:
+    """Sorted, reproducible random subsample of ``max_points`` out of ``n`` indices."""
+    if n <= max_points:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n, size=max_points, replace=False))
+
+def density_grid(x: np.ndarray, y: np.ndarray, bins: int,
+                 value_range: Tuple[float, float] = (-180.0, 180.0)
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """2D histogram of (x, y) returned as (x centers, y centers, counts[y, x])."""
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins, range=[value_range, value_range])
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    return x_centers, y_centers, counts.T
@@ -0,0 +1,219 @@
+"""Per-component render timing, allocation and payload instrumentation.
+
+Profiling is off unless ``UI_PROFILE`` is set: ``1`` profiles every
+session, ``query`` only sessions opened with ``?profile=1``. Allocations
+are traced only while a profiled run is in progress.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import streamlit as st
+from streamlit.delta_generator import DeltaGenerator
+from atomic_write import write_text_atomic
+
+PROFILE_ENV = 'UI_PROFILE'
+PROFILE_LOG_ENV = 'UI_PROFILE_LOG_PATH'
+PROFILE_METRICS_ENV = 'UI_PROFILE_METRICS_PATH'
+
+# Query parameter that turns profiling on for one browser session, when
+# the deployment allows it with UI_PROFILE=query
+PROFILE_QUERY_PARAM = 'profile'
+PROFILE_QUERY_MODE = 'query'
+SESSION_KEY = '_ui_render_profiler'
+
+class RenderStats:
+    """Process-wide totals per component, exported in Prometheus text format."""
+
+    def __init__(self):
+        self._totals: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            totals = self._totals.setdefault((record['key'], record['type']), {
+                'renders': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                'alloc_bytes': 0, 'payload_bytes': 0})
+            totals['renders'] += 1
+            totals['wall_seconds'] += record['wall_ms'] / 1000
+            totals['cpu_seconds'] += record['cpu_ms'] / 1000
+            totals['alloc_bytes'] += max(record['alloc_bytes'], 0)
+            totals['payload_bytes'] += record['payload_bytes']
+
+    def metrics_text(self, prefix: str = 'ui_render') -> str:
+        """Render the per-component counters in the Prometheus text format."""
+        with self._lock:
+            totals = {labels: dict(values) for labels, values in self._totals.items()}
+        lines = []
+        for name in ('renders', 'wall_seconds', 'cpu_seconds', 'alloc_bytes', 'payload_bytes'):
+            metric = f'{prefix}_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            for (key, component_type), values in sorted(totals.items()):
+                lines.append(f'{metric}{{key="{key}",type="{component_type}"}} {values[name]:g}')
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self, path: str) -> None:
+        """Export the per-component totals to ``path`` for the textfile collector."""
+        write_text_atomic(path, self.metrics_text())
+
+_stats = RenderStats()
+_log_lock = threading.Lock()
+
+# Profiled runs in progress in any session; tracemalloc runs while there are any
+_tracing_runs = 0
+_tracing_started = False
+_tracing_lock = threading.Lock()
+
+def _start_tracing() -> None:
+    global _tracing_runs, _tracing_started
+    with _tracing_lock:
+        if _tracing_runs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_runs += 1
+
+def _stop_tracing() -> None:
+    """End a profiled run, stopping tracemalloc after the last one if we started it."""
+    global _tracing_runs, _tracing_started
+    with _tracing_lock:
+        _tracing_runs -= 1
+        if _tracing_runs == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+def payload_size(value: Any) -> int:
+    """Approximate bytes of the data a node returned.
+
+    Counts bytes and text (e.g. an encoded structure), arrays and data
+    frames; rendered elements carry no size and count as zero.
+    """
+    if value is None or isinstance(value, DeltaGenerator):
+        # Its attributes are Streamlit commands, not data
+        return 0
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode())
+    if type(value).__name__ == 'Styler':
+        value = value.data
+    usage = getattr(value, 'memory_usage', None)
+    if callable(usage):
+        try:
+            total = usage(deep=True)
+        except TypeError:
+            return 0
+        return int(total.sum()) if hasattr(total, 'sum') else int(total)
+    nbytes = getattr(value, 'nbytes', None)
+    return nbytes if isinstance(nbytes, int) else 0
+
+def get_render_stats() -> RenderStats:
+    """Return the process-wide render totals shared by all sessions."""
+    return _stats
+
+class RenderProfiler:
+    """Records wall time, CPU time, allocations and payload per rendered node.
+
+    Measurements are inclusive: a container's numbers include its children,
+    which are recorded too with a larger ``depth``. CPU time is the script
+    thread's; allocations are the net change in memory traced by tracemalloc
+    and so also see other threads allocating at the same time. Payload is
+    the :func:`payload_size` of the data the node returned.
+    """
+
+    def __init__(self):
+        self.run_id = 0
+        self.run_kind = 'full'
+        self.records: List[Dict[str, Any]] = []
+        self._depth = 0
+        self._in_full_run = False
+
+    def _begin(self, kind: str) -> None:
+        self.run_id += 1
+        self.run_kind = kind
+        self.records = []
+        _start_tracing()
+
+    def _end(self) -> None:
+        _stop_tracing()
+        self._flush()
+
+    def start_run(self) -> None:
+        """Start a full app run; fragment reruns start their own runs."""
+        self._begin('full')
+        self._in_full_run = True
+
+    def end_run(self) -> None:
+        self._in_full_run = False
+        self._end()
+
+    def measure(self, config: Dict[str, Any], render: Callable[[], Any]) -> Any:
+        """Render one node, recording its cost."""
+        if self._depth == 0 and not self._in_full_run:
+            self._begin('fragment')
+        record = {
+            'run': self.run_id,
+            'kind': self.run_kind,
+            'key': config.get('key') or config.get('label') or '',
+            'type': config['type'],
+            'depth': self._depth,
+        }
+        self.records.append(record)
+        traced, _ = tracemalloc.get_traced_memory()
+        cpu = time.thread_time()
+        wall = time.perf_counter()
+        self._depth += 1
+        result = None
+        try:
+            result = render()
+            return result
+        finally:
+            self._depth -= 1
+            record['wall_ms'] = (time.perf_counter() - wall) * 1000
+            record['cpu_ms'] = (time.thread_time() - cpu) * 1000
+            record['alloc_bytes'] = tracemalloc.get_traced_memory()[0] - traced
+            record['payload_bytes'] = payload_size(result)
+            record['timestamp'] = time.time()
+            if self._depth == 0 and not self._in_full_run:
+                self._end()
+
+    def _flush(self) -> None:
+        """Publish the current run's records to the metrics and the JSONL log."""
+        for record in self.records:
+            _stats.observe(record)
+        log_path = os.environ.get(PROFILE_LOG_ENV)
+        if log_path and self.records:
+            lines = ''.join(json.dumps(record) + '\n' for record in self.records)
+            with _log_lock, open(log_path, 'a') as f:
+                f.write(lines)
+        metrics_path = os.environ.get(PROFILE_METRICS_ENV)
+        if metrics_path:
+            _stats.write_metrics(metrics_path)
+
+    def render_overlay(self) -> None:
+        """Show the last run's records, slowest first."""
+        with st.expander(f"⏱️ Render profile (run {self.run_id}, {self.run_kind})"):
+            if not self.records:
+                st.caption("No components rendered.")
+                return
+            # Only profiled sessions pay for pandas
+            import pandas as pd
+            df = pd.DataFrame(self.records).drop(columns=['run', 'kind', 'timestamp'])
+            st.dataframe(df.sort_values('wall_ms', ascending=False).round(2),
+                         use_container_width=True, hide_index=True)
+
+def profiling_enabled() -> bool:
+    """Profiling is on for every session, or per session via ``?profile=1`` where allowed."""
+    mode = os.environ.get(PROFILE_ENV, '').lower()
+    if mode in ('1', 'true', 'yes'):
+        return True
+    return mode == PROFILE_QUERY_MODE and st.query_params.get(PROFILE_QUERY_PARAM) == '1'
+
+def get_profiler() -> Optional[RenderProfiler]:
+    """Return this session's profiler, or None when profiling is off."""
+    if not profiling_enabled():
+        return None
+    if SESSION_KEY not in st.session_state:
+        st.session_state[SESSION_KEY] = RenderProfiler()
+    return st.session_state[SESSION_KEY]
@@ -0,0 +1,325 @@
+"""Selection language for the residue search box, compiled into query plans.
+
+::
+
+    ALA, GLY                   residue names (bare names, as before)
+    resname HIS TRP            residue names, explicitly
+    resi 10-50, 80             residue numbers and ranges
+    chain A B                  chain IDs
+    bfactor > 40, sasa <= 20   numeric predicates (< <= > >= = !=)
+    not, and, or, ( )          boolean operators; ``and`` binds tighter
+
+Clauses written next to each other, or separated by commas or semicolons,
+are combined with ``and``; lists run until the next keyword, operator or
+parenthesis, e.g.
+``chain A and resi 10-50 or not (bfactor > 60 or sasa < 5)``.
+
+A query is parsed once into a :class:`QueryPlan`; plans are cached by
+query string and shared by every session. Evaluating a plan combines one
+boolean mask per clause, computed by the selection source (the filter
+engine) from its per-name indexes and column arrays.
+"""
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+PLAN_CACHE_SIZE = 256
+
+# Numeric columns of the residue table usable in predicates
+NUMERIC_FIELDS = {'bfactor': 'B-Factor', 'sasa': 'SASA'}
+NAME_FIELDS = {'resname': 'Residue', 'resn': 'Residue', 'chain': 'Chain'}
+RANGE_FIELDS = {'resi': 'Position', 'resseq': 'Position'}
+OPERATORS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+             '=': np.equal, '==': np.equal, '!=': np.not_equal}
+KEYWORDS = {'and', 'or', 'not'} | set(NUMERIC_FIELDS) | set(NAME_FIELDS) | set(RANGE_FIELDS)
+
+TOKEN = re.compile(r'\s*(?:(<=|>=|==|!=|[<>=(),;:-])|(\d+(?:\.\d+)?)(?![\w.])|([\w\'*]+))')
+
+class QueryError(ValueError):
+    """Raised for a selection query that does not parse."""
+
+    def __init__(self, message: str, query: str, position: int):
+        super().__init__(f"{message} at position {position + 1}: {query!r}")
+        self.position = position
+
+class Node(ABC):
+    """A node of a query plan."""
+
+    @abstractmethod
+    def evaluate(self, source: Any, timings: Optional[List[Tuple[str, float, int]]]) -> np.ndarray:
+        """Return the node's row mask, appending per-clause timings if given."""
+        pass
+
+class Clause(Node):
+    """Leaf predicate; its mask comes from the selection source."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    @abstractmethod
+    def mask(self, source: Any) -> np.ndarray:
+        """Return the clause's row mask over the source."""
+        pass
+
+    def evaluate(self, source: Any, timings: Optional[List[Tuple[str, float, int]]]) -> np.ndarray:
+        if timings is None:
+            return self.mask(source)
+        start = time.perf_counter()
+        mask = self.mask(source)
+        timings.append((self.text, time.perf_counter() - start, int(np.count_nonzero(mask))))
+        return mask
+
+class NameClause(Clause):
+    def __init__(self, text: str, column: str, names: Sequence[str]):
+        super().__init__(text)
+        self.column = column
+        self.names = tuple(names)
+
+    def mask(self, source: Any) -> np.ndarray:
+        return source.name_mask(self.column, self.names)
+
+class RangeClause(Clause):
+    def __init__(self, text: str, column: str, ranges: Sequence[Tuple[int, int]]):
+        super().__init__(text)
+        self.column = column
+        self.ranges = tuple(ranges)
+
+    def mask(self, source: Any) -> np.ndarray:
+        values = source.column(self.column)
+        mask = np.zeros(len(values), dtype=bool)
+        for low, high in self.ranges:
+            mask |= (values >= low) & (values <= high)
+        return mask
+
+class CompareClause(Clause):
+    def __init__(self, text: str, column: str, operator: str, value: float):
+        super().__init__(text)
+        self.column = column
+        self.operator = operator
+        self.value = value
+
+    def mask(self, source: Any) -> np.ndarray:
+        # NaN (e.g. SASA not computed yet) never matches
+        return OPERATORS[self.operator](source.column(self.column), self.value)
+
+class Not(Node):
+    def __init__(self, child: Node):
+        self.child = child
+
+    def evaluate(self, source: Any, timings: Optional[List[Tuple[str, float, int]]]) -> np.ndarray:
+        return ~self.child.evaluate(source, timings)
+
+class And(Node):
+    def __init__(self, children: Sequence[Node]):
+        self.children = tuple(children)
+
+    def evaluate(self, source: Any, timings: Optional[List[Tuple[str, float, int]]]) -> np.ndarray:
+        mask = self.children[0].evaluate(source, timings)
+        for child in self.children[1:]:
+            mask = mask & child.evaluate(source, timings)
+        return mask
+
+class Or(Node):
+    def __init__(self, children: Sequence[Node]):
+        self.children = tuple(children)
+
+    def evaluate(self, source: Any, timings: Optional[List[Tuple[str, float, int]]]) -> np.ndarray:
+        mask = self.children[0].evaluate(source, timings)
+        for child in self.children[1:]:
+            mask = mask | child.evaluate(source, timings)
+        return mask
+
+class QueryPlan:
+    """A parsed query, evaluated into a row mask over a selection source.
+
+    The source provides ``name_mask(column, names)`` and ``column(name)``
+    for residue-table column names.
+    """
+
+    def __init__(self, query: str, root: Node):
+        self.query = query
+        self.root = root
+
+    def evaluate(self, source: Any) -> np.ndarray:
+        return self.root.evaluate(source, None)
+
+    def profile(self, source: Any) -> Tuple[np.ndarray, List[Tuple[str, float, int]]]:
+        """Evaluate, also returning (clause, seconds, rows selected) per clause."""
+        timings: List[Tuple[str, float, int]] = []
+        return self.root.evaluate(source, timings), timings
+
+class _Parser:
+    """Recursive-descent parser over the query's tokens."""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.tokens = list(self._tokenize(query))
+        self.index = 0
+
+    def _tokenize(self, query: str) -> Iterator[Tuple[str, str, int]]:
+        position = 0
+        while position < len(query):
+            match = TOKEN.match(query, position)
+            if match is None:
+                rest = query[position:]
+                if rest.strip():
+                    raise QueryError("unexpected character", query, position + len(rest) - len(rest.lstrip()))
+                return
+            operator, number, word = match.groups()
+            start = match.start(match.lastindex)
+            if operator is not None:
+                yield 'op', operator, start
+            elif number is not None:
+                yield 'number', number, start
+            elif word.lower() in KEYWORDS:
+                yield 'keyword', word.lower(), start
+            else:
+                yield 'word', word, start
+            position = match.end()
+
+    def _peek(self) -> Optional[Tuple[str, str, int]]:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def _next(self, expected: str) -> Tuple[str, str, int]:
+        token = self._peek()
+        if token is None:
+            raise QueryError(f"expected {expected}", self.query, len(self.query))
+        self.index += 1
+        return token
+
+    def _accept(self, kind: str, value: Optional[str] = None) -> bool:
+        token = self._peek()
+        if token is not None and token[0] == kind and (value is None or token[1] == value):
+            self.index += 1
+            return True
+        return False
+
+    def parse(self) -> Node:
+        if not self.tokens:
+            raise QueryError("empty query", self.query, 0)
+        node = self._or()
+        token = self._peek()
+        if token is not None:
+            raise QueryError(f"unexpected {token[1]!r}", self.query, token[2])
+        return node
+
+    def _or(self) -> Node:
+        children = [self._and()]
+        while self._accept('keyword', 'or'):
+            children.append(self._and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def _and(self) -> Node:
+        children = [self._not()]
+        while True:
+            # Commas and semicolons between clauses read as ``and`` too
+            if self._accept('keyword', 'and') or self._separator():
+                children.append(self._not())
+                continue
+            token = self._peek()
+            # Adjacent clauses are implicitly and-ed
+            if token is None or token[1] in ('or', ')'):
+                break
+            children.append(self._not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def _not(self) -> Node:
+        if self._accept('keyword', 'not'):
+            return Not(self._not())
+        return self._atom()
+
+    def _atom(self) -> Node:
+        kind, value, position = self._next("a clause")
+        if kind == 'op' and value == '(':
+            node = self._or()
+            if not self._accept('op', ')'):
+                raise QueryError("expected ')'", self.query, self._position())
+            return node
+        if kind == 'keyword' and value in NAME_FIELDS:
+            names = self._list(('word', 'number'), f"{value} names")
+            if value != 'chain':
+                names = [name.upper() for name in names]
+            return NameClause(f"{value} {' '.join(names)}", NAME_FIELDS[value], names)
+        if kind == 'keyword' and value in RANGE_FIELDS:
+            return self._ranges(value)
+        if kind == 'keyword' and value in NUMERIC_FIELDS:
+            op_kind, operator, op_position = self._next("a comparison")
+            if op_kind != 'op' or operator not in OPERATORS:
+                raise QueryError("expected a comparison", self.query, op_position)
+            number_kind, number, number_position = self._next("a number")
+            negative = number_kind == 'op' and number == '-'
+            if negative:
+                number_kind, number, number_position = self._next("a number")
+            if number_kind != 'number':
+                raise QueryError("expected a number", self.query, number_position)
+            threshold = -float(number) if negative else float(number)
+            return CompareClause(f"{value} {operator} {threshold:g}", NUMERIC_FIELDS[value],
+                                 operator, threshold)
+        if kind == 'word':
+            # Bare residue names, as the search box has always accepted
+            self.index -= 1
+            names = [name.upper() for name in self._list(('word',), "residue names")]
+            return NameClause(f"resname {' '.join(names)}", 'Residue', names)
+        raise QueryError(f"unexpected {value!r}", self.query, position)
+
+    def _position(self) -> int:
+        token = self._peek()
+        return token[2] if token is not None else len(self.query)
+
+    def _separator(self) -> bool:
+        return self._accept('op', ',') or self._accept('op', ';')
+
+    def _list(self, kinds: Sequence[str], expected: str) -> List[str]:
+        """Items separated by spaces, commas or semicolons, up to the next keyword or operator."""
+        items: List[str] = []
+        token = self._peek()
+        while token is not None and token[0] in kinds:
+            items.append(token[1])
+            self.index += 1
+            self._separator()
+            token = self._peek()
+        if not items:
+            raise QueryError(f"expected {expected}", self.query, self._position())
+        return items
+
+    def _ranges(self, keyword: str) -> Node:
+        ranges: List[Tuple[int, int]] = []
+        while True:
+            token = self._peek()
+            if token is None or token[0] != 'number' or '.' in token[1]:
+                break
+            self.index += 1
+            low = high = int(token[1])
+            if self._accept('op', '-') or self._accept('op', ':'):
+                kind, value, position = self._next("a residue number")
+                if kind != 'number' or '.' in value:
+                    raise QueryError("expected a residue number", self.query, position)
+                high = int(value)
+            ranges.append((min(low, high), max(low, high)))
+            self._separator()
+        if not ranges:
+            raise QueryError("expected residue numbers", self.query, self._position())
+        text = ', '.join(str(low) if low == high else f'{low}-{high}' for low, high in ranges)
+        return RangeClause(f"{keyword} {text}", RANGE_FIELDS[keyword], ranges)
+
+_plans: 'OrderedDict[str, QueryPlan]' = OrderedDict()
+_plans_lock = threading.Lock()
+
+def compile_query(query: str) -> QueryPlan:
+    """Return the (cached) plan of a query; raises :class:`QueryError`."""
+    key = ' '.join(query.split())
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+    plan = QueryPlan(key, _Parser(key).parse())
+    with _plans_lock:
+        _plans[key] = plan
+        if len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
@@ -0,0 +1,178 @@
+"""Memory-mapped structure store shared by sessions and worker processes."""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from typing import Any, Dict, Optional
+import numpy as np
+from atomic_write import temp_path
+from structure import CodedColumn, Structure
+
+SHARED_DIR_ENV = 'STRUCTURE_SHARED_DIR'
+
+# Plain and categorical columns written per structure, one .npy file each
+ARRAY_COLUMNS = ('record', 'serial', 'res_seq', 'i_code', 'coords', 'occupancy', 'b_factor')
+CODED_COLUMNS = ('atom_name', 'res_name', 'chain_id', 'element')
+
+def default_directory() -> str:
+    """Store location: tmpfs where available, so mapped files live in RAM."""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'streamlit_structures')
+
+def _load(path: str, column: str) -> np.ndarray:
+    # Plain ndarray views of the read-only mapping
+    return np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r').view(np.ndarray)
+
+class StructureHandle:
+    """Picklable reference to a published structure, for worker processes."""
+
+    def __init__(self, digest: str, path: str, name: Optional[str] = None):
+        self.digest = digest
+        self.path = path
+        self.name = name
+
+    def open(self) -> Structure:
+        """Map the structure's columns; no data is read until it is used."""
+        columns: Dict[str, Any] = {column: _load(self.path, column) for column in ARRAY_COLUMNS}
+        for column in CODED_COLUMNS:
+            columns[column] = CodedColumn(_load(self.path, f'{column}.codes'),
+                                          _load(self.path, f'{column}.categories'))
+        return Structure(**columns, name=self.name, content_hash=self.digest)
+
+class StructureLease:
+    """Keeps a published structure on disk while referenced.
+
+    Held by the cache entry of a published structure (with its mapped copy
+    in ``structure``) or by an analysis job; the reference is released
+    when :meth:`release` is called or the lease is garbage collected, e.g.
+    when the cache evicts the entry.
+    """
+
+    def __init__(self, handle: StructureHandle, store: 'SharedStructureStore'):
+        self.handle = handle
+        self.structure: Optional[Structure] = None
+        self._finalizer = weakref.finalize(self, store._release, handle.digest)
+
+    @property
+    def nbytes(self) -> int:
+        return self.structure.nbytes if self.structure is not None else 0
+
+    def release(self) -> None:
+        self._finalizer()
+
+def _remove_stale(base: str) -> None:
+    """Remove the directories of server processes that are no longer running."""
+    for entry in os.scandir(base):
+        if not entry.name.isdigit() or not entry.is_dir():
+            continue
+        try:
+            os.kill(int(entry.name), 0)
+        except ProcessLookupError:
+            shutil.rmtree(entry.path, ignore_errors=True)
+        except PermissionError:
+            # Running, as another user
+            pass
+
+class SharedStructureStore:
+    """Content-addressed structures as memory-mapped ``.npy`` columns.
+
+    Every session and worker process that opens a structure maps the same
+    pages, so one copy serves them all. Leases are reference counted, and
+    since the counts are per server process, each process keeps its files
+    in a subdirectory of its own; when the last lease is released the
+    files are removed. Arrays already mapped stay valid after removal.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        base = directory or os.environ.get(SHARED_DIR_ENV) or default_directory()
+        os.makedirs(base, exist_ok=True)
+        _remove_stale(base)
+        self.directory = os.path.join(base, str(os.getpid()))
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(shutil.rmtree, self.directory, True)
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._digest_locks: Dict[str, threading.Lock] = {}
+
+    def handle(self, structure: Structure) -> StructureHandle:
+        if structure.content_hash is None:
+            raise ValueError("only structures with a content hash can be shared")
+        return StructureHandle(structure.content_hash,
+                               os.path.join(self.directory, structure.content_hash), structure.name)
+
+    def _write(self, structure: Structure, path: str) -> None:
+        """Write all columns to a private directory, then rename it into place."""
+        tmp_path = temp_path(path)
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            for column in ARRAY_COLUMNS:
+                np.save(os.path.join(tmp_path, f'{column}.npy'), getattr(structure, column))
+            for column in CODED_COLUMNS:
+                coded = getattr(structure, column)
+                np.save(os.path.join(tmp_path, f'{column}.codes.npy'), coded.codes)
+                np.save(os.path.join(tmp_path, f'{column}.categories.npy'), coded.categories)
+            os.rename(tmp_path, path)
+        except OSError:
+            # Published concurrently by another session or process
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+
+    def publish(self, structure: Structure) -> StructureLease:
+        """Write a structure to the store (once) and lease its mapped copy.
+
+        The lease's ``structure`` replaces the parsed one, whose heap arrays
+        can then be freed; its files stay until the lease is released.
+        """
+        lease = self.acquire(structure)
+        lease.structure = lease.handle.open()
+        return lease
+
+    def _digest_lock(self, digest: str) -> threading.Lock:
+        with self._lock:
+            return self._digest_locks.setdefault(digest, threading.Lock())
+
+    def acquire(self, structure: Structure) -> StructureLease:
+        """Lease a structure, re-publishing it if its files were removed."""
+        handle = self.handle(structure)
+        # Written under the structure's own lock, so writing a large one
+        # doesn't hold up leases (and finalizers) of the others
+        with self._digest_lock(handle.digest):
+            if not os.path.isdir(handle.path):
+                self._write(structure, handle.path)
+            with self._lock:
+                self._refs[handle.digest] = self._refs.get(handle.digest, 0) + 1
+        return StructureLease(handle, self)
+
+    def _release(self, digest: str) -> None:
+        with self._lock:
+            refs = self._refs.get(digest, 0) - 1
+            if refs > 0:
+                self._refs[digest] = refs
+                return
+            self._refs.pop(digest, None)
+        with self._digest_lock(digest):
+            with self._lock:
+                if digest in self._refs:
+                    # Leased again meanwhile
+                    return
+                self._digest_locks.pop(digest, None)
+            shutil.rmtree(os.path.join(self.directory, digest), ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'structures': len(self._refs), 'leases': sum(self._refs.values())}
+
+_store: Optional[SharedStructureStore] = None
+_store_lock = threading.Lock()
+
+def get_store() -> SharedStructureStore:
+    """Return the process-wide shared structure store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SharedStructureStore()
+    return _store
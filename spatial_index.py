@@ -0,0 +1,229 @@
+"""Cell-list spatial index for neighbor, contact and selection queries.
+
+Atoms are bucketed into a uniform grid of cubic cells and sorted by cell,
+so the atoms near a point are found by looking up the surrounding cells
+instead of scanning the whole structure. Only occupied cells are stored,
+which keeps sparse assemblies cheap.
+"""
+from typing import Iterable, Iterator, Optional, Tuple
+import numpy as np
+from structure import Structure
+from structure_analysis import residue_layout
+from structure_cache import get_cache
+
+# Queries up to this radius (Å) look at the 27 cells around an atom
+DEFAULT_CELL_SIZE = 6.0
+# Query atoms per vectorized batch; bounds the candidate pair arrays
+QUERY_CHUNK = 8192
+# Grids up to this many cells are dilated densely in ``near_cells``
+DENSE_GRID_CELLS = 1 << 24
+# CA-CA distance (Å) below which two residues are in contact
+CONTACT_CUTOFF = 8.0
+
+class CellList:
+    """Atom indices sorted by grid cell, with the range of every occupied cell."""
+
+    def __init__(self, coords: np.ndarray, cell_size: float = DEFAULT_CELL_SIZE):
+        self.coords = np.ascontiguousarray(coords, dtype=np.float32)
+        # One array per axis; gathering pairs from these is several times
+        # faster than from the interleaved rows
+        self.x, self.y, self.z = (np.ascontiguousarray(self.coords[:, k]) for k in range(3))
+        self.cell_size = float(cell_size)
+        n_atoms = len(self.coords)
+        if n_atoms:
+            self.origin = self.coords.min(axis=0)
+            xyz = ((self.coords - self.origin) / self.cell_size).astype(np.int64)
+            self.shape = tuple(int(n) for n in xyz.max(axis=0) + 1)
+        else:
+            self.origin = np.zeros(3, dtype=np.float32)
+            xyz = np.zeros((0, 3), dtype=np.int64)
+            self.shape = (1, 1, 1)
+        self.cell_of_atom = np.ravel_multi_index(tuple(xyz.T), self.shape)
+        self.order = np.argsort(self.cell_of_atom, kind='stable')
+        self.cells, first = np.unique(self.cell_of_atom[self.order], return_index=True)
+        self.bounds = np.append(first, n_atoms)
+        # Position of every atom's cell in ``cells``
+        self.slot_of_atom = np.empty(n_atoms, dtype=np.intp)
+        self.slot_of_atom[self.order] = np.repeat(np.arange(len(self.cells)), np.diff(self.bounds))
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.coords, self.x, self.y, self.z, self.cell_of_atom, self.order,
+                                      self.cells, self.bounds, self.slot_of_atom))
+
+    def _neighbor_cells(self, cells: np.ndarray, radius: float,
+                        points: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(row of ``cells``, occupied cell slot) for every cell within reach of ``radius``.
+
+        With ``points`` (one per row, inside its cell) cells farther than
+        ``radius`` from the point are skipped.
+        """
+        span = int(np.ceil(radius / self.cell_size))
+        axis = np.arange(-span, span + 1)
+        # Neighbors are tested per axis and combined by index: (rows, axis offsets)
+        # arrays instead of (rows, neighbors, 3)
+        ox, oy, oz = (o.ravel() for o in np.meshgrid(np.arange(axis.size), np.arange(axis.size),
+                                                     np.arange(axis.size), indexing='ij'))
+        xyz = np.unravel_index(cells, self.shape)
+        inside = np.ones((len(cells), ox.size), dtype=bool)
+        gap_sq = np.zeros((len(cells), ox.size), dtype=np.float32) if points is not None else None
+        for k, index in enumerate((ox, oy, oz)):
+            shifted = xyz[k][:, None] + axis
+            inside &= ((shifted >= 0) & (shifted < self.shape[k]))[:, index]
+            if gap_sq is not None:
+                # Distance from the point to the neighboring cells' slab, in cells
+                fraction = ((points[:, k] - self.origin[k]) / self.cell_size - xyz[k])[:, None]
+                gap = np.maximum(np.maximum(axis - fraction, fraction - axis - 1), 0)
+                gap_sq += (gap * gap)[:, index]
+        if gap_sq is not None:
+            inside &= gap_sq * self.cell_size ** 2 <= radius * radius
+        strides = (self.shape[1] * self.shape[2], self.shape[2], 1)
+        flat_offsets = axis[ox] * strides[0] + axis[oy] * strides[1] + axis[oz] * strides[2]
+        rows, columns = np.nonzero(inside)
+        flat = cells[rows] + flat_offsets[columns]
+        slots = np.searchsorted(self.cells, flat)
+        occupied = self.cells[np.minimum(slots, len(self.cells) - 1)] == flat
+        return rows[occupied], slots[occupied]
+
+    def _members(self, slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(index into ``slots``, atom) for every atom of the given cells."""
+        starts = self.bounds[slots]
+        counts = self.bounds[slots + 1] - starts
+        owner = np.repeat(np.arange(len(slots)), counts)
+        positions = np.arange(int(counts.sum())) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return owner, self.order[positions]
+
+    def pairs(self, query: np.ndarray, radius: float,
+              targets: Optional[np.ndarray] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yield chunks of (query atom, target atom) pairs within ``radius``.
+
+        ``query`` holds atom indices; ``targets`` is an optional atom mask.
+        An atom is paired with itself when it is also a target.
+        """
+        radius_sq = radius * radius
+        for start in range(0, len(query), QUERY_CHUNK):
+            atoms = query[start:start + QUERY_CHUNK]
+            rows, slots = self._neighbor_cells(self.cell_of_atom[atoms], radius, self.coords[atoms])
+            owner, members = self._members(slots)
+            i, j = atoms[rows[owner]], members
+            if targets is not None:
+                keep = targets[j]
+                i, j = i[keep], j[keep]
+            distance_sq = ((self.x[i] - self.x[j]) ** 2 + (self.y[i] - self.y[j]) ** 2
+                           + (self.z[i] - self.z[j]) ** 2)
+            close = distance_sq <= radius_sq
+            yield i[close], j[close]
+
+    def near_cells(self, atoms: np.ndarray, radius: float) -> np.ndarray:
+        """Mask of the atoms in cells within reach of ``radius`` of any atom in a mask."""
+        occupied = np.zeros(len(self.cells), dtype=bool)
+        occupied[self.slot_of_atom[atoms]] = True
+        span = int(np.ceil(radius / self.cell_size))
+        if np.prod(self.shape) <= DENSE_GRID_CELLS:
+            # Dilate the occupied cells on a dense grid, one axis at a time
+            grid = np.zeros(self.shape, dtype=bool)
+            grid.flat[self.cells[occupied]] = True
+            for axis in range(3):
+                source = np.moveaxis(grid, axis, 0)
+                dilated = source.copy()
+                for shift in range(1, span + 1):
+                    dilated[shift:] |= source[:-shift]
+                    dilated[:-shift] |= source[shift:]
+                grid = np.moveaxis(dilated, 0, axis)
+            near = grid.ravel()[self.cells]
+        else:
+            _, slots = self._neighbor_cells(self.cells[occupied], radius)
+            near = np.zeros(len(self.cells), dtype=bool)
+            near[slots] = True
+        return near[self.slot_of_atom]
+
+    def within(self, query: np.ndarray, radius: float,
+               targets: Optional[np.ndarray] = None) -> np.ndarray:
+        """Mask of the (target) atoms within ``radius`` of any ``query`` atom.
+
+        Targets are first cut down to the atoms in cells near the query, and
+        pairs are enumerated from the smaller side: a small query (a ligand)
+        costs its neighborhood, a large one (a whole chain) the shell
+        around it.
+        """
+        result = np.zeros(len(self), dtype=bool)
+        if not query.any():
+            return result
+        candidates = self.near_cells(query, radius)
+        if targets is not None:
+            candidates &= targets
+        if np.count_nonzero(query) < np.count_nonzero(candidates):
+            for _, j in self.pairs(np.flatnonzero(query), radius, candidates):
+                result[j] = True
+        else:
+            for i, _ in self.pairs(np.flatnonzero(candidates), radius, query):
+                result[i] = True
+        return result
+
+class SpatialIndex:
+    """Cell list over a structure, answering queries per polymer residue.
+
+    Residue masks follow the residue table's row order.
+    """
+
+    def __init__(self, structure: Structure, cell_size: float = DEFAULT_CELL_SIZE):
+        self.structure = structure
+        self.cells = CellList(structure.coords, cell_size)
+        layout = residue_layout(structure)
+        self.n_residues = layout.n_residues
+        self.residue_of_atom = np.full(structure.n_atoms, -1, dtype=np.intp)
+        self.residue_of_atom[layout.atoms] = layout.residue_of_atom
+        ca = layout.atom_index(b'CA')
+        self.ca_atoms = layout.atoms[ca[ca >= 0]]
+
+    @property
+    def nbytes(self) -> int:
+        return self.cells.nbytes + self.residue_of_atom.nbytes + self.ca_atoms.nbytes
+
+    def residue_mask(self, atoms: np.ndarray) -> np.ndarray:
+        """Residues with at least one atom in an atom mask."""
+        residues = self.residue_of_atom[atoms]
+        mask = np.zeros(self.n_residues, dtype=bool)
+        mask[residues[residues >= 0]] = True
+        return mask
+
+    def residues_near(self, residue_names: Iterable[str], radius: float) -> np.ndarray:
+        """Polymer residues within ``radius`` of any residue with one of the names,
+        such as a ligand."""
+        query = self.structure.res_name.isin(residue_names)
+        targets = ~query & (self.residue_of_atom >= 0)
+        return self.residue_mask(self.cells.within(query, radius, targets))
+
+    def interface_residues(self, chain_ids: Iterable[str], radius: float) -> np.ndarray:
+        """Polymer residues of the chains within ``radius`` of another of the chains."""
+        polymer = self.residue_of_atom >= 0
+        chains = [(self.structure.chain_id == chain_id) & polymer for chain_id in chain_ids]
+        hits = np.zeros(len(self.cells), dtype=bool)
+        for k, chain in enumerate(chains):
+            others = np.zeros_like(chain)
+            for other in chains[:k] + chains[k + 1:]:
+                others |= other
+            hits |= self.cells.within(others, radius, chain)
+        return self.residue_mask(hits)
+
+    def contact_pairs(self, cutoff: float = CONTACT_CUTOFF) -> Tuple[np.ndarray, np.ndarray]:
+        """Residue index pairs (i < j) whose CA atoms are within ``cutoff``."""
+        # CA atoms are sparse; a grid of their own with cutoff-sized cells
+        # keeps the search to the 27 surrounding cells
+        cells = CellList(self.structure.coords[self.ca_atoms], max(cutoff, 1.0))
+        pairs = list(cells.pairs(np.arange(len(cells)), cutoff))
+        first = np.concatenate([i for i, _ in pairs] or [np.zeros(0, dtype=np.intp)])
+        second = np.concatenate([j for _, j in pairs] or [np.zeros(0, dtype=np.intp)])
+        upper = first < second
+        residues = self.residue_of_atom[self.ca_atoms]
+        return residues[first[upper]], residues[second[upper]]
+
+def get_spatial_index(structure: Structure) -> SpatialIndex:
+    """The structure's spatial index, built once per content and cached."""
+    if structure.content_hash is None:
+        return SpatialIndex(structure)
+    return get_cache().get_or_compute(structure.content_hash, 'spatial_index',
+                                      lambda: SpatialIndex(structure))
@@ -0,0 +1,277 @@
+"""Columnar, NumPy-backed container for parsed macromolecular structures."""
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+def _code_dtype(n_categories: int) -> np.dtype:
+    """Smallest code dtype pandas uses for this many categories (so no copy)."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+class CodedColumn:
+    """Categorical text column: small integer codes into sorted byte categories.
+
+    Slices and selections share the category array, so codes of columns
+    derived from the same structure compare directly. Codes follow pandas'
+    layout, so :meth:`to_pandas` wraps them without copying.
+    """
+
+    __slots__ = ('codes', 'categories', '_labels')
+
+    def __init__(self, codes: np.ndarray, categories: np.ndarray, labels: Optional[pd.Index] = None):
+        self.codes = codes
+        self.categories = categories
+        self._labels = labels
+
+    @classmethod
+    def encode(cls, values: np.ndarray) -> 'CodedColumn':
+        """Encode a fixed-width bytes array, categories in lexical order."""
+        width = values.dtype.itemsize
+        padded = next((w for w in (1, 2, 4, 8) if w >= width), None)
+        if padded is None:
+            codes, categories = pd.factorize(values.astype(object), sort=True)
+            categories = np.asarray(categories, dtype=values.dtype)
+        else:
+            # Big-endian integers sort like the (null-padded) bytes they view
+            keys = values.astype(f'S{padded}').view(f'>u{padded}').astype(f'u{padded}')
+            codes, uniques = pd.factorize(keys, sort=True)
+            categories = uniques.astype(f'>u{padded}').view(f'S{padded}').astype(values.dtype)
+        return cls(codes.astype(_code_dtype(len(categories))), categories)
+
+    def __len__(self) -> int:
+        return int(self.codes.shape[0])
+
+    def __getitem__(self, index: Any) -> 'CodedColumn':
+        return CodedColumn(self.codes[index], self.categories, self._labels)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.categories.nbytes
+
+    @property
+    def labels(self) -> pd.Index:
+        """Categories decoded to strings."""
+        if self._labels is None:
+            self._labels = pd.Index(self.categories.astype(str))
+        return self._labels
+
+    def code_of(self, value: Any) -> int:
+        """Code of a category (bytes or str), or -1 when it does not occur."""
+        if isinstance(value, str):
+            value = value.encode()
+        position = int(np.searchsorted(self.categories, value))
+        if position < len(self.categories) and self.categories[position] == value:
+            return position
+        return -1
+
+    def __eq__(self, other: Any) -> np.ndarray:  # type: ignore[override]
+        if isinstance(other, CodedColumn):
+            if other.categories is self.categories:
+                return self.codes == other.codes
+            return self.decode() == other.decode()
+        code = self.code_of(other)
+        return self.codes == code if code >= 0 else np.zeros(len(self), dtype=bool)
+
+    def __ne__(self, other: Any) -> np.ndarray:  # type: ignore[override]
+        return ~(self == other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def isin(self, values: Any) -> np.ndarray:
+        codes = [code for code in map(self.code_of, values) if code >= 0]
+        return np.isin(self.codes, codes)
+
+    def decode(self) -> np.ndarray:
+        """The column as a fixed-width bytes array."""
+        return self.categories[self.codes]
+
+    def __array__(self, dtype: Any = None, copy: Optional[bool] = None) -> np.ndarray:
+        values = self.decode()
+        return values if dtype is None else values.astype(dtype)
+
+    def map(self, mapping: Mapping[str, float], default: float = np.nan) -> np.ndarray:
+        """Look every value up in a mapping keyed by category string."""
+        lookup = np.array([mapping.get(label, default) for label in self.labels], dtype=np.float64)
+        return lookup[self.codes]
+
+    def counts(self) -> pd.Series:
+        """Occurrences per category, omitting categories that do not occur."""
+        counts = np.bincount(self.codes, minlength=len(self.categories))
+        present = counts > 0
+        return pd.Series(counts[present], index=self.labels[present], name='Count')
+
+    def to_pandas(self) -> pd.Categorical:
+        """Zero-copy pandas Categorical over the codes."""
+        return pd.Categorical.from_codes(self.codes, dtype=pd.CategoricalDtype(self.labels))
+
+class Structure:
+    """Atom-level structure table stored as one NumPy array per column.
+
+    Atom, residue, chain and element names are :class:`CodedColumn` codes,
+    so a name costs one or two bytes per atom. Chain runs are indexed once,
+    making :meth:`chain` a slice for chains stored contiguously.
+    """
+
+    __slots__ = ('record', 'serial', 'atom_name', 'res_name', 'chain_id', 'res_seq',
+                 'i_code', 'coords', 'occupancy', 'b_factor', 'element',
+                 'name', 'content_hash', '_chain_runs')
+
+    # Columns of the atom-level table, in display order
+    ATOM_COLUMNS = ('Record', 'Serial', 'Atom', 'Residue', 'Chain', 'Position',
+                    'X', 'Y', 'Z', 'Occupancy', 'B-Factor', 'Element')
+
+    def __init__(self, record: np.ndarray, serial: np.ndarray, atom_name: CodedColumn,
+                 res_name: CodedColumn, chain_id: CodedColumn, res_seq: np.ndarray,
+                 i_code: np.ndarray, coords: np.ndarray, occupancy: np.ndarray,
+                 b_factor: np.ndarray, element: CodedColumn,
+                 name: Optional[str] = None, content_hash: Optional[str] = None):
+        self.record = record            # bool, True for HETATM
+        self.serial = serial            # int32
+        self.atom_name = atom_name
+        self.res_name = res_name
+        self.chain_id = chain_id
+        self.res_seq = res_seq          # int32
+        self.i_code = i_code            # bytes
+        self.coords = coords            # float32, shape (n_atoms, 3)
+        self.occupancy = occupancy      # float32
+        self.b_factor = b_factor        # float32
+        self.element = element
+        self.name = name
+        self.content_hash = content_hash
+        self._chain_runs: Optional[Dict[bytes, List[Tuple[int, int]]]] = None
+
+    def __len__(self) -> int:
+        return self.n_atoms
+
+    @property
+    def n_atoms(self) -> int:
+        return int(self.coords.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        """Total size of the column arrays in bytes."""
+        return sum(getattr(self, col).nbytes for col in (
+            'record', 'serial', 'atom_name', 'res_name', 'chain_id', 'res_seq',
+            'i_code', 'coords', 'occupancy', 'b_factor', 'element'))
+
+    def residue_starts(self) -> np.ndarray:
+        """Index of the first atom of every residue (atoms are in file order)."""
+        if self.n_atoms == 0:
+            return np.zeros(0, dtype=np.intp)
+        change = np.empty(self.n_atoms, dtype=bool)
+        change[0] = True
+        change[1:] = ((self.chain_id.codes[1:] != self.chain_id.codes[:-1])
+                      | (self.res_seq[1:] != self.res_seq[:-1])
+                      | (self.i_code[1:] != self.i_code[:-1]))
+        return np.flatnonzero(change)
+
+    def chain_runs(self) -> Dict[bytes, List[Tuple[int, int]]]:
+        """Contiguous (start, stop) atom ranges of every chain, in file order.
+
+        Most chains are a single run; ligands and waters listed after the
+        polymer chains add further runs to their chain.
+        """
+        if self._chain_runs is None:
+            codes = self.chain_id.codes
+            change = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+            starts = np.concatenate(([0], change)) if self.n_atoms else change
+            stops = np.append(starts[1:], self.n_atoms)
+            runs: Dict[bytes, List[Tuple[int, int]]] = {}
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                runs.setdefault(bytes(self.chain_id.categories[codes[start]]), []).append((start, stop))
+            self._chain_runs = runs
+        return self._chain_runs
+
+    def chain_mask(self, chain_id: bytes) -> np.ndarray:
+        mask = np.zeros(self.n_atoms, dtype=bool)
+        for start, stop in self.chain_runs().get(chain_id, ()):
+            mask[start:stop] = True
+        return mask
+
+    def chain(self, chain_id: bytes) -> 'Structure':
+        """Atoms of one chain; a zero-copy view when the chain is contiguous."""
+        runs = self.chain_runs().get(chain_id, [])
+        if len(runs) == 1:
+            return self.select(slice(*runs[0]))
+        return self.select(np.concatenate([np.arange(start, stop) for start, stop in runs]
+                                          or [np.zeros(0, dtype=np.intp)]))
+
+    def residue_table(self) -> pd.DataFrame:
+        """Per-residue table of polymer (ATOM) residues with mean B-factors."""
+        polymer = ~self.record
+        if not polymer.all():
+            return self.select(polymer).residue_table()
+        starts = self.residue_starts()
+        counts = np.diff(np.append(starts, self.n_atoms))
+        b_mean = (np.add.reduceat(self.b_factor.astype(np.float64), starts) / counts
+                  if starts.size else np.zeros(0))
+        return pd.DataFrame({
+            'Chain': self.chain_id[starts].to_pandas(),
+            'Residue': self.res_name[starts].to_pandas(),
+            'Position': self.res_seq[starts],
+            'B-Factor': b_mean.round(2),
+            'SASA': np.full(starts.size, np.nan),
+        }, copy=False)
+
+    def atom_column(self, column: str) -> Any:
+        """Array behind one of ``ATOM_COLUMNS`` (a CodedColumn for names)."""
+        if column == 'Record':
+            return np.where(self.record, b'HETATM', b'ATOM')
+        if column in ('X', 'Y', 'Z'):
+            return self.coords[:, 'XYZ'.index(column)]
+        return getattr(self, {
+            'Serial': 'serial', 'Atom': 'atom_name', 'Residue': 'res_name',
+            'Chain': 'chain_id', 'Position': 'res_seq', 'Occupancy': 'occupancy',
+            'B-Factor': 'b_factor', 'Element': 'element',
+        }[column])
+
+    def atom_sort_key(self, column: str) -> np.ndarray:
+        """Numeric array ordering atoms like ``column`` does."""
+        if column == 'Record':
+            return self.record
+        values = self.atom_column(column)
+        return values.codes if isinstance(values, CodedColumn) else values
+
+    def atom_table(self, rows: Optional[Any] = None) -> pd.DataFrame:
+        """Atom-level table, optionally only for the given atom positions.
+
+        Name columns are categoricals over the stored codes, so the full
+        table shares its memory with the structure.
+        """
+        table = {}
+        for column in self.ATOM_COLUMNS:
+            values = self.atom_column(column)
+            if rows is not None:
+                values = values[rows]
+            if isinstance(values, CodedColumn):
+                values = values.to_pandas()
+            elif values.dtype.kind == 'S':
+                values = values.astype(str)
+            table[column] = values
+        return pd.DataFrame(table, copy=False)
+
+    def with_coords(self, coords: np.ndarray) -> 'Structure':
+        """The same atoms at other coordinates, e.g. a trajectory frame.
+
+        The result has no content hash, so nothing derived from it is
+        cached under the original structure's key.
+        """
+        moved = self.select(slice(None))
+        moved.coords = coords
+        moved.content_hash = None
+        return moved
+
+    def select(self, index: Any) -> 'Structure':
+        """Structure of the atoms picked by a mask, index array or slice.
+
+        Slices return views sharing the column arrays.
+        """
+        return Structure(
+            self.record[index], self.serial[index], self.atom_name[index],
+            self.res_name[index], self.chain_id[index], self.res_seq[index],
+            self.i_code[index], self.coords[index], self.occupancy[index],
+            self.b_factor[index], self.element[index],
+            name=self.name, content_hash=self.content_hash,
+        )
@@ -0,0 +1,307 @@
+"""Vectorized per-residue analyses computed from parsed structure coordinates."""
+from typing import Any, Callable, Optional, Tuple
+import numpy as np
+import pandas as pd
+from structure import CodedColumn, Structure
+from structure_cache import get_cache
+
+# Kyte & Doolittle (1982) hydropathy index
+KYTE_DOOLITTLE = {
+    'ALA': 1.8, 'ARG': -4.5, 'ASN': -3.5, 'ASP': -3.5, 'CYS': 2.5,
+    'GLN': -3.5, 'GLU': -3.5, 'GLY': -0.4, 'HIS': -3.2, 'ILE': 4.5,
+    'LEU': 3.8, 'LYS': -3.9, 'MET': 1.9, 'PHE': 2.8, 'PRO': -1.6,
+    'SER': -0.8, 'THR': -0.7, 'TRP': -0.9, 'TYR': -1.3, 'VAL': 4.2,
+}
+
+# Van der Waals radii (Å) used for SASA; unknown elements use the default
+VDW_RADII = {'H': 1.10, 'C': 1.70, 'N': 1.55, 'O': 1.52, 'S': 1.80, 'P': 1.80, 'SE': 1.90}
+DEFAULT_RADIUS = 1.80
+PROBE_RADIUS = 1.4
+SPHERE_POINTS = 96
+GRID_SPACING = 0.6
+
+WATER_NAMES = (b'HOH', b'WAT', b'DOD')
+
+# Peptide bond C(i-1)-N(i) length above which residues are not bonded
+PEPTIDE_BOND_MAX = 2.0
+
+# Minimum run length for a helix or strand assignment to be kept
+MIN_HELIX_RUN = 4
+MIN_SHEET_RUN = 3
+
+# Secondary structure labels, the categories of the residue table column
+SECONDARY_STRUCTURES = ('Helix', 'Loop', 'Sheet')
+
+# Columns of the per-residue table built by residue_table
+RESIDUE_COLUMNS = ('Chain', 'Residue', 'Position', 'B-Factor', 'SASA',
+                   'Secondary Structure', 'Hydropathy', 'phi', 'psi')
+
+def memoized(structure: Structure, name: str, compute: Callable[[], Any]) -> Any:
+    """Compute an analysis once per structure content via the shared cache."""
+    if structure.content_hash is None:
+        return compute()
+    return get_cache().get_or_compute(structure.content_hash, ('analysis', name), compute)
+
+class ResidueLayout:
+    """Residue boundaries of the polymer (ATOM) part of a structure."""
+
+    def __init__(self, structure: Structure):
+        polymer = ~structure.record
+        self.atoms = np.flatnonzero(polymer)
+        self.polymer = structure.select(polymer) if not polymer.all() else structure
+        self.starts = self.polymer.residue_starts()
+        self.n_residues = int(self.starts.size)
+        self.counts = np.diff(np.append(self.starts, self.polymer.n_atoms))
+        self.residue_of_atom = np.repeat(np.arange(self.n_residues), self.counts)
+        self.chain_id = self.polymer.chain_id[self.starts]
+        self.res_name = self.polymer.res_name[self.starts]
+        self.res_seq = self.polymer.res_seq[self.starts]
+
+    def atom_index(self, atom_name: bytes) -> np.ndarray:
+        """Index (into the polymer atoms) of a named atom per residue, or -1."""
+        index = np.full(self.n_residues, -1, dtype=np.intp)
+        atoms = np.flatnonzero(self.polymer.atom_name == atom_name)
+        index[self.residue_of_atom[atoms]] = atoms
+        return index
+
+    def chain_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """First and one-past-last residue index of each residue's chain."""
+        change = np.ones(self.n_residues, dtype=bool)
+        change[1:] = self.chain_id.codes[1:] != self.chain_id.codes[:-1]
+        chain_of_residue = np.cumsum(change) - 1
+        chain_starts = np.flatnonzero(change)
+        chain_ends = np.append(chain_starts[1:], self.n_residues)
+        return chain_starts[chain_of_residue], chain_ends[chain_of_residue]
+
+def residue_layout(structure: Structure) -> ResidueLayout:
+    return memoized(structure, 'layout', lambda: ResidueLayout(structure))
+
+def dihedral(p0: np.ndarray, p1: np.ndarray, p2: np.ndarray, p3: np.ndarray) -> np.ndarray:
+    """Dihedral angles in degrees for arrays of four points of shape (..., 3)."""
+    b0 = p0 - p1
+    b1 = p2 - p1
+    b2 = p3 - p2
+    b1 = b1 / np.linalg.norm(b1, axis=-1, keepdims=True)
+    v = b0 - np.sum(b0 * b1, axis=-1, keepdims=True) * b1
+    w = b2 - np.sum(b2 * b1, axis=-1, keepdims=True) * b1
+    x = np.sum(v * w, axis=-1)
+    y = np.sum(np.cross(b1, v) * w, axis=-1)
+    return np.degrees(np.arctan2(y, x))
+
+def layout_dihedrals(layout: ResidueLayout, coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Phi and psi per residue for polymer coordinates of shape (..., n_atoms, 3).
+
+    Leading axes are frames of a trajectory; peptide bonds are judged per
+    frame.
+    """
+    coords = coords.astype(np.float64)
+    n_idx, ca_idx, c_idx = (layout.atom_index(name) for name in (b'N', b'CA', b'C'))
+    complete = (n_idx >= 0) & (ca_idx >= 0) & (c_idx >= 0)
+    n_xyz, ca_xyz, c_xyz = coords[..., n_idx, :], coords[..., ca_idx, :], coords[..., c_idx, :]
+
+    # Residue i is bonded to i+1 when C(i)-N(i+1) is a peptide bond
+    bonded = (complete[:-1] & complete[1:]
+              & (layout.chain_id.codes[:-1] == layout.chain_id.codes[1:])
+              & (np.linalg.norm(n_xyz[..., 1:, :] - c_xyz[..., :-1, :], axis=-1) < PEPTIDE_BOND_MAX))
+
+    phi = np.full(coords.shape[:-2] + (layout.n_residues,), np.nan)
+    psi = np.full(coords.shape[:-2] + (layout.n_residues,), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        phi[..., 1:] = np.where(bonded, dihedral(c_xyz[..., :-1, :], n_xyz[..., 1:, :],
+                                                 ca_xyz[..., 1:, :], c_xyz[..., 1:, :]), np.nan)
+        psi[..., :-1] = np.where(bonded, dihedral(n_xyz[..., :-1, :], ca_xyz[..., :-1, :],
+                                                  c_xyz[..., :-1, :], n_xyz[..., 1:, :]), np.nan)
+    return phi, psi
+
+def backbone_dihedrals(structure: Structure) -> Tuple[np.ndarray, np.ndarray]:
+    """Phi and psi angles per polymer residue (NaN where undefined)."""
+    def compute() -> Tuple[np.ndarray, np.ndarray]:
+        layout = residue_layout(structure)
+        return layout_dihedrals(layout, layout.polymer.coords)
+    return memoized(structure, 'dihedrals', compute)
+
+def _drop_short_runs(labels: np.ndarray, label: str, min_run: int) -> None:
+    """Relabel runs of ``label`` shorter than ``min_run`` as loops, in place."""
+    is_label = labels == label
+    edges = np.diff(np.concatenate(([0], is_label.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    for start, end in zip(starts[ends - starts < min_run], ends[ends - starts < min_run]):
+        labels[start:end] = 'Loop'
+
+def secondary_structure(structure: Structure) -> pd.Categorical:
+    """Helix/Sheet/Loop per residue from backbone dihedral regions.
+
+    This is a Ramachandran-region approximation rather than a hydrogen-bond
+    based (DSSP) assignment; isolated residues in a region become loops.
+    """
+    def compute() -> pd.Categorical:
+        phi, psi = backbone_dihedrals(structure)
+        with np.errstate(invalid='ignore'):
+            helix = (phi >= -160) & (phi <= -20) & (psi >= -120) & (psi <= 50)
+            sheet = (phi >= -180) & (phi <= -40) & ((psi >= 90) | (psi <= -150))
+        labels = np.where(helix, 'Helix', np.where(sheet, 'Sheet', 'Loop')).astype(object)
+        _drop_short_runs(labels, 'Helix', MIN_HELIX_RUN)
+        _drop_short_runs(labels, 'Sheet', MIN_SHEET_RUN)
+        return pd.Categorical(labels, categories=SECONDARY_STRUCTURES)
+    return memoized(structure, 'secondary_structure', compute)
+
+def hydropathy_profile(structure: Structure, window: int = 9) -> np.ndarray:
+    """Sliding-window Kyte-Doolittle hydropathy per residue, within each chain."""
+    def compute() -> np.ndarray:
+        layout = residue_layout(structure)
+        values = layout.res_name.map(KYTE_DOOLITTLE)
+        known = ~np.isnan(values)
+        value_sums = np.concatenate(([0.0], np.cumsum(np.where(known, values, 0.0))))
+        known_counts = np.concatenate(([0], np.cumsum(known)))
+
+        half = window // 2
+        positions = np.arange(layout.n_residues)
+        chain_start, chain_end = layout.chain_bounds()
+        low = np.maximum(positions - half, chain_start)
+        high = np.minimum(positions + half + 1, chain_end)
+        counts = known_counts[high] - known_counts[low]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, (value_sums[high] - value_sums[low]) / counts, np.nan)
+    return memoized(structure, f'hydropathy_{window}', compute)
+
+def residue_b_factors(structure: Structure) -> np.ndarray:
+    """Mean atomic B-factor per polymer residue."""
+    def compute() -> np.ndarray:
+        layout = residue_layout(structure)
+        b_factor = layout.polymer.b_factor.astype(np.float64)
+        return np.add.reduceat(b_factor, layout.starts) / layout.counts if layout.n_residues else b_factor[:0]
+    return memoized(structure, 'b_factors', compute)
+
+def composition(structure: Structure) -> pd.Series:
+    """Residue counts per residue name, sorted by name."""
+    def compute() -> pd.Series:
+        return residue_layout(structure).res_name.counts()
+    return memoized(structure, 'composition', compute)
+
+def _sphere_points(n: int) -> np.ndarray:
+    """Quasi-uniform unit sphere points on a golden-section spiral."""
+    k = np.arange(n) + 0.5
+    z = 1 - 2 * k / n
+    r = np.sqrt(1 - z * z)
+    theta = np.pi * (1 + 5 ** 0.5) * k
+    return np.column_stack((r * np.cos(theta), r * np.sin(theta), z))
+
+def vdw_radii(elements: CodedColumn) -> np.ndarray:
+    """Van der Waals radius per atom from its element symbol."""
+    return elements.map(VDW_RADII, DEFAULT_RADIUS)
+
+def atom_sasa(coords: np.ndarray, radii: np.ndarray, probe: float = PROBE_RADIUS,
+              n_points: int = SPHERE_POINTS, spacing: float = GRID_SPACING,
+              chunk: int = 4096, n_targets: Optional[int] = None) -> np.ndarray:
+    """Approximate solvent accessible surface area per atom (Å²).
+
+    Shrake-Rupley on a neighbor grid: every atom's probe-expanded sphere is
+    stamped into a voxel count grid, then each atom's surface points are
+    looked up in the grid, discounting the atom's own stamp. Lookups are
+    O(points) and need no pairwise neighbor search. With ``n_targets`` only
+    the first ``n_targets`` atoms are measured; the rest only occlude.
+    """
+    n_atoms = coords.shape[0] if n_targets is None else n_targets
+    if n_atoms == 0:
+        return np.zeros(0)
+    coords = coords.astype(np.float64)
+    expanded = radii.astype(np.float64) + probe
+    reach = expanded.max()
+    # Grid origin on a fixed lattice (in voxels), so any subset of the atoms
+    # voxelizes identically, e.g. a chain analyzed with its environment
+    lattice = coords / spacing
+    origin = np.floor(lattice.min(axis=0) - reach / spacing) - 2
+    shape = np.ceil(lattice.max(axis=0) + reach / spacing + 2 - origin).astype(np.intp) + 1
+    strides = np.array([shape[1] * shape[2], shape[2], 1], dtype=np.intp)
+    grid = np.zeros(int(np.prod(shape)), dtype=np.uint16)
+    centers = (np.floor(lattice) - origin).astype(np.intp)
+    # Squared expanded radius in voxel units; stamps and lookups share it
+    reach_sq = (expanded / spacing) ** 2
+
+    # Stamp: voxels whose offset from the atom's voxel lies within its radius
+    span = int(np.ceil(reach / spacing))
+    axis = np.arange(-span, span + 1)
+    offsets = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1).reshape(-1, 3)
+    offset_sq = (offsets ** 2).sum(axis=1)
+    for radius_sq in np.unique(reach_sq):
+        stamp = offsets[offset_sq <= radius_sq] @ strides
+        atoms = np.flatnonzero(reach_sq == radius_sq)
+        base = centers[atoms] @ strides
+        # Small batches keep the scattered indices cache-resident
+        for start in range(0, atoms.size, 1024):
+            np.add.at(grid, (base[start:start + 1024, None] + stamp).ravel(), np.uint16(1))
+
+    unit = _sphere_points(n_points).astype(np.float32)
+    lattice = lattice.astype(np.float32)
+    origin = origin.astype(np.int32)
+    area = np.empty(n_atoms)
+    for start in range(0, n_atoms, chunk):
+        stop = min(start + chunk, n_atoms)
+        r = (expanded[start:stop] / spacing).astype(np.float32)[:, None]
+        # Voxel of every surface point, one axis at a time: the flat grid
+        # index and the squared voxel offset from the atom's own voxel
+        flat = np.zeros((stop - start, n_points), dtype=np.intp)
+        own_sq = np.zeros((stop - start, n_points), dtype=np.int32)
+        for k in range(3):
+            voxel = np.floor(lattice[start:stop, k, None] + r * unit[:, k]).astype(np.int32) - origin[k]
+            flat += voxel * strides[k]
+            voxel -= centers[start:stop, k, None].astype(np.int32)
+            own_sq += voxel * voxel
+        # The atom's own stamp covers a point's voxel when that offset is
+        # within the atom's expanded radius
+        own = own_sq <= reach_sq[start:stop, None]
+        exposed = grid[flat] == own
+        area[start:stop] = exposed.mean(axis=1) * 4 * np.pi * expanded[start:stop] ** 2
+    return area
+
+def residue_sasa(structure: Structure,
+                 environment: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """Approximate SASA per polymer residue (Å²); ligands occlude, waters do not.
+
+    ``environment`` is the (coords, radii) of surrounding atoms, such as
+    neighbouring chains, that occlude the structure without being measured.
+    Results computed with an environment are not memoized.
+    """
+    def compute() -> np.ndarray:
+        layout = residue_layout(structure)
+        solute = ~structure.res_name.isin(WATER_NAMES)
+        coords = structure.coords[solute]
+        radii = vdw_radii(structure.element[solute])
+        n_solute = coords.shape[0]
+        if environment is not None:
+            coords = np.concatenate((coords, environment[0]))
+            radii = np.concatenate((radii, environment[1]))
+        area = np.zeros(structure.n_atoms)
+        area[solute] = atom_sasa(coords, radii, n_targets=n_solute)
+        polymer_area = area[layout.atoms]
+        if not layout.n_residues:
+            return polymer_area
+        return np.add.reduceat(polymer_area, layout.starts)
+    if environment is not None:
+        return compute()
+    return memoized(structure, 'sasa', compute)
+
+def residue_table(structure: Structure,
+                  environment: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> pd.DataFrame:
+    """Per-residue table with all analyses, as consumed by DataTable and Plot.
+
+    ``environment`` is passed on to :func:`residue_sasa`.
+    """
+    def compute() -> pd.DataFrame:
+        layout = residue_layout(structure)
+        phi, psi = backbone_dihedrals(structure)
+        return pd.DataFrame({
+            'Chain': layout.chain_id.to_pandas(),
+            'Residue': layout.res_name.to_pandas(),
+            'Position': layout.res_seq,
+            'B-Factor': residue_b_factors(structure).round(2),
+            'SASA': residue_sasa(structure, environment).round(2),
+            'Secondary Structure': secondary_structure(structure),
+            'Hydropathy': hydropathy_profile(structure).round(3),
+            'phi': phi.round(2),
+            'psi': psi.round(2),
+        }, copy=False)
+    if environment is not None:
+        return compute()
+    return memoized(structure, 'residue_table', compute)
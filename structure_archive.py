@@ -0,0 +1,146 @@
+"""Persistent compressed archive of parsed structures, keyed by content hash."""
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+from atomic_write import temp_path
+from structure import CodedColumn, Structure
+
+ARCHIVE_DIR_ENV = 'STRUCTURE_ARCHIVE_DIR'
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'structure_archive')
+MAX_BYTES_ENV = 'STRUCTURE_ARCHIVE_MAX_BYTES'
+DEFAULT_MAX_BYTES = 4 << 30
+
+# Bumped when the stored layout changes; older archives are re-parsed
+FORMAT_VERSION = 1
+
+ARRAY_COLUMNS = ('record', 'serial', 'res_seq', 'i_code', 'coords', 'occupancy', 'b_factor')
+CODED_COLUMNS = ('atom_name', 'res_name', 'chain_id', 'element')
+
+def save_structure(structure: Structure, path: str) -> None:
+    """Write a structure's columns to a compressed ``.npz`` file."""
+    arrays: Dict[str, Any] = {column: getattr(structure, column) for column in ARRAY_COLUMNS}
+    for column in CODED_COLUMNS:
+        coded = getattr(structure, column)
+        arrays[f'{column}.codes'] = coded.codes
+        arrays[f'{column}.categories'] = coded.categories
+    arrays['version'] = np.int32(FORMAT_VERSION)
+    arrays['name'] = np.str_(structure.name or '')
+    np.savez_compressed(path, **arrays)
+
+def load_structure(path: str, digest: Optional[str] = None) -> Structure:
+    with np.load(path) as data:
+        if int(data['version']) != FORMAT_VERSION:
+            raise ValueError(f"unsupported archive version {int(data['version'])}")
+        columns: Dict[str, Any] = {column: data[column] for column in ARRAY_COLUMNS}
+        for column in CODED_COLUMNS:
+            columns[column] = CodedColumn(data[f'{column}.codes'], data[f'{column}.categories'])
+        name = str(data['name']) or None
+    return Structure(**columns, name=name, content_hash=digest)
+
+class StructureArchive:
+    """Directory of ``<content hash>.npz`` files, at most ``max_bytes`` in total.
+
+    Uploads are parsed once per content; later uploads of the same file,
+    including after a server restart, load the binary columns instead.
+    Files are evicted least-recently-used first; loading a file refreshes
+    its modification time, which orders them across restarts.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or os.environ.get(ARCHIVE_DIR_ENV) or DEFAULT_DIR
+        if max_bytes is None:
+            max_bytes = int(os.environ.get(MAX_BYTES_ENV, DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._sizes: 'OrderedDict[str, int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self._scan()
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, f'{digest}.npz')
+
+    def _scan(self) -> None:
+        """Index the archived files, least recently used first."""
+        files = []
+        for entry in os.scandir(self.directory):
+            name, extension = os.path.splitext(entry.name)
+            # Skips the temporary files of unfinished writes
+            if extension == '.npz' and '.' not in name and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, digest, size in sorted(files):
+            self._sizes[digest] = size
+            self.current_bytes += size
+
+    def _touch(self, digest: str, size: int) -> None:
+        """Record a use of an archived file; call with the lock held."""
+        self.current_bytes += size - self._sizes.pop(digest, 0)
+        self._sizes[digest] = size
+
+    def _evict(self) -> None:
+        with self._lock:
+            evicted = []
+            # The file just saved is kept even if it alone exceeds the budget
+            while self.current_bytes > self.max_bytes and len(self._sizes) > 1:
+                digest, size = self._sizes.popitem(last=False)
+                self.current_bytes -= size
+                evicted.append(digest)
+        for digest in evicted:
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                # Removed by another server process
+                pass
+
+    def load(self, digest: str) -> Optional[Structure]:
+        path = self.path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            structure = load_structure(path, digest)
+            os.utime(path)
+            size = os.path.getsize(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # Unreadable or outdated: parse again and overwrite it
+            return None
+        with self._lock:
+            self._touch(digest, size)
+        return structure
+
+    def save(self, structure: Structure) -> None:
+        path = self.path(structure.content_hash)
+        tmp_path = temp_path(path) + '.npz'
+        save_structure(structure, tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._touch(structure.content_hash, os.path.getsize(path))
+        self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'structures': len(self._sizes), 'bytes': self.current_bytes,
+                    'max_bytes': self.max_bytes}
+
+    def load_or_parse(self, digest: str, parse: Callable[[], Structure]) -> Structure:
+        """Load an archived structure, or parse and archive it."""
+        structure = self.load(digest)
+        if structure is None:
+            structure = parse()
+            self.save(structure)
+        return structure
+
+_archive: Optional[StructureArchive] = None
+_archive_lock = threading.Lock()
+
+def get_archive() -> StructureArchive:
+    """Return the archive configured by the environment."""
+    global _archive
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = StructureArchive()
+    return _archive
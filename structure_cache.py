@@ -0,0 +1,188 @@
+"""Process-wide, content-addressed cache for parsed structures and derived data."""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from atomic_write import write_text_atomic
+
+DEFAULT_MAX_BYTES = 1 << 30
+MAX_BYTES_ENV = 'STRUCTURE_CACHE_MAX_BYTES'
+METRICS_PATH_ENV = 'STRUCTURE_CACHE_METRICS_PATH'
+
+# Seconds between metrics file writes; every rerun asks, few need to write
+METRICS_INTERVAL = 10.0
+
+CacheKey = Tuple[str, Hashable]
+
+def estimate_size(value: Any) -> int:
+    """Approximate the memory held by a cached value in bytes."""
+    # Imported here so the app can import the cache without them; any
+    # value of their types has loaded them already
+    import numpy as np
+    import pandas as pd
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(value)
+
+class StructureCache:
+    """Thread-safe LRU cache keyed by (content key, artifact name).
+
+    The content key is a file hash or PDB ID; the artifact names what was
+    derived from it (``'structure'``, ``'residue_table'``, plot data, ...).
+    Entries are evicted least-recently-used first once the total estimated
+    size exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[CacheKey, Tuple[Any, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[CacheKey, threading.Lock] = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._metrics_written: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, cache_key: CacheKey) -> bool:
+        return cache_key in self._entries
+
+    def get(self, key: str, artifact: Hashable, default: Any = None) -> Any:
+        """Return a cached value, counting the lookup as a hit or miss."""
+        cache_key = (key, artifact)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, artifact: Hashable, value: Any, size: Optional[int] = None) -> None:
+        """Store a value, evicting older entries to stay within budget."""
+        cache_key = (key, artifact)
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            old = self._entries.pop(cache_key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            if size > self.max_bytes:
+                # Larger than the whole budget: hand back without caching
+                return
+            self._entries[cache_key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key: str, artifact: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value or compute, store and return it.
+
+        Concurrent callers asking for the same entry wait for a single
+        computation instead of repeating it.
+        """
+        cache_key = (key, artifact)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            key_lock = self._key_locks.setdefault(cache_key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(cache_key)
+                if entry is not None:
+                    # Computed by another caller while we waited
+                    self._entries.move_to_end(cache_key)
+                    self.hits += 1
+                    return entry[0]
+                self.misses += 1
+            try:
+                value = compute()
+                self.put(key, artifact, value)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(cache_key, None)
+        return value
+
+    def invalidate(self, key: str) -> None:
+        """Drop every artifact derived from ``key``."""
+        with self._lock:
+            for cache_key in [k for k in self._entries if k[0] == key]:
+                _, size = self._entries.pop(cache_key)
+                self.current_bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the cache counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def metrics_text(self, prefix: str = 'structure_cache') -> str:
+        """Render the counters in the Prometheus text exposition format."""
+        stats = self.stats()
+        kinds = {'hits': 'counter', 'misses': 'counter', 'evictions': 'counter',
+                 'entries': 'gauge', 'bytes': 'gauge', 'max_bytes': 'gauge'}
+        lines = []
+        for name, kind in kinds.items():
+            metric = f'{prefix}_{name}' + ('_total' if kind == 'counter' else '')
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.append(f'{metric} {stats[name]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self, path: str, min_interval: float = METRICS_INTERVAL) -> bool:
+        """Atomically write the metrics for a textfile collector to scrape.
+
+        Writes are skipped within ``min_interval`` seconds of the last one
+        from any session; returns whether the file was written.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._metrics_written is not None and now - self._metrics_written < min_interval:
+                return False
+            self._metrics_written = now
+        write_text_atomic(path, self.metrics_text())
+        return True
+
+_cache: Optional[StructureCache] = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> StructureCache:
+    """Return the process-wide cache shared by all sessions."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_bytes = int(os.environ.get(MAX_BYTES_ENV, DEFAULT_MAX_BYTES))
+                _cache = StructureCache(max_bytes)
+    return _cache
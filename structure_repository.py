@@ -0,0 +1,220 @@
+"""Local mirror of RCSB entries for the viewer, with bulk prefetch.
+
+Entries are gzipped files in the wwPDB "divided" layout, so an rsync of
+the wwPDB archive works as a repository as is::
+
+    <repository>/lo/1lol.cif.gz       mmCIF
+    <repository>/lo/pdb1lol.ent.gz    PDB
+
+Missing entries are downloaded into the repository in the background on
+first use, unless the node is offline; renders never wait on the network.
+Failed downloads are not retried for ``FAILURE_TTL`` seconds, and after
+a network error no entry is. Warm a repository from an ID list with::
+
+    python -m structure_repository 1LOL 4HHB --id-file ids.txt
+"""
+import argparse
+import gzip
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+from atomic_write import temp_path
+from structure_cache import get_cache
+
+REPOSITORY_DIR_ENV = 'STRUCTURE_REPOSITORY_DIR'
+REPOSITORY_URL_ENV = 'STRUCTURE_REPOSITORY_URL'
+OFFLINE_ENV = 'STRUCTURE_REPOSITORY_OFFLINE'
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'structure_repository')
+DEFAULT_URL = 'https://files.rcsb.org/download/{pdb_id}.cif.gz'
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_WORKERS = 4
+
+# Seconds a failed download is remembered before it is tried again
+FAILURE_TTL = 300.0
+
+# Cache artifact under which decompressed entry text is kept in memory
+CONTENT_ARTIFACT = 'molstar_content'
+
+class RepositoryError(Exception):
+    """Raised when an entry is neither in the repository nor downloadable."""
+
+class EntryPending(RepositoryError):
+    """Raised while a missing entry is downloaded in the background."""
+
+    def __init__(self, message: str, download: Future):
+        super().__init__(message)
+        self.download = download
+
+def normalize_id(pdb_id: str) -> str:
+    pdb_id = pdb_id.strip().lower()
+    if len(pdb_id) != 4 or not pdb_id.isalnum():
+        raise RepositoryError(f"Invalid PDB ID: {pdb_id!r}")
+    return pdb_id
+
+class StructureRepository:
+    """Directory of gzipped entries, filled from RCSB when online."""
+
+    def __init__(self, directory: Optional[str] = None, url: Optional[str] = None,
+                 offline: Optional[bool] = None):
+        self.directory = directory or os.environ.get(REPOSITORY_DIR_ENV) or DEFAULT_DIR
+        self.url = url or os.environ.get(REPOSITORY_URL_ENV) or DEFAULT_URL
+        if offline is None:
+            offline = os.environ.get(OFFLINE_ENV, '').lower() in ('1', 'true', 'yes')
+        self.offline = offline
+        self._failures: Dict[str, Tuple[float, str]] = {}
+        self._downloads: Dict[str, Future] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _candidates(self, pdb_id: str) -> List[Tuple[str, str]]:
+        folder = os.path.join(self.directory, pdb_id[1:3])
+        return [(os.path.join(folder, f'{pdb_id}.cif.gz'), 'mmcif'),
+                (os.path.join(folder, f'pdb{pdb_id}.ent.gz'), 'pdb')]
+
+    def find(self, pdb_id: str) -> Optional[Tuple[str, str]]:
+        """Path and format of a stored entry, or None."""
+        for path, file_format in self._candidates(normalize_id(pdb_id)):
+            if os.path.exists(path):
+                return path, file_format
+        return None
+
+    def _check_fetchable(self, pdb_id: str) -> None:
+        """Raise :class:`RepositoryError` if the entry should not be downloaded now."""
+        if self.offline:
+            raise RepositoryError(f"{pdb_id.upper()} is not in the local repository")
+        now = time.monotonic()
+        with self._lock:
+            # A network error is recorded under '' and blocks every entry
+            for key in (pdb_id, ''):
+                failure = self._failures.get(key)
+                if failure is None:
+                    continue
+                if now < failure[0]:
+                    raise RepositoryError(failure[1])
+                del self._failures[key]
+
+    def _fail(self, key: str, message: str) -> RepositoryError:
+        with self._lock:
+            self._failures[key] = (time.monotonic() + FAILURE_TTL, message)
+        return RepositoryError(message)
+
+    def fetch(self, pdb_id: str) -> str:
+        """Download an entry (as gzipped mmCIF) into the repository."""
+        pdb_id = normalize_id(pdb_id)
+        self._check_fetchable(pdb_id)
+        path = self._candidates(pdb_id)[0][0]
+        url = self.url.format(pdb_id=pdb_id.upper())
+        try:
+            with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+                data = response.read()
+        except urllib.error.HTTPError as e:
+            raise self._fail(pdb_id, f"Could not download {pdb_id.upper()}: {e}") from e
+        except OSError as e:
+            # Unreachable: remembered for every entry, so it is probed once
+            raise self._fail('', f"Could not download {pdb_id.upper()}: {e}") from e
+        if data[:2] != b'\x1f\x8b':
+            data = gzip.compress(data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = temp_path(path)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def fetch_async(self, pdb_id: str) -> Future:
+        """Download an entry in a background thread, once however often it is asked for."""
+        pdb_id = normalize_id(pdb_id)
+        with self._lock:
+            download = self._downloads.get(pdb_id)
+            if download is not None:
+                return download
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(DOWNLOAD_WORKERS, thread_name_prefix='repository')
+            download = self._pool.submit(self.fetch, pdb_id)
+            self._downloads[pdb_id] = download
+        download.add_done_callback(lambda _: self._download_done(pdb_id, download))
+        return download
+
+    def _download_done(self, pdb_id: str, download: Future) -> None:
+        error = download.exception()
+        with self._lock:
+            self._downloads.pop(pdb_id, None)
+            if error is not None and not isinstance(error, RepositoryError):
+                # e.g. the repository is not writable; download errors are recorded by fetch
+                self._failures[pdb_id] = (time.monotonic() + FAILURE_TTL,
+                                          f"Could not store {pdb_id.upper()}: {error}")
+
+    def load(self, pdb_id: str) -> Tuple[str, str]:
+        """Decompressed text and format of an entry.
+
+        Hot entries are served from the process-wide cache, so repeated
+        renders touch neither the disk nor the network. A missing entry is
+        downloaded in the background; :class:`EntryPending` is raised
+        until it is stored.
+        """
+        pdb_id = normalize_id(pdb_id)
+
+        def read() -> Tuple[str, str]:
+            found = self.find(pdb_id)
+            if found is None:
+                self._check_fetchable(pdb_id)
+                raise EntryPending(f"Downloading {pdb_id.upper()}...",
+                                   self.fetch_async(pdb_id))
+            path, file_format = found
+            with gzip.open(path, 'rt', errors='replace') as f:
+                return f.read(), file_format
+        return get_cache().get_or_compute(f'rcsb:{pdb_id}', CONTENT_ARTIFACT, read)
+
+    def prefetch(self, pdb_ids: Iterable[str], workers: int = 8) -> Dict[str, str]:
+        """Make sure entries are stored; returns a status per ID."""
+        def one(pdb_id: str) -> str:
+            try:
+                if self.find(pdb_id):
+                    return 'present'
+                self.fetch(pdb_id)
+                return 'fetched'
+            except RepositoryError as e:
+                return f'failed: {e}'
+        ids = list(dict.fromkeys(pdb_id.strip().upper() for pdb_id in pdb_ids if pdb_id.strip()))
+        with ThreadPoolExecutor(workers) as pool:
+            return dict(zip(ids, pool.map(one, ids)))
+
+_repository: Optional[StructureRepository] = None
+_repository_lock = threading.Lock()
+
+def get_repository() -> StructureRepository:
+    """Return the repository configured by the environment."""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                _repository = StructureRepository()
+    return _repository
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prefetch RCSB entries into the local repository.")
+    parser.add_argument('pdb_ids', nargs='*', metavar='PDB_ID')
+    parser.add_argument('--id-file', help="file of PDB IDs, separated by whitespace or commas")
+    parser.add_argument('--dir', help=f"repository directory (default: ${REPOSITORY_DIR_ENV} or {DEFAULT_DIR})")
+    parser.add_argument('--url', help="download URL template with a {pdb_id} field")
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    pdb_ids = list(args.pdb_ids)
+    if args.id_file:
+        with open(args.id_file) as f:
+            pdb_ids += f.read().replace(',', ' ').split()
+    repository = StructureRepository(args.dir, args.url, offline=False)
+    statuses = repository.prefetch(pdb_ids, args.workers)
+    for pdb_id, status in statuses.items():
+        print(f'{pdb_id} {status}')
+    return 1 if any(status.startswith('failed') for status in statuses.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""Residue and atom table component, imported on first use of a table."""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import streamlit as st
+import pandas as pd
+import numpy as np
+from filter_engine import filter_key
+from structure_cache import get_cache
+from ui_components import UIComponent
+
+class DataTable(UIComponent):
+    # Tables longer than this are paged even without a configured page_size;
+    # paged tables only send the visible slice to the browser
+    PAGING_THRESHOLD = 10000
+    DEFAULT_PAGE_SIZE = 100
+    # Detailed view shows values above these thresholds in red
+    HIGHLIGHT_THRESHOLDS = {'B-Factor': 60, 'SASA': 80}
+    # Display checkboxes and the residue-table column each one shows
+    DISPLAY_OPTION_COLUMNS = {'show_bfactor': 'B-Factor', 'show_sasa': 'SASA',
+                              'show_position': 'Position', 'show_chain': 'Chain'}
+
+    def _generate_sample_data(self) -> pd.DataFrame:
+        """Generate sample protein data."""
+        n_rows = 100
+        data = {
+            'Chain': np.random.choice(['A', 'B', 'C'], n_rows),
+            'Residue': np.random.choice(['ALA', 'GLY', 'SER', 'THR', 'VAL'], n_rows),
+            'Position': range(1, n_rows + 1),
+            'B-Factor': np.random.uniform(20, 80, n_rows).round(2),
+            'SASA': np.random.uniform(0, 100, n_rows).round(2)
+        }
+        return pd.DataFrame(data)
+
+    def _highlight(self, df: pd.DataFrame) -> pd.DataFrame:
+        """CSS per cell, computed as one vectorized mask per highlighted column."""
+        styles = pd.DataFrame('', index=df.index, columns=df.columns)
+        for column, threshold in self.HIGHLIGHT_THRESHOLDS.items():
+            if column in df:
+                values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+                styles[column] = np.where(values > threshold, 'color: red', 'color: black')
+        return styles
+
+    def _style_dataframe(self, df: pd.DataFrame, view_mode: str) -> pd.DataFrame:
+        """Apply styling based on view mode."""
+        if view_mode == 'Detailed':
+            return df.style.apply(self._highlight, axis=None)
+        return df
+
+    def _row_order(self, values: Union[np.ndarray, pd.Series], artifact: Optional[Tuple]) -> np.ndarray:
+        """Ascending (stable) row order for a column, cached per structure."""
+        def compute() -> np.ndarray:
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Structure categories are stored sorted, so codes order the rows
+                codes = values.cat.codes.to_numpy()
+            else:
+                # Factorizing first keeps string sorts out of Python comparisons
+                array = np.asarray(values)
+                codes = pd.factorize(array, sort=True)[0] if array.dtype == object else None
+            if codes is not None:
+                values_to_sort = np.where(codes < 0, len(codes), codes)
+            else:
+                values_to_sort = array
+            order = np.argsort(values_to_sort, kind='stable')
+            order.setflags(write=False)
+            return order
+        if artifact is None:
+            return compute()
+        return get_cache().get_or_compute(st.session_state.structure_hash, artifact, compute)
+
+    def _page_rows(self, config: Dict[str, Any], n_rows: int, columns: Sequence[str],
+                   column_values: Callable[[str], Union[np.ndarray, pd.Series]],
+                   order_artifact: Optional[Tuple]) -> np.ndarray:
+        """Render sort and page controls and return the visible row positions."""
+        key = config.get('key', 'data_table')
+        page_size = config.get('page_size', self.DEFAULT_PAGE_SIZE)
+        n_pages = max(1, -(-n_rows // page_size))
+        page_key = f"{key}_page"
+        if st.session_state.get(page_key, 1) > n_pages:
+            st.session_state[page_key] = n_pages
+        
+        sort_col, order_col, page_col = st.columns([2, 1, 1])
+        with sort_col:
+            sort_by = st.selectbox("Sort by", [None, *columns], key=f"{key}_sort",
+                                   format_func=lambda column: '(file order)' if column is None else column,
+                                   on_change=self._on_change(config))
+        with order_col:
+            descending = st.checkbox("Descending", key=f"{key}_descending",
+                                     on_change=self._on_change(config))
+        with page_col:
+            page = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages,
+                                   step=1, key=page_key,
+                                   on_change=self._on_change(config))
+        
+        start = (int(page) - 1) * page_size
+        stop = min(start + page_size, n_rows)
+        if sort_by is None:
+            rows = np.arange(n_rows)[::-1] if descending else np.arange(n_rows)
+        else:
+            artifact = None if order_artifact is None else (*order_artifact, sort_by)
+            rows = self._row_order(column_values(sort_by), artifact)
+            if descending:
+                rows = rows[::-1]
+        st.caption(f"Rows {start + 1 if n_rows else 0:,}–{stop:,} of {n_rows:,}")
+        return rows[start:stop]
+
+    def _visible_columns(self, config: Dict[str, Any], df: pd.DataFrame) -> List[str]:
+        """Configured (or picked) columns, minus those hidden by display options."""
+        data = config.get('data', {})
+        columns = data.get('columns') or list(df.columns)
+        if data.get('columns_key'):
+            columns = st.session_state.get(data['columns_key']) or columns
+        hidden = {column for option, column in self.DISPLAY_OPTION_COLUMNS.items()
+                  if st.session_state.get(option) is False}
+        return [column for column in columns if column in df and column not in hidden]
+
+    def _render_atoms(self, config: Dict[str, Any], view_mode: str) -> Any:
+        """Paged atom-level table built straight from the structure's arrays."""
+        structure = st.session_state.get('structure')
+        if structure is None:
+            return None
+        rows = self._page_rows(config, structure.n_atoms, structure.ATOM_COLUMNS,
+                               structure.atom_sort_key, ('atom_order',))
+        page = structure.atom_table(rows)
+        return st.dataframe(self._style_dataframe(page, view_mode), use_container_width=True)
+
+    def _render_upload_chains(self, job: Any) -> Any:
+        """Atoms per chain of the upload, counted as its text is parsed."""
+        if not job.chains:
+            return st.info(job.status)
+        st.caption(job.status)
+        return st.dataframe(pd.DataFrame({'Chain': list(job.chains), 'Atoms': list(job.chains.values())}),
+                            hide_index=True)
+
+    def render(self, config: Dict[str, Any]) -> Any:
+        view_mode = st.session_state.get('table_view_mode', 'Simple')
+        if ('upload_job' in st.session_state and 'structure' not in st.session_state
+                and config.get('data', {}).get('source') != 'batch'):
+            return self._upload_placeholder(config, self._render_upload_chains,
+                                            lambda job: job.structure is not None or job.done)
+        if config.get('data', {}).get('level') == 'atom':
+            return self._render_atoms(config, view_mode)
+        
+        order_artifact = None
+        source = config.get('data', {}).get('source')
+        protein_data = None if source == 'batch' else self._get_protein_data()
+        if source == 'batch':
+            # Stacked residue tables of the batch comparison, keyed by model
+            df = st.session_state.get('batch_table')
+            if df is None:
+                return None
+            df = df[self._visible_columns(config, df)]
+        elif protein_data is not None:
+            # Parsed upload takes precedence over configured sample data
+            # Display options only re-project the cached filtered rows
+            df = protein_data
+            columns = self._visible_columns(config, df)
+            if columns != list(df.columns):
+                df = df[columns]
+            if 'analysis_job' not in st.session_state:
+                # Row orders are shared per structure and filter set
+                order_artifact = ('residue_order', filter_key(st.session_state.get('current_filters', {})))
+        elif 'data' in config:
+            if config['data'].get('sample_data'):
+                df = self._generate_sample_data()
+            else:
+                df = pd.DataFrame(config['data'])
+        else:
+            return None
+        
+        if 'page_size' not in config and len(df) <= self.PAGING_THRESHOLD:
+            styled_df = self._style_dataframe(df, view_mode)
+            return st.dataframe(styled_df, use_container_width=True)
+        
+        rows = self._page_rows(config, len(df), list(df.columns),
+                               lambda column: df[column], order_artifact)
+        return st.dataframe(self._style_dataframe(df.iloc[rows], view_mode), use_container_width=True)
@@ -0,0 +1,59 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+import analysis_executor
+from analysis_executor import AnalysisExecutor
+from benchmarks.synthetic import write_structure
+from pdb_parser import parse_file
+
+def _die(handle, chain_id):
+    os._exit(1)
+
+def _fail(handle, chain_id):
+    raise ValueError("malformed chain")
+
+def _wait(job, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while not job.done:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.05)
+
+@pytest.fixture
+def structure(tmp_path, request):
+    structure = parse_file(write_structure(str(tmp_path / 'model.cif'), 500))
+    # Unique per test, so no table is served from the process-wide cache
+    structure.content_hash = f'{request.node.name}-{time.time_ns()}'
+    return structure
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setattr(analysis_executor, 'INLINE_MAX_ATOMS', 0)
+    executor = AnalysisExecutor(2)
+    yield executor
+    executor.shutdown()
+
+def test_resubmit_after_broken_pool(executor, structure, monkeypatch):
+    analyze_chain = analysis_executor._analyze_chain
+    monkeypatch.setattr(analysis_executor, '_analyze_chain', _die)
+    job = executor.submit(structure)
+    _wait(job)
+    assert isinstance(job.error, BrokenProcessPool)
+    assert job.structure is None
+
+    monkeypatch.setattr(analysis_executor, '_analyze_chain', analyze_chain)
+    retry = executor.submit(structure)
+    assert retry is not job
+    _wait(retry)
+    assert retry.error is None
+    assert len(retry.table()) == 500
+
+def test_failed_job_is_kept_until_ttl(executor, structure, monkeypatch):
+    monkeypatch.setattr(analysis_executor, '_analyze_chain', _fail)
+    job = executor.submit(structure)
+    _wait(job)
+    assert isinstance(job.error, ValueError)
+    assert executor.submit(structure) is job
+
+    monkeypatch.setattr(analysis_executor, 'FAILURE_TTL', 0.0)
+    assert executor.submit(structure) is not job
@@ -0,0 +1,58 @@
+import re
+import numpy as np
+import pytest
+import selection_query
+from selection_query import And, CompareClause, NameClause, QueryError, RangeClause, compile_query
+
+def documented_examples():
+    """The queries in the module docstring's table and its inline example."""
+    doc = selection_query.__doc__
+    table = doc.split('::', 1)[1].split('\n\n')[1]
+    examples = [re.split(r'\s{2,}', line.strip())[0] for line in table.splitlines()]
+    # The operators row lists keywords, not a query
+    examples = [example for example in examples if not example.startswith('not,')]
+    return examples + re.findall(r'``([^`]*\d[^`]*)``', doc)
+
+class Source:
+    """Selection source over a small residue table."""
+
+    def __init__(self):
+        self.columns = {
+            'Residue': np.array(['ALA', 'GLY', 'HIS', 'TRP', 'ALA']),
+            'Chain': np.array(['A', 'A', 'B', 'B', 'C']),
+            'Position': np.array([10, 20, 50, 80, 90]),
+            'B-Factor': np.array([30.0, 45.0, 70.0, 10.0, 50.0]),
+            'SASA': np.array([15.0, 25.0, 3.0, np.nan, 10.0]),
+        }
+
+    def name_mask(self, column, names):
+        return np.isin(self.columns[column], names)
+
+    def column(self, name):
+        return self.columns[name]
+
+def test_documented_examples_are_found():
+    assert 'bfactor > 40, sasa <= 20' in documented_examples()
+    assert len(documented_examples()) == 6
+
+@pytest.mark.parametrize('query', documented_examples())
+def test_documented_examples_parse(query):
+    mask = compile_query(query).evaluate(Source())
+    assert mask.dtype == bool and len(mask) == 5
+
+def test_comma_between_clauses_is_and():
+    plan = compile_query('bfactor > 40, sasa <= 20')
+    assert isinstance(plan.root, And)
+    assert all(isinstance(child, CompareClause) for child in plan.root.children)
+    assert plan.evaluate(Source()).tolist() == [False, False, True, False, True]
+    assert compile_query('bfactor > 40; sasa <= 20').evaluate(Source()).tolist() == \
+        [False, False, True, False, True]
+
+def test_commas_inside_lists():
+    assert isinstance(compile_query('ALA, GLY').root, NameClause)
+    root = compile_query('resi 10-50, 80').root
+    assert isinstance(root, RangeClause) and root.ranges == ((10, 50), (80, 80))
+
+def test_trailing_comma_is_an_error():
+    with pytest.raises(QueryError):
+        compile_query('bfactor > 40,')
@@ -0,0 +1,278 @@
+"""Lazily read trajectories: multi-MODEL PDB files and a memory-mapped binary format.
+
+All frames share the topology of the first model; only coordinates are
+read, one frame or window of frames at a time, so a trajectory never has
+to fit in memory. The binary ``.trj`` layout is::
+
+    'STRJ' | uint32 version | uint32 n_frames | uint32 n_atoms    (little endian)
+    float32 coordinates, shape (n_frames, n_atoms, 3)
+
+Convert a multi-model PDB file with::
+
+    python -m trajectory models.pdb models.trj
+"""
+import argparse
+import mmap
+import os
+import shutil
+import sys
+from abc import ABC, abstractmethod
+from typing import Any, Iterator, List, Optional, Tuple
+import numpy as np
+from atomic_write import temp_path
+from pdb_parser import parse_file, parse_pdb_coords
+from structure import Structure
+
+TRAJECTORY_DIR_ENV = 'TRAJECTORY_DIR'
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'trajectories')
+
+MAGIC = b'STRJ'
+FORMAT_VERSION = 1
+HEADER = np.dtype([('magic', 'S4'), ('version', '<u4'), ('n_frames', '<u4'), ('n_atoms', '<u4')])
+
+# Cache artifact under which the open trajectory of an upload is kept
+TRAJECTORY_ARTIFACT = 'trajectory'
+
+class TrajectoryError(ValueError):
+    """Raised when a file is malformed or its frames do not match the topology."""
+
+def has_multiple_models(data: Any) -> bool:
+    """Whether PDB text (bytes or mmap) holds more than one MODEL.
+
+    Uses ``find`` like :func:`model_offsets`; a multiline regular
+    expression is ten times slower and holds the GIL throughout.
+    """
+    first = 0 if data[:6] == b'MODEL ' else data.find(b'\nMODEL ')
+    return first != -1 and data.find(b'\nMODEL ', first + 1) != -1
+
+def model_offsets(data: Any) -> np.ndarray:
+    """Byte offset of every MODEL record, followed by the end of the text.
+
+    ``data`` is bytes or an mmap, whose ``find`` scans far faster than a
+    multiline regular expression.
+    """
+    starts = [0] if data[:6] == b'MODEL ' else []
+    position = data.find(b'\nMODEL ')
+    while position != -1:
+        starts.append(position + 1)
+        position = data.find(b'\nMODEL ', position + 1)
+    return np.array((starts or [0]) + [len(data)], dtype=np.int64)
+
+class Trajectory(ABC):
+    """Frames over one topology, read on demand."""
+
+    def __init__(self, topology: Structure, n_frames: int):
+        self.topology = topology
+        self.n_frames = n_frames
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def _check_index(self, index: int) -> int:
+        if not 0 <= index < self.n_frames:
+            raise IndexError(f"frame {index} out of range (0-{self.n_frames - 1})")
+        return index
+
+    @abstractmethod
+    def frame(self, index: int) -> np.ndarray:
+        """Coordinates of one frame, shape (n_atoms, 3)."""
+        pass
+
+    def window(self, start: int, stop: int) -> np.ndarray:
+        """Coordinates of frames ``start`` to ``stop``, shape (frames, n_atoms, 3)."""
+        return np.stack([self.frame(i) for i in range(start, stop)])
+
+    def windows(self, size: int, start: int = 0, stop: Optional[int] = None
+                ) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (first frame, window) for consecutive windows of ``size`` frames."""
+        stop = self.n_frames if stop is None else min(stop, self.n_frames)
+        for first in range(start, stop, size):
+            yield first, self.window(first, min(first + size, stop))
+
+    def structure(self, index: int) -> Structure:
+        """The topology at one frame's coordinates."""
+        return self.topology.with_coords(self.frame(index))
+
+    def close(self) -> None:
+        pass
+
+class PDBTrajectory(Trajectory):
+    """Multi-MODEL PDB file, memory-mapped.
+
+    MODEL records are indexed once; seeking parses only that model's text.
+    """
+
+    def __init__(self, path: str, topology: Optional[Structure] = None):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = model_offsets(self._map)
+        super().__init__(topology if topology is not None else parse_file(path),
+                         len(self.offsets) - 1)
+
+    def frame(self, index: int) -> np.ndarray:
+        index = self._check_index(index)
+        coords = parse_pdb_coords(self._map[self.offsets[index]:self.offsets[index + 1]])
+        if len(coords) != self.topology.n_atoms:
+            raise TrajectoryError(f"model {index + 1} has {len(coords)} atoms, "
+                                  f"the topology has {self.topology.n_atoms}")
+        return coords
+
+    def close(self) -> None:
+        self._map.close()
+
+class BinaryTrajectory(Trajectory):
+    """``.trj`` file; frames are views of a read-only memory map."""
+
+    def __init__(self, path: str, topology: Structure):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER, count=1)
+        if not header.size or header['magic'][0] != MAGIC:
+            raise TrajectoryError(f"{path} is not a trajectory file")
+        if int(header['version'][0]) != FORMAT_VERSION:
+            raise TrajectoryError(f"unsupported trajectory version {int(header['version'][0])}")
+        n_frames, n_atoms = int(header['n_frames'][0]), int(header['n_atoms'][0])
+        if n_atoms != topology.n_atoms:
+            raise TrajectoryError(f"{path} has {n_atoms} atoms per frame, "
+                                  f"the topology has {topology.n_atoms}")
+        self._frames = np.memmap(path, dtype='<f4', mode='r', offset=HEADER.itemsize,
+                                 shape=(n_frames, n_atoms, 3))
+        super().__init__(topology, n_frames)
+
+    def frame(self, index: int) -> np.ndarray:
+        return self._frames[self._check_index(index)].view(np.ndarray)
+
+    def window(self, start: int, stop: int) -> np.ndarray:
+        return self._frames[start:stop].view(np.ndarray)
+
+class TrajectoryWriter:
+    """Appends frames to a ``.trj`` file, which appears only once committed."""
+
+    def __init__(self, path: str, n_atoms: int):
+        self.path = path
+        self.n_atoms = n_atoms
+        self.n_frames = 0
+        self._tmp_path = temp_path(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(bytes(HEADER.itemsize))
+
+    def append(self, frames: np.ndarray) -> None:
+        """Write one frame (n_atoms, 3) or a window of frames."""
+        frames = np.ascontiguousarray(frames, dtype='<f4').reshape(-1, self.n_atoms, 3)
+        self._file.write(frames.tobytes())
+        self.n_frames += len(frames)
+
+    def commit(self) -> None:
+        header = np.array([(MAGIC, FORMAT_VERSION, self.n_frames, self.n_atoms)], dtype=HEADER)
+        self._file.seek(0)
+        self._file.write(header.tobytes())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+def convert(source: Trajectory, path: str, window: int = 256) -> BinaryTrajectory:
+    """Write a trajectory to a ``.trj`` file, streaming it window by window."""
+    writer = TrajectoryWriter(path, source.topology.n_atoms)
+    try:
+        for _, frames in source.windows(window):
+            writer.append(frames)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
+    return BinaryTrajectory(path, source.topology)
+
+class TrajectoryStore:
+    """Uploaded trajectories spilled to disk, keyed by content hash.
+
+    The upload's spooled text is kept as the frame source until the first
+    full analysis pass has written the binary copy; the text is removed
+    then, and frames are served from the binary copy.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.environ.get(TRAJECTORY_DIR_ENV) or DEFAULT_DIR
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.directory, f'{digest}.{extension}')
+
+    def has_frames(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest, 'trj')) or os.path.exists(self.path(digest, 'pdb'))
+
+    def adopt(self, digest: str, spool_path: str) -> None:
+        """Take over a spooled copy of the upload's text, moving it into the store."""
+        if self.has_frames(digest):
+            os.remove(spool_path)
+            return
+        text_path = self.path(digest, 'pdb')
+        try:
+            os.replace(spool_path, text_path)
+        except OSError:
+            # Spool on another file system
+            tmp_path = temp_path(text_path)
+            shutil.copyfile(spool_path, tmp_path)
+            os.replace(tmp_path, text_path)
+            os.remove(spool_path)
+
+    def remove_text(self, digest: str) -> None:
+        """Drop the text copy once the binary copy is written; open maps stay valid."""
+        try:
+            os.remove(self.path(digest, 'pdb'))
+        except FileNotFoundError:
+            pass
+
+    def _open_binary(self, digest: str, topology: Structure) -> Optional[Trajectory]:
+        binary_path = self.path(digest, 'trj')
+        if not os.path.exists(binary_path):
+            return None
+        try:
+            return BinaryTrajectory(binary_path, topology)
+        except (OSError, ValueError):
+            # Unreadable or outdated: served from the text again
+            return None
+
+    def open(self, digest: str, topology: Structure) -> Optional[Trajectory]:
+        """The stored frames, from the binary copy if there is one; None if none are stored."""
+        trajectory = self._open_binary(digest, topology)
+        if trajectory is not None:
+            return trajectory
+        try:
+            return PDBTrajectory(self.path(digest, 'pdb'), topology)
+        except FileNotFoundError:
+            # Converted since the binary copy was looked for
+            return self._open_binary(digest, topology)
+
+_store: Optional[TrajectoryStore] = None
+
+def get_trajectory_store() -> TrajectoryStore:
+    """Return the trajectory store configured by the environment."""
+    global _store
+    if _store is None:
+        _store = TrajectoryStore()
+    return _store
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert a multi-model PDB file to a .trj trajectory.")
+    parser.add_argument('source', help="multi-model PDB file")
+    parser.add_argument('target', help="output .trj file")
+    args = parser.parse_args(argv)
+
+    source = PDBTrajectory(args.source)
+    try:
+        target = convert(source, args.target)
+    except TrajectoryError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 1
+    finally:
+        source.close()
+    print(f'{target.n_frames} frames of {target.topology.n_atoms} atoms written to {args.target}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
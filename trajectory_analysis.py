@@ -0,0 +1,212 @@
+"""Windowed, incremental per-residue statistics over trajectory frames."""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from structure import Structure
+from structure_analysis import layout_dihedrals, residue_layout
+from structure_cache import get_cache
+from trajectory import (TRAJECTORY_ARTIFACT, BinaryTrajectory, Trajectory, TrajectoryStore,
+                        TrajectoryWriter)
+
+# Coordinates (atoms x frames) aligned at once; bounds the window memory
+WINDOW_COORDS = 1 << 21
+MAX_WINDOW_FRAMES = 256
+RAMACHANDRAN_BINS = 72
+
+# Isotropic B-factor of an atom with mean-square fluctuation <u²>
+B_FACTOR_SCALE = 8 * np.pi ** 2 / 3
+
+# Seconds a failed analysis is kept (and its error shown) before the same
+# upload is analyzed again; a new upload of the content retries at once
+FAILURE_TTL = 300.0
+
+# Artifact under which finished statistics are cached per trajectory
+STATS_ARTIFACT = ('trajectory', 'stats')
+
+def window_frames(n_atoms: int) -> int:
+    return int(np.clip(WINDOW_COORDS // max(n_atoms, 1), 1, MAX_WINDOW_FRAMES))
+
+def superpose(frames: np.ndarray, reference: np.ndarray, fit: np.ndarray) -> np.ndarray:
+    """Rigidly fit every frame onto the reference (Kabsch), using the ``fit`` atoms."""
+    target = reference[fit] - reference[fit].mean(axis=0)
+    centers = frames[:, fit].mean(axis=1, keepdims=True)
+    covariance = np.einsum('kni,nj->kij', frames[:, fit] - centers, target)
+    u, _, vt = np.linalg.svd(covariance)
+    # Flip the last axis where needed so rotations are proper
+    u[:, :, -1] *= np.sign(np.linalg.det(u @ vt))[:, None]
+    return (frames - centers) @ (u @ vt) + reference[fit].mean(axis=0)
+
+class TrajectoryStats:
+    """Running mean and variance of fitted atom positions, and a phi/psi histogram.
+
+    Windows are merged with the pairwise (Chan et al.) variance update, so
+    every frame is read once and memory does not grow with the number of
+    frames.
+    """
+
+    def __init__(self, topology: Structure, bins: int = RAMACHANDRAN_BINS):
+        self.layout = residue_layout(topology)
+        self.reference = topology.coords.astype(np.float64)
+        ca = np.flatnonzero((topology.atom_name == b'CA') & ~topology.record)
+        self.fit = ca if ca.size >= 3 else np.arange(topology.n_atoms)
+        self.n_frames = 0
+        self.mean = np.zeros_like(self.reference)
+        self.m2 = np.zeros_like(self.reference)
+        self.bins = bins
+        self.histogram = np.zeros((bins, bins), dtype=np.int64)
+
+    def update(self, window: np.ndarray) -> None:
+        """Add a window of frames, shape (frames, n_atoms, 3)."""
+        frames = superpose(window.astype(np.float64), self.reference, self.fit)
+        n, k = self.n_frames, len(frames)
+        mean = frames.mean(axis=0)
+        delta = mean - self.mean
+        self.mean += delta * (k / (n + k))
+        self.m2 += ((frames - mean) ** 2).sum(axis=0) + delta ** 2 * (n * k / (n + k))
+        self.n_frames = n + k
+
+        phi, psi = layout_dihedrals(self.layout, window[:, self.layout.atoms])
+        defined = np.isfinite(phi) & np.isfinite(psi)
+        counts, _, _ = np.histogram2d(phi[defined], psi[defined], bins=self.bins,
+                                      range=[(-180.0, 180.0), (-180.0, 180.0)])
+        self.histogram += counts.astype(np.int64)
+
+    @property
+    def nbytes(self) -> int:
+        return self.reference.nbytes + self.mean.nbytes + self.m2.nbytes + self.histogram.nbytes
+
+    def atom_fluctuations(self) -> np.ndarray:
+        """Mean-square fluctuation of every atom around its mean position (Å²)."""
+        if not self.n_frames:
+            return np.zeros(len(self.mean))
+        return self.m2.sum(axis=1) / self.n_frames
+
+    def residue_table(self) -> pd.DataFrame:
+        """RMSF and fluctuation-derived B-factor per polymer residue."""
+        layout = self.layout
+        msf = self.atom_fluctuations()[layout.atoms]
+        residue_msf = (np.add.reduceat(msf, layout.starts) / layout.counts
+                       if layout.n_residues else msf[:0])
+        return pd.DataFrame({
+            'Chain': layout.chain_id.to_pandas(),
+            'Residue': layout.res_name.to_pandas(),
+            'Position': layout.res_seq,
+            'RMSF': np.sqrt(residue_msf).round(3),
+            'B-Factor (MD)': (B_FACTOR_SCALE * residue_msf).round(2),
+        }, copy=False)
+
+    def ramachandran(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(phi centers, psi centers, counts[psi, phi]) over all frames so far."""
+        edges = np.linspace(-180.0, 180.0, self.bins + 1)
+        centers = (edges[:-1] + edges[1:]) / 2
+        return centers, centers, self.histogram.T
+
+class TrajectoryJob:
+    """One pass over every frame in a background thread, shared by sessions.
+
+    While the pass runs, the statistics cover the frames read so far. The
+    frames are also written to the binary copy in ``store`` (when given),
+    from which the trajectory is served once the pass is complete; the
+    store's text copy is removed then.
+    """
+
+    def __init__(self, key: str, trajectory: Trajectory, stats: Optional[TrajectoryStats] = None,
+                 store: Optional[TrajectoryStore] = None, upload_id: Optional[str] = None):
+        self.key = key
+        self.trajectory = trajectory
+        self.store = store
+        self.upload_id = upload_id
+        self.error: Optional[BaseException] = None
+        self.failed_at: Optional[float] = None
+        self._stats = stats or TrajectoryStats(trajectory.topology)
+        self._done = stats is not None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self._done or self.error is not None
+
+    @property
+    def progress(self) -> float:
+        if self._done:
+            return 1.0
+        return self._stats.n_frames / self.trajectory.n_frames if self.trajectory.n_frames else 0.0
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return f'Trajectory analysis failed: {self.error}'
+        if self._done:
+            return f'Trajectory analyzed: {self._stats.n_frames:,} frames'
+        return f'Analyzing trajectory: {self._stats.n_frames:,} of {self.trajectory.n_frames:,} frames'
+
+    def residue_table(self) -> pd.DataFrame:
+        with self._lock:
+            return self._stats.residue_table()
+
+    def ramachandran(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        with self._lock:
+            centers, _, counts = self._stats.ramachandran()
+            return centers, centers, counts.copy()
+
+    @property
+    def n_frames(self) -> int:
+        return self._stats.n_frames
+
+    def start(self) -> 'TrajectoryJob':
+        if not self._done:
+            threading.Thread(target=self._run, name='trajectory-analysis', daemon=True).start()
+        return self
+
+    def _run(self) -> None:
+        trajectory = self.trajectory
+        writer = None
+        if self.store is not None and not isinstance(trajectory, BinaryTrajectory):
+            writer = TrajectoryWriter(self.store.path(self.key, 'trj'), trajectory.topology.n_atoms)
+        try:
+            for _, window in trajectory.windows(window_frames(trajectory.topology.n_atoms)):
+                if writer is not None:
+                    writer.append(window)
+                with self._lock:
+                    self._stats.update(window)
+        except Exception as e:
+            if writer is not None:
+                writer.abort()
+            self.failed_at = time.monotonic()
+            self.error = e
+            return
+        cache = get_cache()
+        if writer is not None:
+            writer.commit()
+            # Later seeks read the memory-mapped copy instead of parsing text
+            cache.put(self.key, TRAJECTORY_ARTIFACT, BinaryTrajectory(writer.path, trajectory.topology))
+            self.store.remove_text(self.key)
+        cache.put(self.key, STATS_ARTIFACT, self._stats)
+        self._done = True
+
+_jobs: Dict[str, TrajectoryJob] = {}
+_jobs_lock = threading.Lock()
+
+def analyze_trajectory(key: str, trajectory: Trajectory, store: Optional[TrajectoryStore] = None,
+                       upload_id: Optional[str] = None) -> TrajectoryJob:
+    """Return the analysis job of a trajectory, starting it if needed.
+
+    A failed job is returned (with its error) until ``FAILURE_TTL`` has
+    passed or the content is uploaded again under another ``upload_id``.
+    """
+    stats = get_cache().get(key, STATS_ARTIFACT)
+    if stats is not None:
+        return TrajectoryJob(key, trajectory, stats)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is not None and (job.error is None or (
+                job.upload_id == upload_id and time.monotonic() - job.failed_at < FAILURE_TTL)):
+            return job
+        job = TrajectoryJob(key, trajectory, store=store, upload_id=upload_id).start()
+        _jobs[key] = job
+        # Finished jobs are served from the cache
+        for other_key in [k for k, other in _jobs.items() if other._done]:
+            del _jobs[other_key]
+        return job
@@ -1,12 +1,71 @@
-"""UI Components for Streamlit UI Loader."""
+"""UI Components for Streamlit UI Loader.
+
+Only the widgets and containers live here. The components built on the
+heavy libraries (the Mol* viewer, the tables and the plots) are in modules
+of their own, which the loader's registry imports the first time a
+configuration renders one of them.
+"""
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, Mapping, Optional, Sequence
 import streamlit as st
-from streamlit_molstar import st_molstar, st_molstar_rcsb
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
+from render_profiler import get_profiler
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Session key holding the fragment keys rendered since the last full run
+RENDERED_FRAGMENTS_KEY = '_ui_rendered_fragments'
+
+# Seconds between refreshes of the placeholders shown while an upload is read
+UPLOAD_POLL_INTERVAL = 0.5
+
+# Plot types that can overlay the models of a batch comparison:
+# residue-table column, axis label and title
+OVERLAY_PLOTS = {
+    'bfactor_distribution': ('B-Factor', 'B-factor', 'B-factor Distribution by Model'),
+    'hydropathy': ('Hydropathy', 'Hydropathy', 'Hydropathy by Model'),
+}
+
+def rerun_fragments(fragment_keys: Sequence[str]) -> None:
+    """Widget callback that reruns only the given fragments.
+    
+    Fragments that were not rendered in the current run (and so are unknown to
+    Streamlit) are skipped; with no targets left the default rerun applies.
+    """
+    rendered = st.session_state.get(RENDERED_FRAGMENTS_KEY, set())
+    targets = [key for key in fragment_keys if key in rendered]
+    if targets:
+        st.rerun(targets)
+
+def _fragment_body(fragment_key: str, render: Callable[[], Any]) -> Any:
+    st.session_state.setdefault(RENDERED_FRAGMENTS_KEY, set()).add(fragment_key)
+    return render()
+
+def render_fragment(fragment_key: str, render: Callable[[], Any],
+                    run_every: Optional[float] = None) -> Any:
+    """Render a subtree as a keyed fragment that can rerun on its own."""
+    return st.fragment(_fragment_body, key=fragment_key, run_every=run_every)(fragment_key, render)
+
+def render_node(component_registry: Mapping[str, 'UIComponent'], config: Dict[str, Any]) -> Any:
+    """Render a configured node, isolating it in a fragment when requested.
+    
+    A fragment with ``run_every`` reruns on that interval (in seconds); with
+    ``poll_while`` it only does so while that session key is set.
+    """
+    component = component_registry.get(config['type'])
+    if component is None:
+        return None
+    render = partial(component.render, config)
+    profiler = get_profiler()
+    if profiler is not None:
+        render = partial(profiler.measure, config, render)
+    if config.get('fragment'):
+        run_every = config.get('run_every')
+        if 'poll_while' in config and not st.session_state.get(config['poll_while']):
+            run_every = None
+        return render_fragment(config['key'], render, run_every)
+    return render()
 
 class UIComponent(ABC):
     """Abstract base class for UI components."""
@@ -21,6 +80,54 @@ class UIComponent(ABC):
         if key not in st.session_state:
             st.session_state[key] = default
         return st.session_state[key]
+    
+    def _on_change(self, config: Dict[str, Any]) -> Optional[Callable[[], None]]:
+        """Callback rerunning the fragments that declared a dependency on this widget."""
+        fragments = config.get('_rerun_fragments')
+        if not fragments:
+            return None
+        return partial(rerun_fragments, fragments)
+    
+    def _upload_placeholder(self, config: Dict[str, Any], render: Callable[[Any], Any],
+                            ready: Callable[[Any], bool]) -> Optional[Any]:
+        """While an upload is being read, render ``render(job)`` in its place.
+        
+        The placeholder polls the job in a fragment of its own, filling in
+        as the job's stages complete; once ``ready(job)`` the app reruns to
+        show what the component was waiting for.
+        """
+        job = st.session_state.get('upload_job')
+        if job is None:
+            return None
+        
+        def poll() -> Any:
+            if ready(job):
+                st.rerun()
+            return render(job)
+        return render_fragment(f"{config['key']}_upload", poll, run_every=UPLOAD_POLL_INTERVAL)
+    
+    def _get_protein_data(self) -> Optional['pd.DataFrame']:
+        """Get the parsed residue table with the applied filters' mask.
+        
+        The filtered rows are cached per structure and data filter set, so
+        every component of a run (and every session) shares one copy.
+        """
+        if 'protein_data' not in st.session_state:
+            return None
+        df = st.session_state.protein_data
+        engine = st.session_state.get('filter_engine')
+        filters = st.session_state.get('current_filters')
+        if engine is None or not filters:
+            return df
+        # Loaded with the first structure, not with the components
+        from filter_engine import filter_key
+        from structure_cache import get_cache
+        if 'analysis_job' in st.session_state:
+            # The table is still filling in; don't cache partial results
+            return engine.apply(df, filters)
+        return get_cache().get_or_compute(st.session_state.structure_hash,
+                                          ('filtered_residues', filter_key(filters)),
+                                          lambda: engine.apply(df, filters))
 
 class TextInput(UIComponent):
     def render(self, config: Dict[str, Any]) -> Any:
@@ -39,7 +146,8 @@ class TextInput(UIComponent):
             label=label,
             value=default,
             placeholder=placeholder,
-            key=key
+            key=key,
+            on_change=self._on_change(config)
         )
 
 class TextArea(UIComponent):
@@ -57,7 +165,8 @@ class TextArea(UIComponent):
         return st.text_area(
             label=label,
             value=default,
-            key=key
+            key=key,
+            on_change=self._on_change(config)
         )
 
 class MultiSelect(UIComponent):
@@ -77,7 +186,8 @@ class MultiSelect(UIComponent):
             label=label,
             options=options,
             default=default,
-            key=key
+            key=key,
+            on_change=self._on_change(config)
         )
 
 class Select(UIComponent):
@@ -102,7 +212,8 @@ class Select(UIComponent):
             label=label,
             options=options,
             index=default_index,
-            key=key
+            key=key,
+            on_change=self._on_change(config)
         )
 
 class Slider(UIComponent):
@@ -124,7 +235,8 @@ class Slider(UIComponent):
             min_value=min_value,
             max_value=max_value,
             value=default,
-            key=key
+            key=key,
+            on_change=self._on_change(config)
         )
 
 class NumberInput(UIComponent):
@@ -146,7 +258,8 @@ class NumberInput(UIComponent):
             min_value=min_value,
             max_value=max_value,
             value=default,
-            key=key
+            key=key,
+            on_change=self._on_change(config)
         )
 
 class Checkbox(UIComponent):
@@ -164,7 +277,8 @@ class Checkbox(UIComponent):
         return st.checkbox(
             label=label,
             value=default,
-            key=key
+            key=key,
+            on_change=self._on_change(config)
         )
 
 class CheckboxGroup(UIComponent):
@@ -187,12 +301,20 @@ class CheckboxGroup(UIComponent):
             result = st.checkbox(
                 label=label,
                 value=default,
-                key=key
+                key=key,
+                on_change=self._on_change(item)
             )
             results.append(result)
         return results
 
 class Button(UIComponent):
+    def _run_action(self, action_key: str, config: Dict[str, Any]) -> None:
+        """Run the action as a click callback, then rerun dependent fragments."""
+        st.session_state[action_key]()
+        on_change = self._on_change(config)
+        if on_change:
+            on_change()
+
     def render(self, config: Dict[str, Any]) -> Any:
         """Render a button with callback."""
         key = config['key']
@@ -202,7 +324,12 @@ class Button(UIComponent):
         if 'action' in config:
             action_key = f"action_{config['action']}"
             button_key = f"{key}_{config['action']}"
-            if action_key in st.session_state:
+            if action_key in st.session_state and config.get('updates'):
+                # Actions that declare the state they update run before the
+                # rerun so only the fragments depending on it need to rerun
+                return st.button(label=label, key=button_key,
+                                 on_click=self._run_action, args=(action_key, config))
+            elif action_key in st.session_state:
                 if st.button(label=label, key=button_key):
                     st.session_state[action_key]()
                     return True
@@ -230,12 +357,43 @@ class JsonView(UIComponent):
         return data
 
 class FileUploader(UIComponent):
+    def _run_action(self, action_key: str, config: Dict[str, Any]) -> None:
+        """Hand the new upload to its action, then rerun dependent fragments."""
+        st.session_state[action_key]()
+        on_change = self._on_change(config)
+        if on_change:
+            on_change()
+
     def render(self, config: Dict[str, Any]) -> Any:
+        on_change = self._on_change(config)
+        if 'action' in config and f"action_{config['action']}" in st.session_state:
+            on_change = partial(self._run_action, f"action_{config['action']}", config)
         return st.file_uploader(
             label=config['label'],
             key=config['key'],
             type=config.get('accept_types'),
-            on_change=config.get('on_change')
+            accept_multiple_files=config.get('multiple', False),
+            on_change=on_change
+        )
+
+class FrameSlider(UIComponent):
+    def render(self, config: Dict[str, Any]) -> Any:
+        """Pick a frame of the loaded trajectory; hidden for single models."""
+        trajectory = st.session_state.get('trajectory')
+        if trajectory is None:
+            return None
+        job = st.session_state.get('trajectory_analysis')
+        if job is not None and job.error is not None:
+            st.warning(job.status)
+        key = config['key']
+        if st.session_state.get(key, 0) >= trajectory.n_frames:
+            st.session_state[key] = 0
+        return st.slider(
+            label=config.get('label', 'Frame'),
+            min_value=0,
+            max_value=trajectory.n_frames - 1,
+            key=key,
+            on_change=self._on_change(config)
         )
 
 class Text(UIComponent):
@@ -245,153 +403,93 @@ class Text(UIComponent):
         else:
             return st.text(config['content'])
 
-class MolstarViewer(UIComponent):
+class Progress(UIComponent):
     def render(self, config: Dict[str, Any]) -> Any:
-        if 'sample_data' in config:
-            sample = config['sample_data']
-            if sample['type'] == 'rcsb':
-                return st_molstar_rcsb(sample['pdb_id'], height=config.get('height', 400))
-        elif 'file_uploader' in st.session_state and st.session_state.file_uploader is not None:
-            return st_molstar(st.session_state.file_uploader, height=config.get('height', 400))
-        return None
+        """Show a static value, or track the session entry named by ``value_key``.
+        
+        The entry is either a fraction or a task exposing ``progress``,
+        ``done`` and ``status``; once a task is done it is removed and the
+        app reruns to pick up its results.
+        """
+        value = config.get('value', 0.0)
+        text = config.get('text')
+        value_key = config.get('value_key')
+        if value_key is not None:
+            source = st.session_state.get(value_key)
+            if source is None:
+                return None
+            if hasattr(source, 'progress'):
+                if source.done:
+                    del st.session_state[value_key]
+                    st.rerun()
+                value, text = source.progress, source.status
+            else:
+                value = source
+        return st.progress(float(value), text=text)
 
 class Expander(UIComponent):
-    def __init__(self, component_registry: Dict[str, UIComponent]):
+    def __init__(self, component_registry: Mapping[str, UIComponent]):
         self.component_registry = component_registry
         
     def render(self, config: Dict[str, Any]) -> Any:
         with st.expander(label=config['label'], expanded=config.get('expanded', False)):
             results = []
             for child in config.get('components', []):
-                component = self.component_registry.get(child['type'])
-                if component:
-                    result = component.render(child)
+                if child['type'] in self.component_registry:
+                    result = render_node(self.component_registry, child)
                     results.append(result)
             return results
 
 class Tabs(UIComponent):
-    def __init__(self, component_registry: Dict[str, UIComponent]):
+    def __init__(self, component_registry: Mapping[str, UIComponent]):
         self.component_registry = component_registry
         
+    def _render_tab(self, tab_config: Dict[str, Any]) -> Any:
+        tab_results = []
+        for component in tab_config.get('components', []):
+            if component['type'] in self.component_registry:
+                result = render_node(self.component_registry, component)
+                tab_results.append(result)
+        return tab_results
+
+    def _visible_tabs(self, config: Dict[str, Any], tabs: Sequence[Any]) -> Sequence[bool]:
+        """Decide which tabs to build for lazy tab groups.
+        
+        ``"lazy": true`` builds only the selected tab. ``"lazy": "keep_visited"``
+        builds a tab the first time it is selected and keeps it built after
+        that, so switching back to it needs no rerun.
+        """
+        lazy = config.get('lazy')
+        if not lazy:
+            return [True] * len(tabs)
+        is_open = [tab.open is not False for tab in tabs]
+        if lazy == 'keep_visited':
+            visited = st.session_state.setdefault(f"{config['key']}_visited", set())
+            visited.update(tab_config['label'] for tab_config, opened
+                           in zip(config['tabs'], is_open) if opened)
+            return [tab_config['label'] in visited for tab_config in config['tabs']]
+        return is_open
+
     def render(self, config: Dict[str, Any]) -> Any:
-        tabs = st.tabs([tab['label'] for tab in config['tabs']])
+        labels = [tab['label'] for tab in config['tabs']]
+        if config.get('lazy'):
+            # Track the selected tab so hidden tabs can be skipped
+            tabs = st.tabs(labels, key=config['key'], on_change='rerun')
+        else:
+            tabs = st.tabs(labels)
         results = []
-        for tab, tab_config in zip(tabs, config['tabs']):
+        for tab, tab_config, visible in zip(tabs, config['tabs'], self._visible_tabs(config, tabs)):
+            if not visible:
+                results.append(None)
+                continue
             with tab:
-                tab_results = []
-                for component in tab_config.get('components', []):
-                    comp = self.component_registry.get(component['type'])
-                    if comp:
-                        result = comp.render(component)
-                        tab_results.append(result)
+                if tab_config.get('fragment'):
+                    tab_results = render_fragment(tab_config['key'], partial(self._render_tab, tab_config))
+                else:
+                    tab_results = self._render_tab(tab_config)
                 results.append(tab_results)
         return results
 
-class DataTable(UIComponent):
-    def _generate_sample_data(self) -> pd.DataFrame:
-        """Generate sample protein data."""
-        n_rows = 100
-        data = {
-            'Chain': np.random.choice(['A', 'B', 'C'], n_rows),
-            'Residue': np.random.choice(['ALA', 'GLY', 'SER', 'THR', 'VAL'], n_rows),
-            'Position': range(1, n_rows + 1),
-            'B-Factor': np.random.uniform(20, 80, n_rows).round(2),
-            'SASA': np.random.uniform(0, 100, n_rows).round(2)
-        }
-        return pd.DataFrame(data)
-
-    def _style_dataframe(self, df: pd.DataFrame, view_mode: str) -> pd.DataFrame:
-        """Apply styling based on view mode."""
-        if view_mode == 'Detailed':
-            def highlight_high_values(val, threshold):
-                if isinstance(val, (int, float)):
-                    return 'color: red' if val > threshold else 'color: black'
-                return 'color: black'
-            
-            return df.style.applymap(lambda x: highlight_high_values(x, 60), subset=['B-Factor'])\
-                         .applymap(lambda x: highlight_high_values(x, 80), subset=['SASA'])
-        return df
-
-    def render(self, config: Dict[str, Any]) -> Any:
-        if 'data' in config:
-            if config['data'].get('sample_data'):
-                df = self._generate_sample_data()
-            else:
-                df = pd.DataFrame(config['data'])
-            
-            view_mode = st.session_state.get('table_view_mode', 'Simple')
-            styled_df = self._style_dataframe(df, view_mode)
-            return st.dataframe(styled_df, use_container_width=True)
-        elif hasattr(st.session_state, 'protein_data'):
-            return st.dataframe(st.session_state.protein_data)
-        return None
-
-class Plot(UIComponent):
-    def _generate_plot_data(self, plot_type: str) -> pd.DataFrame:
-        """Generate sample data for different plot types."""
-        if plot_type == 'ramachandran':
-            n_points = 1000
-            phi = np.random.normal(-60, 30, n_points)
-            psi = np.random.normal(-45, 30, n_points)
-            return pd.DataFrame({'phi': phi, 'psi': psi})
-            
-        elif plot_type == 'secondary_structure':
-            structures = ['α-Helix', 'β-Sheet', 'Loops', '310-Helix', 'β-Turn']
-            percentages = [45, 32, 23, 5, 4]
-            return pd.DataFrame({'Structure': structures, 'Percentage': percentages})
-            
-        elif plot_type == 'bfactor_distribution':
-            residues = range(1, 201)
-            bfactors = np.random.normal(50, 15, 200)
-            bfactors = np.convolve(bfactors, np.ones(5)/5, mode='same')
-            return pd.DataFrame({'Residue': residues, 'B-factor': bfactors})
-            
-        elif plot_type == 'hydropathy':
-            residues = range(1, 201)
-            hydropathy = np.sin(np.array(residues)/10) * 2 + np.random.normal(0, 0.5, 200)
-            return pd.DataFrame({'Residue': residues, 'Hydropathy': hydropathy})
-            
-        elif plot_type == 'aa_composition':
-            aa_list = ['ALA', 'CYS', 'ASP', 'GLU', 'PHE', 'GLY', 'HIS', 'ILE', 'LYS', 'LEU']
-            counts = np.random.randint(5, 25, len(aa_list))
-            return pd.DataFrame({'Amino Acid': aa_list, 'Count': counts})
-            
-        return pd.DataFrame()
-
-    def render(self, config: Dict[str, Any]) -> Any:
-        plot_type = config['plot_type']
-        data_type = config['data']['type']
-        
-        df = self._generate_plot_data(data_type)
-        
-        if data_type == 'ramachandran':
-            fig = px.scatter(df, x='phi', y='psi', 
-                           title='Ramachandran Plot',
-                           labels={'phi': 'Phi (°)', 'psi': 'Psi (°)'})
-            fig.add_hline(y=0, line_dash="dash", line_color="gray")
-            fig.add_vline(x=0, line_dash="dash", line_color="gray")
-            
-        elif data_type == 'secondary_structure':
-            fig = px.bar(df, x='Structure', y='Percentage',
-                        title='Secondary Structure Distribution')
-            
-        elif data_type == 'bfactor_distribution':
-            fig = px.line(df, x='Residue', y='B-factor',
-                         title='B-factor Distribution')
-            
-        elif data_type == 'hydropathy':
-            fig = px.line(df, x='Residue', y='Hydropathy',
-                         title='Hydropathy Plot')
-            fig.add_hline(y=0, line_dash="dash", line_color="gray")
-            
-        elif data_type == 'aa_composition':
-            fig = px.bar(df, x='Amino Acid', y='Count',
-                        title='Amino Acid Composition')
-        else:
-            return None
-            
-        return st.plotly_chart(fig, use_container_width=True)
-
 class Dialog(UIComponent):
     def render(self, config: Dict[str, Any]) -> Any:
         """Render a dialog with content."""
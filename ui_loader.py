@@ -1,12 +1,313 @@
+import copy
+import importlib
 import json
-from typing import Any, Dict, Optional, Callable
+import os
+import threading
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Callable, Set, Tuple
 import streamlit as st
-from ui_components import (
-    UIComponent, TextInput, MultiSelect, Slider, NumberInput,
-    CheckboxGroup, Button, JsonView, Expander, Tabs,
-    FileUploader, TextArea, Select, Checkbox, Text,
-    MolstarViewer, DataTable, Plot, Dialog
-)
+from render_profiler import get_profiler
+from ui_components import OVERLAY_PLOTS, RENDERED_FRAGMENTS_KEY, render_node, UIComponent
+
+class ConfigError(ValueError):
+    """Raised when a UI configuration does not describe a valid component tree."""
+
+class FrozenDict(dict):
+    """Read-only dict used for nodes of a compiled configuration."""
+    
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("compiled UI configuration is read-only")
+    
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+# Fields each component type needs in order to render
+REQUIRED_FIELDS = {
+    'text_input': ('key',),
+    'text_area': ('key',),
+    'multiselect': ('key',),
+    'select': ('key', 'options'),
+    'slider': ('key',),
+    'number_input': ('key',),
+    'checkbox': ('key',),
+    'checkboxes': ('items',),
+    'button': ('key',),
+    'file_uploader': ('label', 'key'),
+    'text': ('content',),
+    'expander': ('label',),
+    'tabs': ('tabs',),
+    'plot': ('plot_type', 'data'),
+    'dialog': ('key',),
+    'frame_slider': ('key',),
+}
+
+def freeze(value: Any) -> Any:
+    """Recursively convert parsed JSON into FrozenDicts and tuples."""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def _child_lists(node: Dict[str, Any], path: str):
+    """Yield (path, components) for every nested component list of a node."""
+    if 'components' in node:
+        yield f"{path}.components", node['components']
+    for group in ('tabs', 'columns'):
+        for i, entry in enumerate(node.get(group) or []):
+            if not isinstance(entry, dict):
+                raise ConfigError(f"{path}.{group}[{i}]: expected an object")
+            yield f"{path}.{group}[{i}].components", entry.get('components', [])
+
+def _validate_fragment_fields(node: Dict[str, Any], path: str) -> None:
+    if node.get('fragment') and not isinstance(node.get('key'), str):
+        raise ConfigError(f"{path}: fragments require a string 'key'")
+    if 'run_every' in node and not (node.get('fragment') and isinstance(node['run_every'], (int, float))
+                                    and node['run_every'] > 0):
+        raise ConfigError(f"{path}.run_every: expected a positive interval on a fragment")
+    for field in ('depends_on', 'updates'):
+        if field in node and not (isinstance(node[field], list)
+                                  and all(isinstance(k, str) for k in node[field])):
+            raise ConfigError(f"{path}.{field}: expected a list of state keys")
+
+def _validate_node(node: Any, path: str) -> None:
+    if not isinstance(node, dict):
+        raise ConfigError(f"{path}: expected an object")
+    component_type = node.get('type')
+    if not isinstance(component_type, str):
+        raise ConfigError(f"{path}: missing component 'type'")
+    for field in REQUIRED_FIELDS.get(component_type, ()):
+        if field not in node:
+            raise ConfigError(f"{path}: '{component_type}' requires '{field}'")
+    
+    if component_type == 'select' and 'default' in node and node['default'] not in node['options']:
+        raise ConfigError(f"{path}: default {node['default']!r} is not one of the options")
+    if component_type == 'checkboxes':
+        for i, item in enumerate(node['items']):
+            if not isinstance(item, dict) or 'key' not in item:
+                raise ConfigError(f"{path}.items[{i}]: checkbox item requires 'key'")
+    if component_type == 'tabs':
+        for i, tab in enumerate(node['tabs']):
+            if not isinstance(tab, dict) or 'label' not in tab:
+                raise ConfigError(f"{path}.tabs[{i}]: tab requires 'label'")
+    if component_type == 'tabs' and node.get('lazy') not in (None, False, True, 'keep_visited'):
+        raise ConfigError(f"{path}.lazy: expected true, false or \"keep_visited\"")
+    if component_type == 'tabs' and node.get('lazy') and not isinstance(node.get('key'), str):
+        raise ConfigError(f"{path}: lazy tabs require a string 'key'")
+    if component_type == 'data_table' and 'page_size' in node and not (
+            isinstance(node['page_size'], int) and node['page_size'] > 0):
+        raise ConfigError(f"{path}.page_size: expected a positive integer")
+    if component_type == 'data_table' and node.get('data', {}).get('level') not in (None, 'residue', 'atom'):
+        raise ConfigError(f"{path}.data.level: expected \"residue\" or \"atom\"")
+    if component_type == 'data_table' and not isinstance(node.get('data', {}).get('columns_key', ''), str):
+        raise ConfigError(f"{path}.data.columns_key: expected the key of a column picker")
+    if component_type == 'plot' and 'type' not in node['data']:
+        raise ConfigError(f"{path}.data: plot data requires 'type'")
+    if component_type in ('data_table', 'plot') and node.get('data', {}).get('source') not in (None, 'batch'):
+        raise ConfigError(f"{path}.data.source: expected \"batch\"")
+    if component_type == 'plot' and node['data'].get('source') == 'batch' and node['data']['type'] not in OVERLAY_PLOTS:
+        raise ConfigError(f"{path}.data: only {', '.join(OVERLAY_PLOTS)} plots can overlay batch models")
+    if component_type == 'plot' and 'cutoff' in node['data'] and not (
+            isinstance(node['data']['cutoff'], (int, float)) and node['data']['cutoff'] > 0):
+        raise ConfigError(f"{path}.data.cutoff: expected a positive distance")
+    if component_type == 'file_uploader' and not isinstance(node.get('multiple', False), bool):
+        raise ConfigError(f"{path}.multiple: expected true or false")
+    if component_type == 'plot' and 'large_data' in node:
+        large_data = node['large_data']
+        if not isinstance(large_data, dict) or large_data.get('mode', 'webgl') not in ('webgl', 'density'):
+            raise ConfigError(f"{path}.large_data: expected an object with mode \"webgl\" or \"density\"")
+        for field in ('threshold', 'max_points', 'bins'):
+            if field in large_data and not (isinstance(large_data[field], int) and large_data[field] > 0):
+                raise ConfigError(f"{path}.large_data.{field}: expected a positive integer")
+    _validate_fragment_fields(node, path)
+    for i, tab in enumerate(node.get('tabs') or [] if component_type == 'tabs' else []):
+        _validate_fragment_fields(tab, f"{path}.tabs[{i}]")
+    
+    for child_path, children in _child_lists(node, path):
+        if not isinstance(children, list):
+            raise ConfigError(f"{child_path}: expected a list")
+        for i, child in enumerate(children):
+            _validate_node(child, f"{child_path}[{i}]")
+
+def validate_config(config: Any) -> None:
+    """Check a parsed configuration, raising ConfigError on the first problem."""
+    if not isinstance(config, dict) or not isinstance(config.get('layout'), dict):
+        raise ConfigError("configuration requires a 'layout' object")
+    for section in ('sidebar', 'main'):
+        components = config['layout'].get(section, {}).get('components', [])
+        if not isinstance(components, list):
+            raise ConfigError(f"layout.{section}.components: expected a list")
+        for i, node in enumerate(components):
+            _validate_node(node, f"layout.{section}.components[{i}]")
+
+def _walk(nodes: List[Dict[str, Any]], fragment: Optional[str] = None
+          ) -> Iterator[Tuple[Dict[str, Any], Optional[str]]]:
+    """Yield every node, tab entry and checkbox item with its enclosing fragment key."""
+    for node in nodes:
+        node_fragment = node['key'] if node.get('fragment') else fragment
+        yield node, node_fragment
+        for item in node.get('items') or [] if node['type'] == 'checkboxes' else []:
+            yield item, node_fragment
+        for tab in node.get('tabs') or [] if node['type'] == 'tabs' else []:
+            tab_fragment = tab['key'] if tab.get('fragment') else node_fragment
+            yield tab, tab_fragment
+            yield from _walk(tab.get('components', []), tab_fragment)
+        for column in node.get('columns') or []:
+            yield from _walk(column.get('components', []), node_fragment)
+        yield from _walk(node.get('components', []), node_fragment)
+
+def _link_fragments(config: Dict[str, Any]) -> None:
+    """Annotate widgets with the fragments to rerun when they change.
+    
+    Fragment nodes (``"fragment": true``) list the state keys they read in
+    ``depends_on``; action buttons list the keys their action writes in
+    ``updates``. A widget or button touching a declared key gets a
+    ``_rerun_fragments`` entry naming the dependent fragments plus its own
+    enclosing fragment, and reruns just those instead of the whole app.
+    """
+    nodes = [(node, fragment)
+             for section in ('sidebar', 'main')
+             for node, fragment in _walk(config['layout'].get(section, {}).get('components', []))]
+    
+    fragment_keys: Set[str] = set()
+    dependents: Dict[str, Set[str]] = {}
+    for node, fragment in nodes:
+        if node.get('fragment'):
+            if node['key'] in fragment_keys:
+                raise ConfigError(f"duplicate fragment key {node['key']!r}")
+            fragment_keys.add(node['key'])
+            for state_key in node.get('depends_on', []):
+                dependents.setdefault(state_key, set()).add(node['key'])
+    
+    for node, fragment in nodes:
+        if node.get('fragment') or 'key' not in node:
+            continue
+        written = node.get('updates', []) if node.get('type') == 'button' else [node['key']]
+        targets = set().union(*(dependents.get(k, set()) for k in written))
+        if targets:
+            if fragment is not None:
+                targets.add(fragment)
+            node['_rerun_fragments'] = sorted(targets)
+
+def compile_config(config: Dict[str, Any]) -> FrozenDict:
+    """Validate a parsed configuration and turn it into an immutable tree."""
+    validate_config(config)
+    config = copy.deepcopy(config)
+    _link_fragments(config)
+    return freeze(config)
+
+# Compiled configurations shared by all reruns and sessions, keyed by path
+_compiled_configs: Dict[str, Tuple[int, FrozenDict]] = {}
+_compiled_lock = threading.Lock()
+
+def load_config(config_path: str) -> FrozenDict:
+    """Return the compiled configuration, recompiling only when the file changes."""
+    path = os.path.abspath(config_path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _compiled_configs.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    
+    with _compiled_lock:
+        cached = _compiled_configs.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'r') as f:
+            try:
+                config = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ConfigError(f"{config_path}: {e}") from e
+        compiled = compile_config(config)
+        _compiled_configs[path] = (mtime, compiled)
+        return compiled
+
+# Component types and the classes rendering them, as "module:Class". A
+# module is imported the first time a configuration renders one of its
+# types, so plotly, Mol* and pandas only load for configs that use them.
+COMPONENT_TYPES = {
+    'text_input': 'ui_components:TextInput',
+    'multiselect': 'ui_components:MultiSelect',
+    'slider': 'ui_components:Slider',
+    'number_input': 'ui_components:NumberInput',
+    'checkboxes': 'ui_components:CheckboxGroup',
+    'button': 'ui_components:Button',
+    'json_view': 'ui_components:JsonView',
+    'file_uploader': 'ui_components:FileUploader',
+    'text_area': 'ui_components:TextArea',
+    'select': 'ui_components:Select',
+    'checkbox': 'ui_components:Checkbox',
+    'text': 'ui_components:Text',
+    'dialog': 'ui_components:Dialog',
+    'progress': 'ui_components:Progress',
+    'frame_slider': 'ui_components:FrameSlider',
+    'expander': 'ui_components:Expander',
+    'tabs': 'ui_components:Tabs',
+    'molstar_viewer': 'viewer_components:MolstarViewer',
+    'data_table': 'table_components:DataTable',
+    'plot': 'plot_components:Plot',
+}
+
+# Components that render nested components get the registry
+CONTAINER_TYPES = ('expander', 'tabs')
+
+class ComponentRegistry(Mapping):
+    """Component renderers by type, each created on its first lookup.
+    
+    Membership tests only consult the type table, so walking a
+    configuration never imports a component's module.
+    """
+    
+    def __init__(self, component_types: Dict[str, str]):
+        self.component_types = dict(component_types)
+        self._components: Dict[str, UIComponent] = {}
+        self._lock = threading.Lock()
+    
+    def __getitem__(self, component_type: str) -> UIComponent:
+        component = self._components.get(component_type)
+        if component is not None:
+            return component
+        spec = self.component_types[component_type]
+        with self._lock:
+            component = self._components.get(component_type)
+            if component is None:
+                module_name, class_name = spec.split(':')
+                component_class = getattr(importlib.import_module(module_name), class_name)
+                if component_type in CONTAINER_TYPES:
+                    component = component_class(self)
+                else:
+                    component = component_class()
+                self._components[component_type] = component
+        return component
+    
+    def preload(self, component_types: Iterable[str]) -> None:
+        """Create the renderers of the given (known) types now."""
+        for component_type in component_types:
+            if component_type in self:
+                self[component_type]
+    
+    def __contains__(self, component_type: object) -> bool:
+        return component_type in self.component_types
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.component_types)
+    
+    def __len__(self) -> int:
+        return len(self.component_types)
+
+_component_registry: Optional[ComponentRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_component_registry() -> ComponentRegistry:
+    """Return the shared registry of (stateless) component renderers."""
+    global _component_registry
+    if _component_registry is None:
+        with _registry_lock:
+            if _component_registry is None:
+                _component_registry = ComponentRegistry(COMPONENT_TYPES)
+    return _component_registry
 
 class UILoader:
     """UI Loader that uses a component registry to render UI elements."""
@@ -14,35 +315,9 @@ class UILoader:
     def __init__(self, config_path: str):
         """Initialize UI Loader with configuration path."""
         
-        # Initialize component registry first
-        self.component_registry = {
-            'text_input': TextInput(),
-            'multiselect': MultiSelect(),
-            'slider': Slider(),
-            'number_input': NumberInput(),
-            'checkboxes': CheckboxGroup(),
-            'button': Button(),
-            'json_view': JsonView(),
-            'file_uploader': FileUploader(),
-            'text_area': TextArea(),
-            'select': Select(),
-            'checkbox': Checkbox(),
-            'text': Text(),
-            'molstar_viewer': MolstarViewer(),
-            'data_table': DataTable(),
-            'plot': Plot(),
-            'dialog': Dialog(),
-        }
-        
-        # Add components that need registry access
-        self.component_registry.update({
-            'expander': Expander(self.component_registry),
-            'tabs': Tabs(self.component_registry),
-        })
-        
-        # Load configuration
-        with open(config_path, 'r') as f:
-            self.config = json.load(f)
+        # Registry and compiled config are shared across reruns and sessions
+        self.component_registry = get_component_registry()
+        self.config = load_config(config_path)
     
     def register_action(self, action_name: str, handler: Callable) -> None:
         """Register an action handler for buttons."""
@@ -51,6 +326,27 @@ class UILoader:
     
     def render(self) -> None:
         """Render the UI based on configuration."""
+        # Fragments register themselves again on every full run
+        st.session_state[RENDERED_FRAGMENTS_KEY] = set()
+        
+        profiler = get_profiler()
+        if profiler is not None:
+            # Module imports run under tracemalloc when measured; do them up
+            # front rather than bill them to the first component of a type
+            self.component_registry.preload(
+                node['type'] for section in ('sidebar', 'main')
+                for node, _ in _walk(self.config['layout'].get(section, {}).get('components', []))
+                if 'type' in node)
+            profiler.start_run()
+        try:
+            self._render_layout()
+        finally:
+            if profiler is not None:
+                profiler.end_run()
+        if profiler is not None:
+            profiler.render_overlay()
+    
+    def _render_layout(self) -> None:
         # Only render title if it exists in config
         if self.config.get('title'):
             st.title(self.config['title'])
@@ -72,7 +368,7 @@ class UILoader:
         component = self.component_registry.get(component_type)
         
         if component:
-            return component.render(component_config)
+            return render_node(self.component_registry, component_config)
         else:
             st.warning(f"Unknown component type: {component_type}")
             return None
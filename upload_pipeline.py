@@ -0,0 +1,215 @@
+"""Background processing of uploaded structure files.
+
+The rerun that receives an upload only starts an :class:`UploadJob`: the
+file is hashed, spooled to disk, parsed and encoded for the viewer in a
+worker thread. Each stage publishes what it found as soon as it is known
+(the header records, the chains read so far, the parsed structure), so
+the page can show them while the rest of the file is still being read.
+"""
+import mmap
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+from analysis_executor import INLINE_MAX_ATOMS
+from atomic_write import temp_path
+from binary_cif import encode_structure
+from pdb_parser import content_hash, parse_buffer
+from shared_structures import StructureLease, get_store
+from structure import Structure
+from structure_archive import get_archive
+from structure_cache import get_cache
+from trajectory import get_trajectory_store, has_multiple_models
+
+SPOOL_DIR_ENV = 'UPLOAD_SPOOL_DIR'
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'upload_spool')
+
+# Uploads finishing within this many seconds are attached in the same
+# rerun, so small files never show the placeholders
+INLINE_WAIT = 0.25
+
+# Leading bytes searched for header records
+HEADER_BYTES = 64 << 10
+
+# Share of the progress bar per stage; parsing advances with the bytes read
+STAGES = ('Hashing', 'Spooling', 'Parsing', 'Publishing', 'Encoding')
+STAGE_WEIGHTS = (0.05, 0.05, 0.6, 0.1, 0.2)
+
+PDB_HEADER = re.compile(rb'^HEADER {4}(.{0,40})(?:.{9} {3}(.{4}))?', re.MULTILINE)
+PDB_CONTINUED = {'title': rb'TITLE', 'method': rb'EXPDTA'}
+CIF_ID = re.compile(rb'^data_(\S+)', re.MULTILINE)
+CIF_ITEMS = {'title': rb'_struct\.title', 'classification': rb'_struct_keywords\.pdbx_keywords',
+             'method': rb'_exptl\.method'}
+
+def read_header(head: bytes) -> Dict[str, str]:
+    """Identifier, title, classification and method from the start of a PDB or mmCIF file.
+
+    Records that are missing (or multi-line mmCIF values) are left out.
+    """
+    header: Dict[str, str] = {}
+    match = CIF_ID.search(head)
+    if match is not None:
+        header['id'] = match.group(1).decode(errors='replace')
+        for field, item in CIF_ITEMS.items():
+            value = re.search(rb'^' + item + rb'''\s+(?:'([^']*)'|"([^"]*)"|([^\s;]\S*))''',
+                              head, re.MULTILINE)
+            if value is not None:
+                header[field] = next(g for g in value.groups() if g is not None).decode(errors='replace')
+        return header
+    match = PDB_HEADER.search(head)
+    if match is not None:
+        header['classification'] = match.group(1).strip().decode(errors='replace')
+        if match.group(2):
+            header['id'] = match.group(2).strip().decode(errors='replace')
+    for field, record in PDB_CONTINUED.items():
+        # Continuation lines repeat the record name with a serial number
+        lines = re.findall(rb'^' + record + rb' +(?:\d+ )?(.*)$', head, re.MULTILINE)
+        if lines:
+            header[field] = b' '.join(line.strip() for line in lines).decode(errors='replace')
+    return {field: value for field, value in header.items() if value}
+
+def load_structure(digest: str, parse: Callable[[], Structure]) -> Structure:
+    """The structure with this content: cached, archived, or parsed now.
+
+    Parsed data is shared by every session that loads the same content,
+    and content seen before is loaded from the binary archive instead of
+    being parsed again. Structures large enough to be analyzed in worker
+    processes are cached as a lease on their copy in the shared store.
+    """
+    def load():
+        structure = get_archive().load_or_parse(digest, parse)
+        if structure.n_atoms <= INLINE_MAX_ATOMS:
+            return structure
+        return get_store().publish(structure)
+    cached = get_cache().get_or_compute(digest, 'structure', load)
+    return cached.structure if isinstance(cached, StructureLease) else cached
+
+class UploadJob:
+    """Hashes, spools and parses one upload in a background thread.
+
+    Compatible with the progress component. ``header`` and ``chains`` fill
+    in while the job runs; ``structure`` is set once the coordinates are
+    parsed, and the job is done once the viewer's BinaryCIF is cached.
+    """
+
+    def __init__(self, upload: Any, spool_dir: Optional[str] = None):
+        self.key = upload.file_id
+        self.name = upload.name
+        self.size = upload.getbuffer().nbytes
+        self.spool_dir = spool_dir or os.environ.get(SPOOL_DIR_ENV) or DEFAULT_DIR
+        self.digest: Optional[str] = None
+        self.header: Dict[str, str] = {}
+        self.chains: Dict[str, int] = {}
+        self.multiple_models = False
+        self.structure: Optional[Structure] = None
+        self.error: Optional[BaseException] = None
+        self.stage = 0
+        self._bytes_parsed = 0
+        self._upload = upload
+        self._finished = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def progress(self) -> float:
+        if self.done:
+            return 1.0
+        progress = sum(STAGE_WEIGHTS[:self.stage])
+        if STAGES[self.stage] == 'Parsing' and self.size:
+            progress += STAGE_WEIGHTS[self.stage] * min(self._bytes_parsed / self.size, 1.0)
+        return progress
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return f'Could not read {self.name}: {self.error}'
+        if self.done:
+            return f'Loaded {self.name}: {self.structure.n_atoms:,} atoms'
+        if self.structure is not None:
+            return f'Preparing the 3D view of {self.name} ({self.structure.n_atoms:,} atoms)'
+        return f'{STAGES[self.stage]} {self.name} ({self.size / 1e6:,.1f} MB)'
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def start(self) -> 'UploadJob':
+        threading.Thread(target=self._run, name='upload', daemon=True).start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            # The uploaded bytes themselves, not a copy
+            data = self._upload.getvalue()
+            self.digest = content_hash(data)
+            self.header = read_header(data[:HEADER_BYTES])
+            self.multiple_models = has_multiple_models(data)
+            del data
+            structure = load_structure(self.digest, self._parse)
+            if self.multiple_models and not get_trajectory_store().has_frames(self.digest):
+                # Parsed before, but the frames are no longer stored
+                self._keep_frames(self._spool())
+            if not self.chains:
+                # Loaded from the cache or archive rather than parsed
+                self.chains = structure.chain_id.counts().to_dict()
+            self.structure = structure
+            self.stage = STAGES.index('Encoding')
+            get_cache().get_or_compute(self.digest, 'bcif', lambda: encode_structure(structure))
+        except Exception as e:
+            self.error = e
+        finally:
+            self._upload = None
+            self._finished.set()
+
+    def _parse(self) -> Structure:
+        """Spool the upload to disk and parse it through a memory map."""
+        if not self.size:
+            return parse_buffer(b'', name=self.name, digest=self.digest)
+        self.stage = STAGES.index('Spooling')
+        path = self._spool()
+        self.stage = STAGES.index('Parsing')
+        try:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                structure = parse_buffer(mm, name=self.name, digest=self.digest,
+                                         on_chunk=lambda columns: self._chunk_parsed(mm, columns))
+        except BaseException:
+            os.remove(path)
+            raise
+        self._keep_frames(path)
+        self.stage = STAGES.index('Publishing')
+        return structure
+
+    def _spool(self) -> str:
+        """Write the upload to the spool directory, returning the file's path."""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f'{self.digest}{os.path.splitext(self.name)[1]}')
+        tmp_path = temp_path(path)
+        with open(tmp_path, 'wb') as f:
+            f.write(self._upload.getbuffer())
+        os.replace(tmp_path, path)
+        return path
+
+    def _keep_frames(self, path: str) -> None:
+        """Hand a multi-model spool to the trajectory store; others are removed."""
+        if self.multiple_models:
+            # Frames are read from it until the binary copy is written
+            get_trajectory_store().adopt(self.digest, path)
+        else:
+            # The archive keeps the parsed columns
+            os.remove(path)
+
+    def _chunk_parsed(self, mm: mmap.mmap, columns: Dict[str, np.ndarray]) -> None:
+        self._bytes_parsed = mm.tell()
+        names, counts = np.unique(columns['chain_id'], return_counts=True)
+        chains = dict(self.chains)
+        for name, count in zip(names.astype(str), counts.tolist()):
+            chains[name] = chains.get(name, 0) + count
+        self.chains = chains
+
+def start_upload(upload: Any) -> UploadJob:
+    """Start processing an upload, waiting briefly so small files finish inline."""
+    job = UploadJob(upload).start()
+    job.wait(INLINE_WAIT)
+    return job
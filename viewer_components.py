@@ -0,0 +1,65 @@
+"""Mol* structure viewer component, imported on first use of a viewer."""
+import os
+from typing import Any, Dict
+import streamlit as st
+from streamlit_molstar import st_molstar_content
+from binary_cif import encode_structure
+from structure_cache import get_cache
+from structure_repository import EntryPending, RepositoryError, get_repository
+from ui_components import UPLOAD_POLL_INTERVAL, UIComponent, render_fragment
+
+class MolstarViewer(UIComponent):
+    def render(self, config: Dict[str, Any]) -> Any:
+        if 'sample_data' in config:
+            sample = config['sample_data']
+            if sample['type'] == 'rcsb':
+                # Served from the local repository, not fetched by each browser
+                try:
+                    content, file_format = get_repository().load(sample['pdb_id'])
+                except EntryPending as e:
+                    return self._download_placeholder(config, e)
+                except RepositoryError as e:
+                    st.warning(str(e))
+                    return None
+                extension = 'cif' if file_format == 'mmcif' else 'pdb'
+                return st_molstar_content(content, file_format,
+                                          file_name=f"{sample['pdb_id']}.{extension}",
+                                          height=config.get('height', 400))
+        elif st.session_state.get('structure') is not None and 'upload_job' not in st.session_state:
+            # The parsed upload is sent as BinaryCIF, encoded once per content
+            # (and per frame of a trajectory, read from disk on demand)
+            structure = st.session_state.structure
+            trajectory = st.session_state.get('trajectory')
+            frame = st.session_state.get(config.get('frame_key'), 0) if trajectory is not None else 0
+            if frame:
+                payload = get_cache().get_or_compute(
+                    structure.content_hash, ('bcif', frame),
+                    lambda: encode_structure(trajectory.structure(frame)))
+            else:
+                payload = get_cache().get_or_compute(structure.content_hash, 'bcif',
+                                                     lambda: encode_structure(structure))
+            file_name = f"{os.path.splitext(structure.name or 'structure')[0]}.bcif"
+            return st_molstar_content(payload, 'mmcif', file_name=file_name,
+                                      height=config.get('height', 400))
+        elif 'upload_job' in st.session_state:
+            # Encoded in the background once the coordinates are parsed
+            return self._upload_placeholder(config, self._render_upload_header, lambda job: job.done)
+        return None
+
+    def _download_placeholder(self, config: Dict[str, Any], pending: EntryPending) -> Any:
+        """Polls the entry's download, rerunning the app once it is over."""
+        def poll() -> Any:
+            if pending.download.done():
+                st.rerun()
+            return st.info(str(pending))
+        return render_fragment(f"{config['key']}_download", poll, run_every=UPLOAD_POLL_INTERVAL)
+
+    def _render_upload_header(self, job: Any) -> Any:
+        """Header records of the upload, available before its coordinates."""
+        header = job.header
+        lines = [f"**{header.get('id', job.name)}** {header.get('title', '')}".rstrip()]
+        details = [header[field] for field in ('classification', 'method') if field in header]
+        if details:
+            lines.append(' · '.join(details))
+        lines.append(job.status)
+        return st.info('  \n'.join(lines))